@@ -0,0 +1,202 @@
+"""
+Admission control and load shedding for expensive endpoints.
+
+Rules are keyed by Flask endpoint name, optionally narrowed to requests that
+carry a query parameter ("categories?search" only matches searches):
+
+    ADMISSION_RULES = {
+        'categories?search': {'rate': 2, 'burst': 6},
+        'admin_dashboard': {'concurrency': 1},
+    }
+
+* concurrency - requests for the rule in flight across *all* workers; extra
+  requests are answered 503 immediately instead of queueing.
+* rate / burst - per-client token bucket (tokens per second, bucket size);
+  exhausted clients get 429.
+
+Both are shared between gunicorn workers through files in
+ADMISSION_STATE_DIR: concurrency slots are flock()ed files (the kernel frees a
+slot if its worker dies) and token buckets live in an mmap'd table guarded by
+byte-range locks.
+"""
+
+import fcntl
+import hashlib
+import json
+import math
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+
+from flask import g, jsonify, make_response, request, session
+
+
+def stable_hash(key):
+    """64-bit hash that is identical in every worker process"""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little')
+
+
+# ==================== SHARED STATE ====================
+class ConcurrencyLimiter:
+    """Cross-process semaphore made of `limit` lock files"""
+
+    def __init__(self, directory, name, limit):
+        self.paths = [os.path.join(directory, '{}.slot{}'.format(name, i)) for i in range(limit)]
+        self._pid = None
+        self._slots = []
+
+    def _open(self):
+        # Open after fork so each worker has its own open file descriptions
+        if self._pid != os.getpid():
+            self._slots = [(os.open(path, os.O_RDWR | os.O_CREAT, 0o600), threading.Lock())
+                           for path in self.paths]
+            self._pid = os.getpid()
+        return self._slots
+
+    def acquire(self):
+        """Index of a free slot, or None when the limit is reached"""
+        slots = self._open()
+        start = random.randrange(len(slots))
+        for offset in range(len(slots)):
+            index = (start + offset) % len(slots)
+            fd, local = slots[index]
+            if not local.acquire(blocking=False):
+                continue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return index
+            except BlockingIOError:
+                local.release()
+        return None
+
+    def release(self, index):
+        fd, local = self._slots[index]
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        local.release()
+
+
+class TokenBuckets:
+    """Fixed-size shared table of token buckets keyed by a stable hash"""
+
+    SLOT = struct.Struct('=Qdd')  # key hash, tokens, last update (epoch seconds)
+
+    def __init__(self, path, slots=4096):
+        self.path = path
+        self.slots = slots
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        if self._pid != os.getpid():
+            size = self.SLOT.size * self.slots
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+            self._map = mmap.mmap(self._fd, size)
+            self._pid = os.getpid()
+
+    def take(self, key, rate, burst):
+        """Spend one token; returns (allowed, seconds until a token is available)"""
+        self._open()
+        key_hash = stable_hash(key)
+        offset = (key_hash % self.slots) * self.SLOT.size
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, self.SLOT.size, offset)
+            try:
+                stored, tokens, updated = self.SLOT.unpack_from(self._map, offset)
+                now = time.time()
+                if stored != key_hash:
+                    # Empty slot, or a colliding client evicted: start with a full bucket
+                    tokens, updated = float(burst), now
+                tokens = min(float(burst), tokens + max(now - updated, 0.0) * rate)
+                allowed = tokens >= 1.0
+                if allowed:
+                    tokens -= 1.0
+                self.SLOT.pack_into(self._map, offset, key_hash, tokens, now)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, self.SLOT.size, offset)
+        return allowed, 0.0 if allowed else (1.0 - tokens) / rate
+
+
+# ==================== RULES ====================
+class Rule:
+    def __init__(self, key, directory, concurrency=None, rate=None, burst=None):
+        self.key = key
+        self.endpoint, _, self.param = key.partition('?')
+        slug = key.replace('?', '.')
+        self.limiter = ConcurrencyLimiter(directory, slug, concurrency) if concurrency else None
+        self.rate = float(rate) if rate else None
+        self.burst = float(burst or max(1.0, self.rate or 1.0))
+        self.buckets = TokenBuckets(os.path.join(directory, slug + '.buckets')) if rate else None
+
+    def matches(self, endpoint, args):
+        return endpoint == self.endpoint and (not self.param or bool(args.get(self.param)))
+
+
+def load_rules(config):
+    rules = config.get('ADMISSION_RULES') or {}
+    if isinstance(rules, str):
+        rules = json.loads(rules)
+    directory = config['ADMISSION_STATE_DIR']
+    os.makedirs(directory, exist_ok=True)
+    # Parameterised rules ("categories?search") take precedence over plain ones
+    ordered = sorted(rules.items(), key=lambda item: '?' not in item[0])
+    return [Rule(key, directory, **options) for key, options in ordered]
+
+
+def client_key(trust_forwarded):
+    """Logged-in user id from the session cookie (no DB lookup), else client address"""
+    user_id = session.get('_user_id')
+    if user_id:
+        return 'user:' + user_id
+    if trust_forwarded and request.access_route:
+        return 'ip:' + request.access_route[0]
+    return 'ip:' + (request.remote_addr or '')
+
+
+def rejection(status, message, retry_after):
+    wants_json = (request.is_json or request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+                  or request.accept_mimetypes.best == 'application/json')
+    if wants_json:
+        response = make_response(jsonify({'success': False, 'message': message}), status)
+    else:
+        response = make_response(message, status)
+        response.mimetype = 'text/plain'
+    response.headers['Retry-After'] = str(max(1, int(math.ceil(retry_after))))
+    return response
+
+
+def init_app(app):
+    """Shed load on configured endpoints before any database work happens"""
+    rules = load_rules(app.config)
+    if not rules:
+        return
+    trust_forwarded = app.config.get('ADMISSION_TRUST_FORWARDED', False)
+    busy_retry_after = app.config.get('ADMISSION_BUSY_RETRY_AFTER', 1)
+
+    @app.before_request
+    def admit_request():
+        rule = next((r for r in rules if r.matches(request.endpoint, request.args)), None)
+        if rule is None:
+            return None
+        if rule.buckets is not None:
+            allowed, wait = rule.buckets.take('{}|{}'.format(rule.key, client_key(trust_forwarded)),
+                                              rule.rate, rule.burst)
+            if not allowed:
+                return rejection(429, 'Too many requests, please slow down.', wait)
+        if rule.limiter is not None:
+            slot = rule.limiter.acquire()
+            if slot is None:
+                return rejection(503, 'This page is busy right now, please retry shortly.', busy_retry_after)
+            g.admission_slot = (rule.limiter, slot)
+        return None
+
+    @app.teardown_request
+    def release_admission_slot(exc):
+        held = g.pop('admission_slot', None)
+        if held is not None:
+            limiter, slot = held
+            limiter.release(slot)
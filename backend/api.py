@@ -1,11 +1,175 @@
-from flask import Blueprint, jsonify
-from flask_login import login_required, current_user
-from backend.app import mongo
+import base64
+import binascii
+import json
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from flask import Blueprint, Response, jsonify, request, url_for
+from backend.app import mongo, build_product_query, current_cart_count
+from backend.search import suggest_index
 
 api = Blueprint('api', __name__)
 
+PRODUCT_FIELDS = ('id', 'name', 'description', 'price', 'stock', 'category_id',
+                  'category_name', 'image', 'image_url', 'created_at')
+DEFAULT_PRODUCT_FIELDS = ('id', 'name', 'price', 'stock', 'category_id', 'image', 'image_url')
+DEFAULT_LIMIT = 12
+MAX_LIMIT = 100
+MAX_SEARCH_LENGTH = 200
+
+
 @api.route('/api/cart/count')
-@login_required
 def cart_count():
-    count = sum(item.get('quantity', 1) for item in mongo.db.cart.find({'user_id': str(current_user.id)}))
-    return jsonify({'count': count})
+    return jsonify({'count': current_cart_count()})
+
+
+# ==================== CATALOG API HELPERS ====================
+def api_error(message, status=400):
+    return jsonify({'error': message}), status
+
+
+def compact_json(payload, max_age=30):
+    """Compact JSON response with a strong ETag, answering If-None-Match with 304"""
+    body = json.dumps(payload, separators=(',', ':'), ensure_ascii=False)
+    response = Response(body, mimetype='application/json')
+    response.add_etag()
+    response.headers['Cache-Control'] = 'public, max-age={}'.format(max_age)
+    return response.make_conditional(request)
+
+
+def parse_fields(raw):
+    """Requested sparse fieldset, or None if it names an unknown field"""
+    if not raw:
+        return DEFAULT_PRODUCT_FIELDS
+    fields = tuple(dict.fromkeys(f.strip() for f in raw.split(',') if f.strip()))
+    if not fields or any(f not in PRODUCT_FIELDS for f in fields):
+        return None
+    return fields
+
+
+def mongo_projection(fields):
+    projection = {f: 1 for f in fields if f not in ('id', 'category_name')}
+    if 'category_name' in fields:
+        projection['category_id'] = 1
+    # price is needed to build the cursor for price sorts
+    projection['price'] = 1
+    return projection
+
+
+def encode_cursor(doc, sort_by):
+    key = {'id': str(doc['_id'])}
+    if sort_by in ('low_to_high', 'high_to_low'):
+        key['p'] = doc.get('price')
+    raw = json.dumps(key, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(price, ObjectId) of a cursor; ValueError/TypeError/KeyError/InvalidId if malformed"""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    if not isinstance(key, dict):
+        raise ValueError('cursor is not an object')
+    price = key.get('p')
+    if price is not None and (isinstance(price, bool) or not isinstance(price, (int, float))):
+        raise ValueError('cursor price is not a number')
+    return price, ObjectId(key['id'])
+
+
+def keyset_filter(cursor, sort_by):
+    """Filter selecting documents strictly after the cursor in the listing order"""
+    price, last_id = decode_cursor(cursor)
+    if sort_by == 'high_to_low':
+        return {'$or': [{'price': {'$lt': price}}, {'price': price, '_id': {'$lt': last_id}}]}
+    if sort_by == 'low_to_high':
+        return {'$or': [{'price': {'$gt': price}}, {'price': price, '_id': {'$gt': last_id}}]}
+    return {'_id': {'$gt': last_id}}
+
+
+def serialize_product(doc, fields, category_map):
+    out = {}
+    for field in fields:
+        if field == 'id':
+            out['id'] = str(doc['_id'])
+        elif field == 'category_id':
+            out['category_id'] = str(doc['category_id']) if doc.get('category_id') else None
+        elif field == 'category_name':
+            out['category_name'] = category_map.get(str(doc.get('category_id')), '')
+        elif field == 'created_at':
+            created = doc.get('created_at')
+            out['created_at'] = created.isoformat() if created else None
+        else:
+            out[field] = doc.get(field)
+    return out
+
+
+# ==================== CATALOG API ====================
+@api.route('/api/products')
+def products():
+    """Read-only product listing with the same filters as /categories"""
+    fields = parse_fields(request.args.get('fields'))
+    if fields is None:
+        return api_error('Unknown field in fields=; allowed: {}'.format(','.join(PRODUCT_FIELDS)))
+    sort_by = request.args.get('sort', '')
+    limit = min(max(request.args.get('limit', DEFAULT_LIMIT, type=int), 1), MAX_LIMIT)
+    search_query = request.args.get('search', '').strip()
+    if len(search_query) > MAX_SEARCH_LENGTH or '\x00' in search_query:
+        return api_error('Invalid search')
+    query, sort = build_product_query(request.args.get('category'),
+                                      search_query,
+                                      request.args.get('price_min', type=float),
+                                      request.args.get('price_max', type=float),
+                                      sort_by)
+    # Keyset order always ends in _id so pages never overlap or skip
+    if sort:
+        sort = sort + [('_id', sort[0][1])]
+    else:
+        sort = [('_id', 1)]
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            query = {'$and': [query, keyset_filter(cursor, sort_by)]}
+        except (ValueError, TypeError, KeyError, InvalidId, binascii.Error):
+            return api_error('Invalid cursor')
+
+    docs = list(mongo.db.products.find(query, mongo_projection(fields), sort=sort, limit=limit + 1))
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    category_map = {}
+    if 'category_name' in fields:
+        category_map = {str(c['_id']): c['name'] for c in mongo.db.categories.find({}, {'name': 1})}
+    return compact_json({
+        'items': [serialize_product(doc, fields, category_map) for doc in docs],
+        'next_cursor': encode_cursor(docs[-1], sort_by) if has_more and docs else None,
+    })
+
+
+@api.route('/api/categories')
+def categories():
+    """Read-only category list; ?counts=1 adds product counts in one aggregation"""
+    cats = list(mongo.db.categories.find({}, {'name': 1, 'description': 1}).sort('name', 1))
+    items = [{'id': str(c['_id']), 'name': c.get('name'), 'description': c.get('description')}
+             for c in cats]
+    if request.args.get('counts') in ('1', 'true'):
+        counts = {str(row['_id']): row['count'] for row in mongo.db.products.aggregate([
+            {'$group': {'_id': '$category_id', 'count': {'$sum': 1}}}
+        ])}
+        for item in items:
+            item['product_count'] = counts.get(item['id'], 0)
+    return compact_json({'items': items}, max_age=300)
+
+
+@api.route('/api/search/suggest')
+def search_suggest():
+    """Search-as-you-type suggestions from the in-memory prefix index"""
+    q = request.args.get('q', '').strip()[:64]
+    limit = min(max(request.args.get('limit', 8, type=int), 1), 20)
+    suggestions = []
+    for kind, item_id, label in suggest_index.suggest(q, limit):
+        if kind == 'category':
+            url = url_for('categories', category=item_id)
+        else:
+            url = url_for('product_detail', product_id=item_id)
+        suggestions.append({'type': kind, 'id': item_id, 'label': label, 'url': url})
+    return compact_json({'q': q, 'suggestions': suggestions}, max_age=60)
@@ -1,11 +1,18 @@
 # ==================== USER ORDERS ====================
 import os
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, abort
+import re
+from flask import (Flask, render_template, request, redirect, url_for, flash, jsonify, abort, g, session,
+                   Response, stream_with_context)
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user, UserMixin
 
 from functools import wraps
 from flask_pymongo import PyMongo
 from backend.config import Config
+from backend import (admission, archive, cache, catalog_engine, compression, fanout, instrumentation, live,
+                     metrics, models, prerender, profiling, recommendations, reports, resilience, rollups, search,
+                     static_files, templating, uploads)
+from backend.catalog_engine import catalog
+from backend.cache import memoize
 from backend.forms import RegistrationForm, LoginForm, CheckoutForm, ProductForm
 
 
@@ -20,21 +27,49 @@ app = Flask(
     static_url_path='/static'
 )
 app.config.from_object(Config)
+templating.init_app(app)
 
 # User Orders Route (moved here to ensure 'app' is defined)
 @app.route('/orders')
 @login_required
 def orders():
     """Display user's orders (MongoDB)"""
-    from bson import ObjectId
-    user_orders = list(mongo.db.orders.find({'user_id': str(current_user.id)}))
-    # Attach product details to each order (if needed)
-    for order in user_orders:
-        order['id'] = str(order['_id'])
+    user_orders = models.orders.for_user(str(current_user.id))
+    # Attach product details to every order line in one query
+    models.attach_order_products(user_orders)
     return render_template('orders.html', orders=user_orders)
 
 # Initialize MongoDB
-mongo = PyMongo(app, uri=app.config['MONGODB_URI'])
+# Short connect/selection timeouts so an unreachable cluster fails fast; per-request
+# and per-query budgets come from backend/resilience.py and backend/models.py
+mongo = PyMongo(app, uri=app.config['MONGODB_URI'],
+                event_listeners=[instrumentation.command_listener],
+                serverSelectionTimeoutMS=app.config['MONGO_SERVER_SELECTION_TIMEOUT_MS'],
+                connectTimeoutMS=app.config['MONGO_CONNECT_TIMEOUT_MS'])
+models.init_app(app, mongo)
+catalog_engine.init_app(app, mongo)
+# Outermost hooks: metrics, so shed and early-503 requests are counted too; then
+# admission, so rejected requests cost no database work
+metrics.init_app(app)
+admission.init_app(app)
+# Next: no hook may wait on the database before the breaker has been consulted
+resilience.init_app(app, mongo)
+# Then: the profile covers the other hooks, and its own writes stay out of Server-Timing
+profiling.init_app(app, mongo)
+instrumentation.init_app(app)
+fanout.init_app(app)
+compression.init_app(app)
+# Outermost, so static requests skip compression and the Flask request cycle
+static_files.init_app(app)
+recommendations.init_app(app, mongo)
+rollups.init_app(app, mongo)
+archive.init_app(app, mongo)
+reports.init_app(app, mongo)
+cache.init_app(app, mongo)
+search.init_app(app, mongo)
+uploads.init_app(app)
+prerender.init_app(app, mongo)
+live.init_app(app, mongo)
 
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -56,10 +91,18 @@ class MongoUser(UserMixin):
 
 @login_manager.user_loader
 def load_user(user_id):
-    from bson import ObjectId
-    user_doc = mongo.db.users.find_one({'_id': ObjectId(user_id)})
-    if user_doc:
-        return MongoUser(user_doc)
+    # While the database is unavailable, signed-in users stay signed in from the last good copy
+    if not resilience.degraded():
+        try:
+            user = models.users.load(user_id)
+        except resilience.UNAVAILABLE_ERRORS:
+            resilience.record_unavailable()
+        else:
+            resilience.last_good_users.put(user_id, user)
+            return MongoUser(user) if user else None
+    user = resilience.last_good_users.get(user_id)
+    if user:
+        return MongoUser(user)
     return None
 
 
@@ -81,7 +124,7 @@ def admin_required(f):
 # ==================== DATA SEED (SAFETY) ====================
 def seed_if_empty():
     """Populate baseline categories/products if the database is empty (MongoDB)."""
-    if mongo.db.products.count_documents({}) > 0:
+    if models.products.count() > 0:
         return
 
     products = [
@@ -132,14 +175,14 @@ def seed_if_empty():
         {'name': 'Raw Organic Honey', 'description': 'Pure, unfiltered organic honey. Natural sweetener with health benefits.', 'price': 1199, 'stock': 35, 'category': 'Organic Honey', 'image': 'honey.png'},
     ]
     for prod in products:
-        if mongo.db.products.find_one({'name': prod['name']}):
+        if models.products.find_one({'name': prod['name']}, {'_id': 1}):
             continue
         # Find category _id
-        cat_doc = mongo.db.categories.find_one({'name': prod['category']})
-        if not cat_doc:
+        category = models.categories.find_one({'name': prod['category']})
+        if not category:
             continue
-        prod['category_id'] = cat_doc['_id']
-        mongo.db.products.insert_one(prod)
+        prod['category_id'] = category._id
+        models.products.insert(prod)
 
 
 def create_default_admin():
@@ -147,81 +190,149 @@ def create_default_admin():
     ADMIN_EMAIL = "admin@greenharvest.com"
     ADMIN_PASSWORD = "admin123"
     ADMIN_NAME = "Admin User"
-    admin = mongo.db.users.find_one({'email': ADMIN_EMAIL})
+    admin = models.users.by_email(ADMIN_EMAIL)
     from werkzeug.security import generate_password_hash
     if not admin:
-        user_doc = {
-            'name': ADMIN_NAME,
-            'email': ADMIN_EMAIL,
-            'password_hash': generate_password_hash(ADMIN_PASSWORD),
-            'is_admin': True
-        }
-        mongo.db.users.insert_one(user_doc)
+        models.users.create(ADMIN_NAME, ADMIN_EMAIL, generate_password_hash(ADMIN_PASSWORD), is_admin=True)
         print(f"✓ Default admin created: {ADMIN_EMAIL} / {ADMIN_PASSWORD}")
     elif not admin.get('is_admin', False):
-        mongo.db.users.update_one({'_id': admin['_id']}, {'$set': {'is_admin': True}})
+        models.users.update(admin.id, {'is_admin': True})
         print(f"✓ User {ADMIN_EMAIL} promoted to admin")
 
 
 # ==================== HOME PAGE ====================
 
-from backend.api import api as api_blueprint
-app.register_blueprint(api_blueprint)
-# Ensure baseline data and indexes exist on import (gunicorn)
 def ensure_indexes():
     # Index for fast product lookup by category and sorting
     mongo.db.products.create_index([('category_id', 1)])
     mongo.db.products.create_index([('created_at', -1)])
+    # Keyset pagination of price-sorted listings (/api/products)
+    mongo.db.products.create_index([('price', 1), ('_id', 1)])
+    mongo.db.products.create_index([('category_id', 1), ('price', 1), ('_id', 1)])
+    # Cart lines are looked up and merged by (user_id, product_id)
+    mongo.db.cart.create_index([('user_id', 1), ('product_id', 1)])
     # Index for fast category name lookup
     mongo.db.categories.create_index([('name', 1)])
-    # Index for fast order lookup by user
-    mongo.db.orders.create_index([('user_id', 1)])
+    # Order listings are newest first with _id as the keyset tiebreak; the user_id
+    # index also serves the account and admin per-user order pages
+    mongo.db.orders.create_index([('user_id', 1), ('created_at', -1), ('_id', -1)])
+    mongo.db.orders.create_index([('status', 1), ('created_at', -1), ('_id', -1)])
+    mongo.db.orders.create_index([('created_at', -1), ('_id', -1)])
+
+
+# ==================== CATALOG READS ====================
+# Identical across requests and workers; memoized per worker and invalidated by
+# TTL or by the catalog version that admin product writes bump.
+
+@memoize(maxsize=1)
+def list_categories():
+    return models.categories.find()
+
+
+def attach_categories(products):
+    """Set product.category from the memoized category list"""
+    category_map = {cat.id: cat for cat in list_categories()}
+    for prod in products:
+        prod['category'] = category_map.get(models.to_id(prod.get('category_id')), {})
+    return products
+
+
+@memoize(maxsize=1)
+def category_product_counts():
+    """Product count per category id in one aggregation"""
+    return {row['_id']: row['count'] for row in mongo.db.products.aggregate([
+        {'$group': {'_id': '$category_id', 'count': {'$sum': 1}}}
+    ])}
+
+
+@memoize(maxsize=1)
+def price_range():
+    """Catalog (min, max) price for the price slider"""
+    price_stats = list(mongo.db.products.aggregate([
+        {"$group": {"_id": None, "min": {"$min": "$price"}, "max": {"$max": "$price"}}}
+    ]))
+    min_price = int(price_stats[0]['min']) if price_stats else 0
+    max_price = int(price_stats[0]['max']) if price_stats else 10000
+    return min_price, max_price
 
-with app.app_context():
-    seed_if_empty()
-    create_default_admin()
-    ensure_indexes()
+
+@memoize(maxsize=1)
+def featured_catalog():
+    """Categories and products shown on the home page"""
+    return models.categories.find(limit=4), attach_categories(models.products.find(limit=8))
+
+
+@memoize(maxsize=512)
+def related_by_category(category_id, exclude_id):
+    return models.products.find({'category_id': category_id, '_id': {'$ne': exclude_id}}, limit=4)
+
+
+# ==================== STALE CATALOG ====================
+# Renders of the catalog pages from the in-memory catalog alone, used while the
+# database is unavailable. Logged-in carts and wishlists live in the database and
+# are left out; guest carts come from the session.
+
+def stale_cart_quantities():
+    return {} if current_user.is_authenticated else guest_cart()
+
+
+def stale_index():
+    return render_template('index.html', categories=catalog.categories(limit=4),
+                           products=catalog.attach_categories(catalog.products(limit=8)))
+
+
+def stale_categories():
+    return render_listing(wishlist_ids=[], cart_quantities=stale_cart_quantities())
+
+
+def stale_shop():
+    category_id = request.args.get('category')
+    products, _ = catalog.listing(category_id)
+    return render_template('shop.html', products=catalog.attach_categories(products),
+                         categories=catalog.categories(),
+                         current_category=catalog.category(category_id) if category_id else None,
+                         cart_quantities=stale_cart_quantities())
+
+
+def stale_product(product_id):
+    product = catalog.product(product_id)
+    if not product:
+        return abort(404)
+    product['category'] = catalog.category(product.get('category_id')) or {}
+    product['category_name'] = product['category'].get('name', '')
+    related_products = catalog.related(product)
+    for related in related_products:
+        related['category_name'] = product['category_name']
+    return render_template('product.html', product=product,
+                         in_wishlist=False,
+                         related_products=related_products,
+                         item_quantity=stale_cart_quantities().get(product_id, 0))
 
 
 @app.route('/')
+@resilience.serve_stale_on_failure(stale_index)
 def index():
     """Home page with featured products and categories (MongoDB)"""
-    categories = list(mongo.db.categories.find().limit(4))
-    featured_products = list(mongo.db.products.find().limit(8))
+    categories, featured_products = featured_catalog()
     return render_template('index.html', categories=categories, products=featured_products)
 
 
 # ==================== CATEGORIES ====================
+CATALOG_PAGE_SIZE = 12
 
-@app.route('/categories')
-def categories():
-    """Display all categories with products (MongoDB)"""
-    from bson import ObjectId
-    category_id = request.args.get('category')
-    search_query = request.args.get('search', '').strip()
-    sort_by = request.args.get('sort', '')
-    price_min = request.args.get('price_min', type=float)
-    price_max = request.args.get('price_max', type=float)
-
-    # Get all categories with product counts
-    all_categories = list(mongo.db.categories.find())
-    for cat in all_categories:
-        cat['product_count'] = mongo.db.products.count_documents({'category_id': cat['_id']})
 
-    # Build product query
+def build_product_query(category_id, search_query, price_min, price_max, sort_by):
+    """Build the Mongo filter and sort for the catalog listing filters"""
     query = {}
     if category_id:
-        try:
-            query['category_id'] = ObjectId(category_id)
-        except Exception:
-            query['category_id'] = category_id
-        current_category = mongo.db.categories.find_one({'_id': query['category_id']})
-    else:
-        current_category = None
+        query['category_id'] = models.to_object_id(category_id) or category_id
     if search_query:
+        # A literal, case-insensitive match, as the in-memory catalog does it: never a
+        # user-supplied pattern
+        pattern = re.escape(search_query)
         query['$or'] = [
-            {'name': {'$regex': search_query, '$options': 'i'}},
-            {'description': {'$regex': search_query, '$options': 'i'}}
+            {'name': {'$regex': pattern, '$options': 'i'}},
+            {'description': {'$regex': pattern, '$options': 'i'}}
         ]
     if price_min is not None:
         query['price'] = query.get('price', {})
@@ -236,48 +347,53 @@ def categories():
         sort = [('price', -1)]
     elif sort_by == 'low_to_high':
         sort = [('price', 1)]
+    return query, sort
 
-    # Pagination
-    page = request.args.get('page', 1, type=int)
-    per_page = 12
-    skip = (page - 1) * per_page
-
-    # Get min/max price for slider
-    price_stats = mongo.db.products.aggregate([
-        {"$group": {"_id": None, "min": {"$min": "$price"}, "max": {"$max": "$price"}}}
-    ])
-    price_stats = list(price_stats)
-    min_price = int(price_stats[0]['min']) if price_stats else 0
-    max_price = int(price_stats[0]['max']) if price_stats else 10000
 
-    total_products = mongo.db.products.count_documents(query)
-    products_cursor = mongo.db.products.find(query, sort=sort) if sort else mongo.db.products.find(query)
-    products = list(products_cursor.skip(skip).limit(per_page))
+def decorate_products(products, category_map, wishlist_ids):
+    """Attach category name, string id and wishlist state to listed products"""
+    for prod in products:
+        prod_id = str(prod['_id'])
+        prod['category_name'] = category_map.get(str(prod.get('category_id')), '')
+        prod['id'] = prod_id
+        prod['in_wishlist'] = prod_id in wishlist_ids
+    return products
+
+
+def listing_args():
+    """(category_id, search_query, sort_by, price_min, price_max, page) from the query string"""
+    return (request.args.get('category'),
+            request.args.get('search', '').strip(),
+            request.args.get('sort', ''),
+            request.args.get('price_min', type=float),
+            request.args.get('price_max', type=float),
+            request.args.get('page', 1, type=int))
+
+
+def render_listing(wishlist_ids, cart_quantities):
+    """The /categories page from the in-memory catalog (backend/catalog_engine.py)"""
+    category_id, search_query, sort_by, price_min, price_max, page = listing_args()
+    per_page = CATALOG_PAGE_SIZE
+    # Filters, sort, counts and the slider range are vectorized over the catalog
+    # columns; only the products on the page are hydrated
+    products, total_products = catalog.listing(category_id, search_query, price_min, price_max, sort_by,
+                                               skip=(page - 1) * per_page, limit=per_page)
+    all_categories = catalog.categories()
+    counts = catalog.category_counts()
+    for cat in all_categories:
+        cat['product_count'] = counts.get(cat['_id'], 0)
+    min_price, max_price = catalog.price_range()
 
     # Attach category name and wishlist state to each product
     category_map = {str(cat['_id']): cat['name'] for cat in all_categories}
-    wishlist_ids = set()
-    if current_user.is_authenticated:
-        wishlist_items = list(mongo.db.wishlist.find({'user_id': str(current_user.id)}))
-        wishlist_ids = set(item['product_id'] for item in wishlist_items)
-    for prod in products:
-        cat_id = str(prod.get('category_id'))
-        prod['category_name'] = category_map.get(cat_id, '')
-        prod['id'] = str(prod['_id'])
-        prod['in_wishlist'] = str(prod['_id']) in wishlist_ids
-
-    # Prefill cart quantities for inline controls
-    cart_quantities = {}
-    if current_user.is_authenticated:
-        cart_items = list(mongo.db.cart.find({'user_id': str(current_user.id)}))
-        cart_quantities = {item['product_id']: item['quantity'] for item in cart_items}
+    decorate_products(products, category_map, set(wishlist_ids))
 
     total_pages = (total_products + per_page - 1) // per_page
 
     return render_template('categories.html',
                          categories=all_categories,
                          products=products,
-                         current_category=current_category,
+                         current_category=catalog.category(category_id) if category_id else None,
                          search_query=search_query,
                          cart_quantities=cart_quantities,
                          min_price=min_price,
@@ -287,52 +403,65 @@ def categories():
                          total_products=total_products)
 
 
+@app.route('/categories')
+@resilience.serve_stale_on_failure(stale_categories)
+def categories():
+    """Display all categories with products (in-memory catalog, per-user state from MongoDB)"""
+    # The catalog is refreshed before the request when its version moved (backend/resilience.py);
+    # the wishlist and cart quantities for the inline controls are independent reads
+    user_id = str(current_user.id) if current_user.is_authenticated else None
+    wishlist_ids, cart_quantities = fanout.gather(
+        lambda: models.wishlists.product_ids(user_id) if user_id else [],
+        current_cart_quantities)
+    return render_listing(wishlist_ids, cart_quantities)
+
+
 # ==================== SHOP / PRODUCTS ====================
 
 @app.route('/shop')
+@resilience.serve_stale_on_failure(stale_shop)
 def shop():
     """Display all products with optional category filter (MongoDB)"""
-    from bson import ObjectId
     category_id = request.args.get('category')
     if category_id:
-        try:
-            cat_id = ObjectId(category_id)
-        except Exception:
-            cat_id = category_id
-        products = list(mongo.db.products.find({'category_id': cat_id}))
-        current_category = mongo.db.categories.find_one({'_id': cat_id})
+        products = models.products.find({'category_id': models.to_object_id(category_id) or category_id})
+        current_category = models.categories.load(category_id)
     else:
-        products = list(mongo.db.products.find())
+        products = models.products.find()
         current_category = None
-    categories = list(mongo.db.categories.find())
-    cart_quantities = {}
-    if current_user.is_authenticated:
-        cart_items = list(mongo.db.cart.find({'user_id': str(current_user.id)}))
-        cart_quantities = {item['product_id']: item['quantity'] for item in cart_items}
+    categories = list_categories()
+    attach_categories(products)
+    cart_quantities = current_cart_quantities()
     return render_template('shop.html', products=products, categories=categories,
                          current_category=current_category, cart_quantities=cart_quantities)
 
 
 
 @app.route('/product/<product_id>')
+@resilience.serve_stale_on_failure(stale_product)
 def product_detail(product_id):
     """Display product details (MongoDB)"""
-    from bson import ObjectId
-    product = mongo.db.products.find_one({'_id': ObjectId(product_id)})
+    user_id = str(current_user.id) if current_user.is_authenticated else None
+    # Related products and category come precomputed from the recommendations job
+    product, wishlist_ids, cart_quantities, recommendation = fanout.gather(
+        lambda: models.products.load(product_id),
+        lambda: models.wishlists.product_ids(user_id) if user_id else [],
+        current_cart_quantities,
+        lambda: models.recommendations.for_product(product_id))
     if not product:
         return abort(404)
-    in_wishlist = False
-    item_quantity = 0
-    if current_user.is_authenticated:
-        in_wishlist = mongo.db.wishlist.find_one({'user_id': str(current_user.id), 'product_id': product_id}) is not None
-        cart_item = mongo.db.cart.find_one({'user_id': str(current_user.id), 'product_id': product_id})
-        if cart_item:
-            item_quantity = cart_item.get('quantity', 1)
-    # Get related products from the same category
-    related_products = list(mongo.db.products.find({
-        'category_id': product['category_id'],
-        '_id': {'$ne': product['_id']}
-    }).limit(4))
+    in_wishlist = product_id in wishlist_ids
+    item_quantity = cart_quantities.get(product_id, 0)
+    # Fall back to same-category products until the job has run for this product
+    if recommendation:
+        product['category'] = recommendation['category']
+        related_products = recommendation['related']
+    else:
+        product['category'] = models.categories.load(product.get('category_id')) or {}
+        related_products = related_by_category(product.get('category_id'), product._id)
+        for related in related_products:
+            related['category_name'] = product['category'].get('name', '')
+    product['category_name'] = product['category'].get('name', '')
     return render_template('product.html', product=product,
                          in_wishlist=in_wishlist,
                          related_products=related_products,
@@ -348,12 +477,13 @@ def login():
         return redirect(url_for('index'))
     form = LoginForm()
     if form.validate_on_submit():
-        user_doc = mongo.db.users.find_one({'email': form.email.data})
-        if user_doc:
+        user_record = models.users.by_email(form.email.data)
+        if user_record:
             from werkzeug.security import check_password_hash
-            if check_password_hash(user_doc['password_hash'], form.password.data):
-                user = MongoUser(user_doc)
+            if check_password_hash(user_record.password_hash, form.password.data):
+                user = MongoUser(user_record)
                 login_user(user)
+                merge_guest_cart(user.id)
                 flash('Login successful!', 'success')
                 next_page = request.args.get('next')
                 return redirect(next_page) if next_page else redirect(url_for('index'))
@@ -370,23 +500,17 @@ def register():
     form = RegistrationForm()
     if form.validate_on_submit():
         # Check if user with this email already exists
-        existing_user = mongo.db.users.find_one({'email': form.email.data})
+        existing_user = models.users.by_email(form.email.data)
         if existing_user:
             flash('Email address already registered. Please use a different email or login.', 'danger')
             return render_template('register.html', form=form)
         from werkzeug.security import generate_password_hash
-        user_doc = {
-            'name': form.name.data,
-            'email': form.email.data,
-            'password_hash': generate_password_hash(form.password.data),
-            'is_admin': False
-        }
-        mongo.db.users.insert_one(user_doc)
+        user_record = models.users.create(form.name.data, form.email.data,
+                                          generate_password_hash(form.password.data))
         # Auto-login after registration
-        user_doc = mongo.db.users.find_one({'email': form.email.data})
-        from flask_login import login_user
-        user = MongoUser(user_doc)
+        user = MongoUser(user_record)
         login_user(user)
+        merge_guest_cart(user.id)
         flash('Registration successful! Welcome, {}!'.format(user.name.split()[0]), 'success')
         return redirect(url_for('index'))
     return render_template('register.html', form=form)
@@ -415,18 +539,21 @@ def contact():
 
 
 # ==================== WISHLIST ====================
+# Each user's wishlist is one document {'_id': user_id, 'product_ids': [...]} in
+# the `wishlists` collection, so membership for a whole page is a single read
+# and a toggle is a single atomic update.
 
 @app.route('/wishlist')
 @login_required
 def wishlist():
     """Display user's wishlist (MongoDB)"""
-    from bson import ObjectId
-    wishlist_items = list(mongo.db.wishlist.find({'user_id': str(current_user.id)}))
-    # Fetch product details for each wishlist item
-    product_ids = [ObjectId(item['product_id']) for item in wishlist_items]
-    products = {str(prod['_id']): prod for prod in mongo.db.products.find({'_id': {'$in': product_ids}})}
-    for item in wishlist_items:
-        item['product'] = products.get(item['product_id'])
+    product_ids = models.wishlists.product_ids(str(current_user.id))
+    # Fetch product details and their categories in one query each
+    products = models.products.load_many(product_ids)
+    categories = models.categories.load_many({prod.get('category_id') for prod in products.values()})
+    for prod in products.values():
+        prod['category'] = categories.get(models.to_id(prod.get('category_id')), {})
+    wishlist_items = [{'product_id': pid, 'product': products[pid]} for pid in product_ids if pid in products]
     return render_template('wishlist.html', wishlist_items=wishlist_items)
 
 
@@ -434,31 +561,15 @@ def wishlist():
 @app.route('/wishlist/add/<product_id>', methods=['POST'])
 @login_required
 def add_to_wishlist(product_id):
-    """Add product to wishlist (MongoDB)"""
-    from bson import ObjectId
-    # Check if product exists
-    product = mongo.db.products.find_one({'_id': ObjectId(product_id)})
-    if not product:
+    """Toggle product in wishlist (MongoDB)"""
+    if not models.products.exists(product_id):
         return jsonify({'success': False, 'message': 'Product not found'}), 404
-    # Check if already in wishlist
-    existing = mongo.db.wishlist.find_one({'user_id': str(current_user.id), 'product_id': product_id})
-    if existing:
-        mongo.db.wishlist.delete_one({'_id': existing['_id']})
-        wishlist_count = mongo.db.wishlist.count_documents({'user_id': str(current_user.id)})
-        return jsonify({
-            'success': True,
-            'message': 'Removed from wishlist',
-            'wishlist_count': wishlist_count,
-            'action': 'removed'
-        })
-    # Add to wishlist
-    mongo.db.wishlist.insert_one({'user_id': str(current_user.id), 'product_id': product_id})
-    wishlist_count = mongo.db.wishlist.count_documents({'user_id': str(current_user.id)})
+    added, wishlist_count = models.wishlists.toggle(str(current_user.id), product_id)
     return jsonify({
         'success': True,
-        'message': 'Added to wishlist',
+        'message': 'Added to wishlist' if added else 'Removed from wishlist',
         'wishlist_count': wishlist_count,
-        'action': 'added'
+        'action': 'added' if added else 'removed'
     })
 
 
@@ -467,9 +578,7 @@ def add_to_wishlist(product_id):
 @login_required
 def remove_from_wishlist(product_id):
     """Remove product from wishlist (MongoDB)"""
-    existing = mongo.db.wishlist.find_one({'user_id': str(current_user.id), 'product_id': product_id})
-    if existing:
-        mongo.db.wishlist.delete_one({'_id': existing['_id']})
+    if models.wishlists.remove(str(current_user.id), product_id):
         flash('Product removed from wishlist', 'success')
     else:
         flash('Product not found in wishlist', 'warning')
@@ -477,33 +586,92 @@ def remove_from_wishlist(product_id):
 
 
 # ==================== CART ====================
+# Logged-in carts live in the `cart` collection. Anonymous shoppers get a guest
+# cart of {product_id: quantity} in the signed session cookie, so browsing and
+# adding to cart costs no database writes until login()/register() merge it.
+GUEST_CART_KEY = 'guest_cart'
 
-@app.route('/cart')
-@login_required
-def cart():
-    """Display shopping cart (MongoDB)"""
-    from bson import ObjectId
-    cart_items = list(mongo.db.cart.find({'user_id': str(current_user.id)}))
-    # Fetch product details for each cart item
-    product_ids = [ObjectId(item['product_id']) for item in cart_items]
-    products = {str(prod['_id']): prod for prod in mongo.db.products.find({'_id': {'$in': product_ids}})}
+
+def guest_cart():
+    return dict(session.get(GUEST_CART_KEY) or {})
+
+
+def save_guest_cart(items):
+    """Store the guest cart, bounded so the session cookie stays well under 4 KB"""
+    max_quantity = app.config['GUEST_CART_MAX_QUANTITY']
+    items = {pid: min(qty, max_quantity) for pid, qty in items.items() if qty > 0}
+    if items:
+        session[GUEST_CART_KEY] = items
+    else:
+        session.pop(GUEST_CART_KEY, None)
+
+
+def load_cart_items():
+    """Cart lines for the current shopper; guest lines use the product id as their id"""
+    if current_user.is_authenticated:
+        return models.carts.for_user(str(current_user.id))
+    return [models.CartLine(id=pid, product_id=pid, quantity=qty) for pid, qty in guest_cart().items()]
+
+
+def current_cart_quantities():
+    """{product_id: quantity} for the inline cart controls"""
+    return {line.product_id: line.get('quantity', 1) for line in load_cart_items()}
+
+
+def current_cart_count():
+    if current_user.is_authenticated:
+        return models.carts.total_quantity(str(current_user.id))
+    return sum(guest_cart().values())
+
+
+def merge_guest_cart(user_id):
+    """Fold the session guest cart into the user's persistent cart with one bulk write"""
+    quantities = session.pop(GUEST_CART_KEY, None)
+    models.carts.merge(user_id, quantities)
+    if quantities:
+        publish_cart_count(user_id)
+
+
+def publish_cart_count(user_id):
+    """Push the user's new cart count to their open tabs (see backend/live.py)"""
+    if live.bus.enabled:
+        live.publish_cart(user_id, models.carts.total_quantity(user_id))
+
+
+def cart_total(cart_items, products):
+    """Attach product documents to cart items and return the cart total"""
     total = 0
     for item in cart_items:
         prod = products.get(item['product_id'])
         item['product'] = prod
         if prod:
             total += prod.get('price', 0) * item.get('quantity', 1)
+    return total
+
+
+def cart_products(cart_items):
+    """Products for the cart lines keyed by id, with their category attached"""
+    products = models.products.load_many(item['product_id'] for item in cart_items)
+    attach_categories(products.values())
+    return products
+
+
+@app.route('/cart')
+def cart():
+    """Display shopping cart (MongoDB, or the session cart for guests)"""
+    cart_items = load_cart_items()
+    products = cart_products(cart_items)
+    total = cart_total(cart_items, products)
+    # Lines whose product has since been deleted are not shown
+    cart_items = [item for item in cart_items if item['product']]
     return render_template('cart.html', cart_items=cart_items, total=total)
 
 
 
 @app.route('/cart/add/<product_id>', methods=['POST'])
-@login_required
 def add_to_cart(product_id):
-    """Add product to cart (MongoDB)"""
-    from bson import ObjectId
-    product = mongo.db.products.find_one({'_id': ObjectId(product_id)})
-    if not product:
+    """Add product to cart (MongoDB, or the session cart for guests)"""
+    if not models.products.exists(product_id):
         return jsonify({'success': False, 'message': 'Product not found'}), 404
     is_ajax = request.is_json or request.headers.get('X-Requested-With') == 'XMLHttpRequest'
     if request.is_json:
@@ -514,20 +682,26 @@ def add_to_cart(product_id):
             quantity = 1
     else:
         quantity = request.form.get('quantity', 1, type=int)
-    # Check if already in cart
-    cart_item = mongo.db.cart.find_one({'user_id': str(current_user.id), 'product_id': product_id})
-    if cart_item:
-        new_quantity = cart_item.get('quantity', 1) + quantity
-        mongo.db.cart.update_one({'_id': cart_item['_id']}, {'$set': {'quantity': new_quantity}})
+    if current_user.is_authenticated:
+        new_quantity = models.carts.add(str(current_user.id), product_id, quantity)
+        publish_cart_count(str(current_user.id))
     else:
-        mongo.db.cart.insert_one({'user_id': str(current_user.id), 'product_id': product_id, 'quantity': quantity})
-    cart_count = sum(item.get('quantity', 1) for item in mongo.db.cart.find({'user_id': str(current_user.id)}))
+        items = guest_cart()
+        if product_id not in items and len(items) >= app.config['GUEST_CART_MAX_LINES']:
+            message = 'Your cart is full. Please login to add more products.'
+            if is_ajax:
+                return jsonify({'success': False, 'message': message}), 400
+            flash(message, 'warning')
+            return redirect(url_for('login', next=url_for('cart')))
+        items[product_id] = items.get(product_id, 0) + quantity
+        save_guest_cart(items)
+        new_quantity = guest_cart().get(product_id, 0)
     if is_ajax:
         return jsonify({
             'success': True,
             'message': 'Product added to cart',
-            'quantity': new_quantity if cart_item else quantity,
-            'cart_count': cart_count
+            'quantity': new_quantity,
+            'cart_count': current_cart_count()
         })
     if request.form.get('next') == 'checkout':
         return redirect(url_for('checkout'))
@@ -540,63 +714,70 @@ def add_to_cart(product_id):
 
 
 @app.route('/cart/update/<cart_id>', methods=['POST'])
-@login_required
 def update_cart(cart_id):
-    """Update cart item quantity (MongoDB)"""
-    from bson import ObjectId
-    cart_item = mongo.db.cart.find_one({'_id': ObjectId(cart_id), 'user_id': str(current_user.id)})
-    if not cart_item:
-        return jsonify({'success': False, 'message': 'Cart item not found'}), 404
+    """Update cart item quantity (MongoDB, or the session cart for guests)"""
     quantity = request.form.get('quantity', 1, type=int)
-    if quantity > 0:
-        mongo.db.cart.update_one({'_id': cart_item['_id']}, {'$set': {'quantity': quantity}})
-        return jsonify({'success': True, 'message': 'Cart updated'})
-    else:
-        mongo.db.cart.delete_one({'_id': cart_item['_id']})
-        return jsonify({'success': True, 'message': 'Item removed from cart'})
+    if not current_user.is_authenticated:
+        items = guest_cart()
+        if cart_id not in items:
+            return jsonify({'success': False, 'message': 'Cart item not found'}), 404
+        items[cart_id] = max(quantity, 0)
+        save_guest_cart(items)
+        return jsonify({'success': True, 'message': 'Cart updated' if quantity > 0 else 'Item removed from cart'})
+    if not models.carts.update_line(str(current_user.id), cart_id, quantity):
+        return jsonify({'success': False, 'message': 'Cart item not found'}), 404
+    publish_cart_count(str(current_user.id))
+    return jsonify({'success': True, 'message': 'Cart updated' if quantity > 0 else 'Item removed from cart'})
 
 
 
 @app.route('/cart/set/<product_id>', methods=['POST'])
-@login_required
 def set_cart_quantity(product_id):
-    """Set cart quantity by product (MongoDB, AJAX friendly)"""
+    """Set cart quantity by product (MongoDB or guest session cart, AJAX friendly)"""
     data = request.get_json() or {}
     quantity = data.get('quantity', 1)
     try:
         quantity = int(quantity)
     except (TypeError, ValueError):
         return jsonify({'success': False, 'message': 'Invalid quantity'}), 400
-    cart_item = mongo.db.cart.find_one({'user_id': str(current_user.id), 'product_id': product_id})
-    if quantity <= 0:
-        if cart_item:
-            mongo.db.cart.delete_one({'_id': cart_item['_id']})
-        cart_count = sum(item.get('quantity', 1) for item in mongo.db.cart.find({'user_id': str(current_user.id)}))
-        return jsonify({'success': True, 'quantity': 0, 'cart_count': cart_count, 'message': 'Item removed'})
-    if cart_item:
-        mongo.db.cart.update_one({'_id': cart_item['_id']}, {'$set': {'quantity': quantity}})
-    else:
-        mongo.db.cart.insert_one({'user_id': str(current_user.id), 'product_id': product_id, 'quantity': quantity})
-    cart_item = mongo.db.cart.find_one({'user_id': str(current_user.id), 'product_id': product_id})
-    cart_count = sum(item.get('quantity', 1) for item in mongo.db.cart.find({'user_id': str(current_user.id)}))
+    if not current_user.is_authenticated:
+        items = guest_cart()
+        # Dropping a line needs no lookup, so lines of deleted products can still be removed
+        if quantity > 0 and not models.products.exists(product_id):
+            return jsonify({'success': False, 'message': 'Product not found'}), 404
+        if product_id not in items and len(items) >= app.config['GUEST_CART_MAX_LINES'] and quantity > 0:
+            return jsonify({'success': False, 'message': 'Your cart is full. Please login to add more products.'}), 400
+        items[product_id] = max(quantity, 0)
+        save_guest_cart(items)
+        quantity = guest_cart().get(product_id, 0)
+        return jsonify({'success': True, 'quantity': quantity, 'cart_count': current_cart_count(),
+                        'message': 'Cart updated' if quantity else 'Item removed'})
+    quantity = models.carts.set_quantity(str(current_user.id), product_id, quantity)
+    publish_cart_count(str(current_user.id))
+    if quantity == 0:
+        return jsonify({'success': True, 'quantity': 0, 'cart_count': current_cart_count(), 'message': 'Item removed'})
     return jsonify({
         'success': True,
-        'quantity': cart_item.get('quantity', 1),
-        'cart_count': cart_count,
+        'quantity': quantity,
+        'cart_count': current_cart_count(),
         'message': 'Cart updated'
     })
 
 
 
 @app.route('/cart/remove/<cart_id>', methods=['POST'])
-@login_required
 def remove_from_cart(cart_id):
-    """Remove item from cart (MongoDB)"""
-    from bson import ObjectId
-    cart_item = mongo.db.cart.find_one({'_id': ObjectId(cart_id), 'user_id': str(current_user.id)})
+    """Remove item from cart (MongoDB, or the session cart for guests)"""
     is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+    if current_user.is_authenticated:
+        cart_item = models.carts.remove_line(str(current_user.id), cart_id)
+        if cart_item:
+            publish_cart_count(str(current_user.id))
+    else:
+        items = guest_cart()
+        cart_item = items.pop(cart_id, None)
+        save_guest_cart(items)
     if cart_item:
-        mongo.db.cart.delete_one({'_id': cart_item['_id']})
         if is_ajax:
             return jsonify({'success': True, 'message': 'Item removed from cart'})
         flash('Item removed from cart', 'success')
@@ -608,7 +789,6 @@ def remove_from_cart(cart_id):
 
 
 @app.route('/cart/remove/', methods=['POST'])
-@login_required
 def remove_from_cart_empty():
     flash('No cart item specified.', 'warning')
     return redirect(url_for('cart'))
@@ -619,18 +799,13 @@ def remove_from_cart_empty():
 @login_required
 def checkout():
     """Checkout page"""
-    from bson import ObjectId
-    cart_items = list(mongo.db.cart.find({'user_id': str(current_user.id)}))
+    cart_items = models.carts.for_user(str(current_user.id))
+    # Fetch product details for every cart line in one query and calculate the total
+    total = cart_total(cart_items, cart_products(cart_items))
+    cart_items = [item for item in cart_items if item.product]
     if not cart_items:
         flash('Your cart is empty', 'warning')
         return redirect(url_for('categories'))
-    # Fetch product details for each cart item
-    product_ids = [ObjectId(item['product_id']) for item in cart_items]
-    products = {str(prod['_id']): prod for prod in mongo.db.products.find({'_id': {'$in': product_ids}})}
-    for item in cart_items:
-        item['product'] = products.get(item['product_id'])
-    # Calculate total
-    total = sum((item['product']['price'] if item['product'] else 0) * item.get('quantity', 1) for item in cart_items)
     form = CheckoutForm()
     # Pre-fill form with user data
     if request.method == 'GET':
@@ -639,7 +814,6 @@ def checkout():
     
     if form.validate_on_submit():
         from datetime import datetime
-        from bson import ObjectId
         # Create order document
         order_doc = {
             'user_id': str(current_user.id),
@@ -657,16 +831,16 @@ def checkout():
         # Add order items
         for cart_item in cart_items:
             order_doc['items'].append({
-                'product_id': cart_item['product_id'] if isinstance(cart_item, dict) else str(cart_item.product_id),
-                'quantity': cart_item['quantity'] if isinstance(cart_item, dict) else cart_item.quantity,
-                'price': cart_item['product']['price'] if isinstance(cart_item, dict) and 'product' in cart_item else (cart_item.product.price if hasattr(cart_item, 'product') else 0),
-                'unit': cart_item['product']['unit'] if isinstance(cart_item, dict) and 'product' in cart_item and 'unit' in cart_item['product'] else (cart_item.product.unit if hasattr(cart_item, 'product') and hasattr(cart_item.product, 'unit') else 'kg')
+                'product_id': cart_item.product_id,
+                'quantity': cart_item.get('quantity', 1),
+                'price': cart_item.product.get('price', 0),
+                'unit': cart_item.product.get('unit', 'kg')
             })
         # Insert order
-        result = mongo.db.orders.insert_one(order_doc)
-        order_id = str(result.inserted_id)
+        order_id = models.orders.create(order_doc)
         # Clear cart
-        mongo.db.cart.delete_many({'user_id': str(current_user.id)})
+        models.carts.clear(str(current_user.id))
+        publish_cart_count(str(current_user.id))
         flash('Order placed successfully!', 'success')
         return redirect(url_for('order_success', order_id=order_id))
     
@@ -678,10 +852,10 @@ def checkout():
 @login_required
 def order_success(order_id):
     """Order confirmation page (MongoDB)"""
-    from bson import ObjectId
-    order = mongo.db.orders.find_one({'_id': ObjectId(order_id), 'user_id': str(current_user.id)})
+    order = models.orders.get_for_user(order_id, str(current_user.id))
     if not order:
         return abort(404)
+    models.attach_order_products([order])
     return render_template('success.html', order=order)
 
 
@@ -691,7 +865,8 @@ def order_success(order_id):
 @login_required
 def account():
     """User account page with orders (MongoDB)"""
-    orders = list(mongo.db.orders.find({'user_id': str(current_user.id)}).sort('created_at', -1))
+    orders = models.orders.for_user(str(current_user.id))
+    models.attach_order_products(orders)
     return render_template('account.html', orders=orders)
 
 
@@ -700,24 +875,23 @@ def account():
 @login_required
 def order_detail(order_id):
     """View detailed order information (MongoDB)"""
-    from bson import ObjectId
-    order = mongo.db.orders.find_one({'_id': ObjectId(order_id), 'user_id': str(current_user.id)})
+    order = models.orders.get_for_user(order_id, str(current_user.id))
     if not order:
         return abort(404)
+    models.attach_order_products([order])
     return render_template('order_detail.html', order=order)
 
 @app.route('/order/<order_id>/cancel', methods=['POST'])
 @login_required
 def cancel_order(order_id):
     """Cancel an order if it's still pending or processing (MongoDB)"""
-    from bson import ObjectId
-    order = mongo.db.orders.find_one({'_id': ObjectId(order_id), 'user_id': str(current_user.id)})
+    order = models.orders.get_for_user(order_id, str(current_user.id))
     if not order:
         return abort(404)
     if order.get('status', '').lower() not in ['pending', 'processing']:
         flash('This order can no longer be cancelled.', 'warning')
         return redirect(request.referrer or url_for('account'))
-    mongo.db.orders.update_one({'_id': order['_id']}, {'$set': {'status': 'cancelled'}})
+    models.orders.set_status(order.id, 'cancelled')
     flash('Your order has been cancelled.', 'success')
     return redirect(request.referrer or url_for('account'))
 
@@ -727,13 +901,8 @@ def cancel_order(order_id):
 @admin_required
 def admin_dashboard():
     """Admin dashboard with stats (MongoDB)"""
-    total_products = mongo.db.products.count_documents({})
-    total_categories = mongo.db.categories.count_documents({})
-    total_orders = mongo.db.orders.count_documents({})
-    total_users = mongo.db.users.count_documents({'is_admin': False})
-    
     # Get category-wise product counts
-    category_stats = mongo.db.categories.aggregate([
+    category_stats_pipeline = [
         {
             "$lookup": {
                 "from": "products",
@@ -748,38 +917,28 @@ def admin_dashboard():
                 "product_count": {"$size": "$products"}
             }
         }
-    ])
-    
-    # Recent products
-    recent_products = list(mongo.db.products.find().sort("created_at", -1).limit(10))
-    # Attach category_name and id to each product
-    all_categories = list(mongo.db.categories.find())
-    category_map = {str(cat['_id']): cat['name'] for cat in all_categories}
+    ]
+    # Every panel is an independent read: run them concurrently
+    (total_products, total_categories, total_orders, total_users, category_stats, recent_products,
+     categories, order_counts, registered_users) = fanout.gather(
+        models.products.count,
+        models.categories.count,
+        models.orders.count_all,
+        lambda: models.users.count({'is_admin': False}),
+        lambda: list(mongo.db.categories.aggregate(category_stats_pipeline)),
+        lambda: models.products.find(sort=[('created_at', -1)], limit=10),
+        list_categories,
+        # orders.user_id is the string form of users._id, so count per user_id and join in Python
+        models.orders.counts_by_user,
+        lambda: models.users.find({'is_admin': False}))
+
+    # Attach category_name to each recent product
+    category_map = {cat.id: cat.get('name', '') for cat in categories}
     for prod in recent_products:
-        cat_id = str(prod.get('category_id'))
-        prod['category_name'] = category_map.get(cat_id, '')
-        prod['id'] = str(prod['_id'])
-    
-    # Get all registered users (excluding admins) with their order counts
-    users = list(mongo.db.users.aggregate([
-        {
-            "$match": {"is_admin": False}
-        },
-        {
-            "$lookup": {
-                "from": "orders",
-                "localField": "_id",
-                "foreignField": "user_id",
-                "as": "orders"
-            }
-        },
-        {
-            "$project": {
-                "user": "$$ROOT",
-                "order_count": {"$size": "$orders"}
-            }
-        }
-    ]))
+        prod['category_name'] = category_map.get(models.to_id(prod.get('category_id')), '')
+
+    # All registered users (excluding admins) with their order counts
+    users = [{'user': user, 'order_count': order_counts.get(user.id, 0)} for user in registered_users]
     
     return render_template('admin_dashboard.html',
                            total_products=total_products,
@@ -796,20 +955,41 @@ def admin_dashboard():
 @admin_required
 def admin_products():
     """List all products for admin management"""
-    products = list(mongo.db.products.find().sort('created_at', -1))
+    products = models.products.find(sort=[('created_at', -1)])
     return render_template('admin_products.html', products=products, hide_shopping_nav=True)
 
 
+@app.route('/admin/uploads/image', methods=['POST'])
+@admin_required
+def admin_upload_image():
+    """Stream an uploaded product image into content-addressed storage"""
+    stream = uploads.upload_stream()
+    if stream is None:
+        return jsonify({'success': False, 'message': 'No image uploaded'}), 400
+    try:
+        stored = uploads.store_image(stream, app.config['UPLOAD_FOLDER'],
+                                     chunk_size=app.config.get('UPLOAD_CHUNK_SIZE', 64 * 1024),
+                                     max_bytes=app.config.get('MAX_CONTENT_LENGTH'))
+    except uploads.UploadError as e:
+        return jsonify({'success': False, 'message': str(e)}), e.status
+    return jsonify({
+        'success': True,
+        'filename': stored.filename,
+        'url': url_for('static', filename='images/' + stored.filename),
+        'size': stored.size,
+        'deduplicated': stored.deduplicated,
+    }), 200 if stored.deduplicated else 201
+
+
 @app.route('/admin/product/add', methods=['GET', 'POST'])
 @admin_required
 def admin_add_product():
     """Add new product"""
     form = ProductForm()
     # Populate category choices from MongoDB
-    categories = list(mongo.db.categories.find().sort('name', 1))
-    form.category_id.choices = [(str(c['_id']), c['name']) for c in categories]
+    categories = models.categories.find(sort=[('name', 1)])
+    form.category_id.choices = [(c.id, c.name) for c in categories]
     if form.validate_on_submit():
-        from bson import ObjectId
         # Handle image source type
         image_filename = None
         image_url = None
@@ -823,17 +1003,20 @@ def admin_add_product():
                 flash('Please enter image URL', 'danger')
                 return render_template('admin_add_product.html', form=form, hide_shopping_nav=True)
             image_url = form.image_url.data
-        category_id = ObjectId(form.category_id.data)
+        category_id = models.to_object_id(form.category_id.data)
         product_doc = {
             'name': form.name.data,
             'description': form.description.data,
             'price': form.price.data,
             'stock': form.stock.data,
+            'unit': form.unit.data,
             'category_id': category_id,
             'image': image_filename,
             'image_url': image_url
         }
-        mongo.db.products.insert_one(product_doc)
+        new_id = models.products.insert(product_doc)
+        search.suggest_index.upsert_product(new_id, product_doc['name'],
+                                            version=cache.catalog_version.bump())
         flash(f'Product "{form.name.data}" added successfully!', 'success')
         return redirect(url_for('admin_products'))
     return render_template('admin_add_product.html', form=form, hide_shopping_nav=True)
@@ -843,9 +1026,7 @@ def admin_add_product():
 @admin_required
 def admin_edit_product(product_id):
     """Edit existing product"""
-    from bson import ObjectId
-    from bson import ObjectId
-    product = mongo.db.products.find_one({'_id': ObjectId(product_id)})
+    product = models.products.load(product_id)
     if not product:
         abort(404)
     # Pre-populate form with product data
@@ -854,20 +1035,22 @@ def admin_edit_product(product_id):
         'description': product.get('description'),
         'price': product.get('price'),
         'stock': product.get('stock'),
+        'unit': product.get('unit') or 'kg',
         'category_id': str(product.get('category_id')),
         'image': product.get('image'),
         'image_url': product.get('image_url'),
     })
     # Populate category choices from MongoDB
-    categories = list(mongo.db.categories.find().sort('name', 1))
-    form.category_id.choices = [(str(c['_id']), c['name']) for c in categories]
+    categories = models.categories.find(sort=[('name', 1)])
+    form.category_id.choices = [(c.id, c.name) for c in categories]
     if form.validate_on_submit():
         update_doc = {
             'name': form.name.data,
             'description': form.description.data,
             'price': form.price.data,
             'stock': form.stock.data,
-            'category_id': ObjectId(form.category_id.data)
+            'unit': form.unit.data,
+            'category_id': models.to_object_id(form.category_id.data)
         }
         # Handle image source type
         if form.image_source.data == 'file':
@@ -882,7 +1065,11 @@ def admin_edit_product(product_id):
                 return render_template('admin_edit_product.html', form=form, product=product, hide_shopping_nav=True)
             update_doc['image'] = None
             update_doc['image_url'] = form.image_url.data
-        mongo.db.products.update_one({'_id': ObjectId(product_id)}, {'$set': update_doc})
+        models.products.update(product.id, update_doc)
+        live.publish_stock(product_id, product.get('stock'), update_doc['stock'])
+        recommendations.refresh_product(mongo.db, product._id)
+        search.suggest_index.upsert_product(product_id, update_doc['name'],
+                                            version=cache.catalog_version.bump())
         flash(f'Product "{form.name.data}" updated successfully!', 'success')
         return redirect(url_for('admin_products'))
     return render_template('admin_edit_product.html', form=form, product=product, hide_shopping_nav=True)
@@ -892,13 +1079,14 @@ def admin_edit_product(product_id):
 @admin_required
 def admin_delete_product(product_id):
     """Delete a product"""
-    from bson import ObjectId
-    from bson import ObjectId
-    product = mongo.db.products.find_one({'_id': ObjectId(product_id)})
+    product = models.products.load(product_id)
     if not product:
         abort(404)
     product_name = product.get('name')
-    mongo.db.products.delete_one({'_id': ObjectId(product_id)})
+    models.products.delete(product.id)
+    live.publish_stock(product_id, product.get('stock'), 0)
+    recommendations.refresh_product(mongo.db, product._id)
+    search.suggest_index.remove_product(product_id, version=cache.catalog_version.bump())
     flash(f'Product "{product_name}" deleted successfully!', 'success')
     return redirect(url_for('admin_products'))
 
@@ -908,23 +1096,206 @@ def admin_delete_product(product_id):
 def admin_categories():
     """List all categories with product counts"""
     # Get all categories and count products in each (MongoDB)
-    categories = list(mongo.db.categories.find())
-    for cat in categories:
-        cat['product_count'] = mongo.db.products.count_documents({'category_id': cat['_id']})
-    return render_template('admin_categories.html', category_stats=categories, hide_shopping_nav=True)
+    counts = category_product_counts()
+    category_stats = [(cat, counts.get(cat._id, 0)) for cat in list_categories()]
+    return render_template('admin_categories.html', category_stats=category_stats, hide_shopping_nav=True)
 
 
 @app.route('/admin/user/<user_id>/orders')
 @admin_required
 def admin_user_orders(user_id):
     """View a specific user's order history"""
-    from bson import ObjectId
-    user = mongo.db.users.find_one({'_id': ObjectId(user_id)})
+    user = models.users.load(user_id)
     if not user:
         abort(404)
-    orders = list(mongo.db.orders.find({'user_id': ObjectId(user_id)}).sort('created_at', -1))
+    orders = models.orders.for_user(user.id)
+    models.attach_order_products(orders)
     return render_template('admin_user_orders.html', user=user, orders=orders, hide_shopping_nav=True)
 
+
+# ==================== ADMIN ORDERS ====================
+ORDER_STATUSES = ('pending', 'processing', 'shipped', 'delivered', 'cancelled')
+ADMIN_ORDERS_PAGE_SIZE = 50
+CSV_EXPORT_BATCH = 1000
+CSV_COLUMNS = ('order_id', 'created_at', 'status', 'user_id', 'shipping_name', 'shipping_email',
+               'shipping_city', 'shipping_postal_code', 'shipping_country', 'item_count', 'total_amount')
+
+
+def parse_order_filters(args):
+    """Mongo query for the admin order filters plus the normalised values for the form"""
+    from datetime import datetime, timedelta
+    filters = {
+        'status': args.get('status', '').strip(),
+        'customer': args.get('customer', '').strip(),
+        'date_from': args.get('date_from', '').strip(),
+        'date_to': args.get('date_to', '').strip(),
+    }
+    query = {}
+    if filters['status'] in ORDER_STATUSES:
+        query['status'] = filters['status']
+    else:
+        filters['status'] = ''
+    if filters['customer']:
+        if models.to_object_id(filters['customer']):
+            query['user_id'] = filters['customer']
+        else:
+            user = models.users.find_one({'email': filters['customer']}, {'_id': 1})
+            # Unknown customers match nothing rather than everything
+            query['user_id'] = user.id if user else {'$in': []}
+    created = {}
+    try:
+        if filters['date_from']:
+            created['$gte'] = datetime.strptime(filters['date_from'], '%Y-%m-%d')
+        if filters['date_to']:
+            created['$lt'] = datetime.strptime(filters['date_to'], '%Y-%m-%d') + timedelta(days=1)
+    except ValueError:
+        flash('Dates must be in YYYY-MM-DD format', 'warning')
+        created = {}
+        filters['date_from'] = filters['date_to'] = ''
+    if created:
+        query['created_at'] = created
+    return query, filters
+
+
+def encode_order_cursor(order):
+    import base64
+    import json
+    key = {'t': order['created_at'].isoformat(), 'id': str(order['_id'])}
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def order_keyset_filter(cursor):
+    """Orders strictly after the cursor in (created_at desc, _id desc) order; None for a malformed cursor"""
+    import base64
+    import binascii
+    import json
+    from datetime import datetime
+    from bson import ObjectId
+    from bson.errors import InvalidId
+    try:
+        key = json.loads(base64.urlsafe_b64decode((cursor + '=' * (-len(cursor) % 4)).encode()))
+        if not isinstance(key, dict):
+            return None
+        created_at, last_id = datetime.fromisoformat(key['t']), ObjectId(key['id'])
+    except (ValueError, TypeError, KeyError, InvalidId, binascii.Error):
+        return None
+    return {'$or': [{'created_at': {'$lt': created_at}},
+                    {'created_at': created_at, '_id': {'$lt': last_id}}]}
+
+
+@app.route('/admin/orders')
+@admin_required
+def admin_orders():
+    """All orders, filterable by status, date range and customer, newest first"""
+    query, filters = parse_order_filters(request.args)
+    cursor = request.args.get('cursor')
+    page_query = query
+    if cursor:
+        keyset = order_keyset_filter(cursor)
+        if keyset is None:
+            flash('That page link is no longer valid; showing the first page', 'warning')
+        else:
+            page_query = {'$and': [query, keyset]}
+    orders = models.orders.find(page_query, {'items': 0, 'shipping_address': 0},
+                                sort=[('created_at', -1), ('_id', -1)], limit=ADMIN_ORDERS_PAGE_SIZE + 1)
+    has_more = len(orders) > ADMIN_ORDERS_PAGE_SIZE
+    orders = orders[:ADMIN_ORDERS_PAGE_SIZE]
+    next_cursor = encode_order_cursor(orders[-1]) if has_more else None
+    return render_template('admin_orders.html', orders=orders, filters=filters,
+                           statuses=ORDER_STATUSES, next_cursor=next_cursor,
+                           hide_shopping_nav=True)
+
+
+@app.route('/admin/profiles')
+@admin_required
+def admin_profiles():
+    """Recently captured request profiles"""
+    return render_template('admin_profiles.html', profiles=profiling.recent_profiles(mongo.db),
+                           sample_rate=app.config.get('PROFILE_SAMPLE_RATE', 0), hide_shopping_nav=True)
+
+
+@app.route('/admin/profiles/<profile_id>.<any(pstats, collapsed):kind>')
+@admin_required
+def admin_download_profile(profile_id, kind):
+    """Download a profile as pstats or collapsed stacks"""
+    oid = models.to_object_id(profile_id)
+    found = oid and profiling.profile_file(mongo.db, oid, kind)
+    if not found:
+        abort(404)
+    data, filename = found
+    mimetype = 'application/octet-stream' if kind == 'pstats' else 'text/plain'
+    return Response(data, mimetype=mimetype,
+                    headers={'Content-Disposition': 'attachment; filename="{}"'.format(filename)})
+
+
+@app.route('/admin/orders/status', methods=['POST'])
+@admin_required
+def admin_update_order_status():
+    """Set the status of the selected orders in one bulk write"""
+    status = request.form.get('status', '')
+    order_ids = [oid for oid in request.form.getlist('order_ids') if models.to_object_id(oid)]
+    if status not in ORDER_STATUSES or not order_ids:
+        flash('Select at least one order and a valid status', 'warning')
+        return redirect(request.referrer or url_for('admin_orders'))
+    modified = models.orders.set_status_many(order_ids, status)
+    flash('Marked {} order(s) as {}'.format(modified, status), 'success')
+    return redirect(request.referrer or url_for('admin_orders'))
+
+
+@app.route('/admin/orders/export.csv')
+@admin_required
+def admin_export_orders():
+    """Stream the filtered orders as CSV, one cursor batch at a time"""
+    import csv
+    import io
+    query, _ = parse_order_filters(request.args)
+    projection = {'items.quantity': 1, 'total_amount': 1, 'status': 1, 'user_id': 1,
+                  'created_at': 1, 'shipping_name': 1, 'shipping_email': 1, 'shipping_city': 1,
+                  'shipping_postal_code': 1, 'shipping_country': 1}
+    # Raw documents straight off the cursor: no record per row for a bulk export
+    cursor = models.orders.collection.find(query, projection, sort=[('created_at', -1), ('_id', -1)],
+                                           batch_size=CSV_EXPORT_BATCH, no_cursor_timeout=True)
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_COLUMNS)
+        try:
+            for count, order in enumerate(cursor, 1):
+                created = order.get('created_at')
+                writer.writerow((
+                    str(order['_id']),
+                    created.isoformat() if created else '',
+                    order.get('status', ''),
+                    order.get('user_id', ''),
+                    order.get('shipping_name', ''),
+                    order.get('shipping_email', ''),
+                    order.get('shipping_city', ''),
+                    order.get('shipping_postal_code', ''),
+                    order.get('shipping_country', ''),
+                    sum(item.get('quantity', 0) for item in order.get('items', [])),
+                    order.get('total_amount', 0),
+                ))
+                # Flush roughly one cursor batch per chunk so memory stays flat
+                if count % CSV_EXPORT_BATCH == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+        finally:
+            cursor.close()
+
+    from datetime import datetime
+    filename = 'orders-{}.csv'.format(datetime.utcnow().strftime('%Y%m%d-%H%M%S'))
+    return Response(stream_with_context(generate()), mimetype='text/csv',
+                    headers={'Content-Disposition': 'attachment; filename=' + filename,
+                             'Cache-Control': 'no-store'})
+
+# ==================== API ====================
+# Registered after the view helpers it reuses (build_product_query) are defined
+from backend.api import api as api_blueprint
+app.register_blueprint(api_blueprint)
+
 # ==================== ERROR HANDLERS ====================
 @app.errorhandler(404)
 def not_found_error(error):
@@ -944,14 +1315,27 @@ def internal_error(error):
 
 def inject_cart_count():
     """Inject cart item count and categories into all templates (MongoDB)"""
-    all_categories = list(mongo.db.categories.find())
-    cart_count = 0
+    if resilience.degraded():
+        # Nothing here may wait on the database: in-memory categories, session cart only
+        return dict(cart_count=sum(stale_cart_quantities().values()), wishlist_count=0,
+                    all_categories=catalog.categories(), hide_shopping_nav=False,
+                    catalog_stale=g.get('catalog_stale'))
+    all_categories = list_categories()
     wishlist_count = 0
+    cart_count = current_cart_count()
     if current_user.is_authenticated:
-        cart_items = list(mongo.db.cart.find({'user_id': str(current_user.id)}))
-        cart_count = sum(item.get('quantity', 1) for item in cart_items)
-        wishlist_count = mongo.db.wishlist.count_documents({'user_id': str(current_user.id)})
-    return dict(cart_count=cart_count, wishlist_count=wishlist_count, all_categories=all_categories, hide_shopping_nav=False)
+        wishlist_count = len(models.wishlists.product_ids(str(current_user.id)))
+    return dict(cart_count=cart_count, wishlist_count=wishlist_count, all_categories=all_categories, hide_shopping_nav=False,
+                catalog_stale=None)
+
+
+# ==================== STARTUP ====================
+# Ensure baseline data and indexes on import (gunicorn); data migrations are
+# the `flask migrate-data` command (backend/models.py)
+with app.app_context():
+    seed_if_empty()
+    create_default_admin()
+    ensure_indexes()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,128 @@
+"""
+Order archival tier.
+
+Settled orders (delivered or cancelled) created more than
+ORDER_ARCHIVE_AFTER_DAYS ago are moved out of `orders` into `orders_archive`,
+one document per user and month:
+
+    {user_id: '...', month: <first of the month>, order_ids: [...], count: 7,
+     data: <zlib-compressed BSON of the month's orders>, updated_at: ...}
+
+so `orders` and its indexes only hold recent and still-open orders. The order
+reads in backend/models.py fall back to the archive: a single order is found
+through the `order_ids` index and a user's history merges the user's batches.
+The admin order list and CSV export, search popularity and recommendations
+read the hot collection only, i.e. the last ORDER_ARCHIVE_AFTER_DAYS.
+
+Each chunk is written to the archive before it is deleted from `orders`; a
+batch is read, merged by order _id and rewritten, so an interrupted run is
+simply repeated. Orders are never archived past the sales rollup high-water
+mark, so nothing is archived before `rollup-sales` has run once. The cutoff
+falls on a SALES_ROLLUP_TIMEZONE day boundary (recorded in
+`meta._id='order_archive'`), which is where `rollup-sales --rebuild` starts.
+
+Run from cron, e.g. nightly:
+
+    flask --app backend.app archive-orders
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from backend.models import pack_orders, unpack_orders
+from backend.rollups import bucket_floor
+
+ARCHIVE_COLLECTION = 'orders_archive'
+FINAL_STATUSES = ('delivered', 'cancelled')
+
+
+def month_start(moment):
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def archive_cutoff(db, older_than_days, tz_name, now):
+    """Archive orders created before this, or None while the sales rollups have never run"""
+    rollup = db.meta.find_one({'_id': 'sales_rollup'}, {'through': 1})
+    if not rollup or not rollup.get('through'):
+        return None
+    # The rollups must have counted an order before it leaves `orders`
+    cutoff = bucket_floor(now - timedelta(days=older_than_days), 'day', tz_name)
+    return min(cutoff, bucket_floor(rollup['through'], 'day', tz_name))
+
+
+def ensure_archive_indexes(db):
+    db[ARCHIVE_COLLECTION].create_index([('user_id', 1), ('month', -1)], unique=True)
+    db[ARCHIVE_COLLECTION].create_index([('order_ids', 1)])
+
+
+def merge_batch(db, user_id, month, docs, now):
+    """Add order docs to the (user, month) batch, replacing orders already in it"""
+    batch = db[ARCHIVE_COLLECTION].find_one({'user_id': user_id, 'month': month}, {'data': 1})
+    by_id = {doc['_id']: doc for doc in unpack_orders(batch['data'])} if batch else {}
+    by_id.update((doc['_id'], doc) for doc in docs)
+    orders = sorted(by_id.values(), key=lambda doc: (doc['created_at'], doc['_id']), reverse=True)
+    db[ARCHIVE_COLLECTION].update_one({'user_id': user_id, 'month': month}, {'$set': {
+        'order_ids': [doc['_id'] for doc in orders],
+        'count': len(orders),
+        'data': pack_orders(orders),
+        'updated_at': now,
+    }}, upsert=True)
+
+
+def archive_orders(db, older_than_days=180, tz_name='UTC', chunk_size=500, now=None):
+    """Move settled orders created before the cutoff into the archive; returns (moved, cutoff)"""
+    now = now or datetime.utcnow()
+    cutoff = archive_cutoff(db, older_than_days, tz_name, now)
+    if cutoff is None:
+        return 0, None
+    ensure_archive_indexes(db)
+    # Served by the (status, created_at) index
+    query = {'status': {'$in': list(FINAL_STATUSES)}, 'created_at': {'$lt': cutoff}}
+    moved = 0
+    while True:
+        chunk = list(db.orders.find(query, limit=chunk_size))
+        if not chunk:
+            break
+        batches = defaultdict(list)
+        for doc in chunk:
+            batches[(doc['user_id'], month_start(doc['created_at']))].append(doc)
+        for (user_id, month), docs in batches.items():
+            merge_batch(db, user_id, month, docs, now)
+        # Re-checking the filter keeps an order whose status changed meanwhile in the hot tier
+        moved += db.orders.delete_many(dict(query, _id={'$in': [doc['_id'] for doc in chunk]})).deleted_count
+    db.meta.update_one({'_id': 'order_archive'},
+                       {'$max': {'through': cutoff}, '$set': {'updated_at': now}}, upsert=True)
+    return moved, cutoff
+
+
+def hot_tier_stats(db):
+    """Size of `orders` and its indexes in bytes, to compare with the server's cache size"""
+    stats = db.command('collStats', 'orders')
+    return {'count': stats.get('count', 0), 'size': stats.get('size', 0),
+            'index_size': stats.get('totalIndexSize', 0)}
+
+
+def init_app(app, mongo):
+    """Register the `flask archive-orders` command"""
+    import click
+    from pymongo.errors import PyMongoError
+
+    @app.cli.command('archive-orders')
+    @click.option('--older-than-days', type=int, default=None,
+                  help='Archive settled orders older than this (default ORDER_ARCHIVE_AFTER_DAYS)')
+    def archive_orders_command(older_than_days):
+        """Move old delivered/cancelled orders into the compressed archive."""
+        days = older_than_days if older_than_days is not None else app.config.get('ORDER_ARCHIVE_AFTER_DAYS', 180)
+        moved, cutoff = archive_orders(mongo.db, older_than_days=days,
+                                       tz_name=app.config.get('SALES_ROLLUP_TIMEZONE', 'UTC'),
+                                       chunk_size=app.config.get('ORDER_ARCHIVE_CHUNK_SIZE', 500))
+        if cutoff is None:
+            click.echo('Sales rollups have not run yet; run `flask rollup-sales` before archiving')
+            return
+        click.echo('Archived {} orders created before {}'.format(moved, cutoff.isoformat()))
+        try:
+            stats = hot_tier_stats(mongo.db)
+        except PyMongoError:
+            return
+        click.echo('Hot orders: {} documents, {:.1f} MB data, {:.1f} MB indexes'.format(
+            stats['count'], stats['size'] / 1e6, stats['index_size'] / 1e6))
@@ -0,0 +1,126 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+
+# ==================== CATALOG VERSION ====================
+class CatalogVersion:
+    """Catalog version counter stored in Mongo (`meta` collection, _id 'catalog').
+
+    Admin product writes bump it; every worker re-reads it at most once per
+    check_interval seconds, so all gunicorn workers drop stale catalog reads
+    within that window without a separate cache server.
+    """
+
+    def __init__(self, check_interval=2.0):
+        self.check_interval = check_interval
+        self.mongo = None
+        self._value = 0
+        self._checked_at = float('-inf')
+        self._lock = threading.Lock()
+
+    def current(self):
+        now = time.monotonic()
+        if self.mongo is None or now - self._checked_at < self.check_interval:
+            return self._value
+        with self._lock:
+            if now - self._checked_at >= self.check_interval:
+                doc = self.mongo.db.meta.find_one({'_id': 'catalog'}, {'version': 1})
+                self._value = doc.get('version', 0) if doc else 0
+                self._checked_at = now
+        return self._value
+
+    def bump(self):
+        """Invalidate catalog reads in every worker; call after product/category writes"""
+        from pymongo import ReturnDocument
+        doc = self.mongo.db.meta.find_one_and_update(
+            {'_id': 'catalog'}, {'$inc': {'version': 1}},
+            upsert=True, return_document=ReturnDocument.AFTER)
+        with self._lock:
+            self._value = doc['version']
+            self._checked_at = time.monotonic()
+        return self._value
+
+
+catalog_version = CatalogVersion()
+
+
+# ==================== MEMOIZATION ====================
+class _Flight:
+    """A read in progress that concurrent callers for the same key wait on"""
+    __slots__ = ('event', 'value', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class MemoizedRead:
+    """Bounded LRU + TTL cache around a read function with single-flight misses"""
+
+    def __init__(self, func, maxsize, ttl, versioned):
+        self.func = func
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.versioned = versioned
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        wraps(func)(self)
+
+    def __call__(self, *args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items()))) if kwargs else args
+        version = catalog_version.current() if self.versioned else None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic() and entry[2] == version:
+                self._entries.move_to_end(key)
+                return copy.deepcopy(entry[0])
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return copy.deepcopy(flight.value)
+
+        try:
+            value = self.func(*args, **kwargs)
+            flight.value = value
+            with self._lock:
+                self._entries[key] = (value, time.monotonic() + self.ttl, version)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+        return copy.deepcopy(value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def memoize(maxsize=128, ttl=60, versioned=True):
+    """Memoize a read. Callers get deep copies, so they may decorate the results.
+
+    versioned=True also drops entries whenever the catalog version changes.
+    """
+    def decorator(func):
+        return MemoizedRead(func, maxsize, ttl, versioned)
+    return decorator
+
+
+def init_app(app, mongo):
+    catalog_version.mongo = mongo
+    catalog_version.check_interval = app.config.get('CATALOG_VERSION_CHECK_SECONDS', 2.0)
@@ -0,0 +1,265 @@
+"""
+In-process columnar catalog.
+
+Every worker holds the whole catalog: the category and product documents plus
+NumPy columns over the products, one row per product in natural order:
+
+    price        float64         NaN where missing or not a number
+    category     int32           code into category_keys (-1: no category)
+    created_at   datetime64[ms]  NaT where missing
+    ids          str             the product id of each row
+
+The /categories listing runs on these columns: category, price and search
+filters are boolean masks, the price sorts (and sort=newest, on created_at) a
+stable argsort, the slider range a nanmin/nanmax and the per-category counts a
+bincount. Only the rows of the requested page are hydrated into Product
+records, so listing latency does not depend on Mongo at all. Search is a
+case-insensitive substring match over name and description, never a regex:
+it runs in the worker with no time limit, so a user-supplied pattern could
+backtrack for seconds. build_product_query(), behind /api/products, escapes
+the search the same way. Its masks are cached per query string.
+
+The catalog is re-read from Mongo when the catalog version moves (admin writes
+bump it) and written to CATALOG_SNAPSHOT_PATH. While the database is
+unavailable it is the last good snapshot that backend/resilience.py serves
+the catalog pages from, and a worker started during an outage loads it from
+disk.
+"""
+
+import os
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+
+import bson
+import numpy as np
+
+from backend import models
+from backend.cache import catalog_version
+
+SEARCH_CACHE_SIZE = 256
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class CatalogColumns:
+    """Immutable columnar view of one version of the catalog"""
+
+    def __init__(self, categories, products):
+        self.category_docs = categories
+        self.docs = products
+        self.ids = np.array([str(doc['_id']) for doc in products], dtype=str)
+        self.row_of = {product_id: row for row, product_id in enumerate(self.ids.tolist())}
+        # Codes for every category id a product references, listed categories first
+        self.category_keys = [cat['_id'] for cat in categories]
+        code_of = {str(key): code for code, key in enumerate(self.category_keys)}
+        codes = []
+        for doc in products:
+            key = doc.get('category_id')
+            if key is None:
+                codes.append(-1)
+                continue
+            if str(key) not in code_of:
+                code_of[str(key)] = len(self.category_keys)
+                self.category_keys.append(key)
+            codes.append(code_of[str(key)])
+        self.code_of = code_of
+        self.category = np.array(codes, dtype=np.int32)
+        self.price = np.array([doc['price'] if is_number(doc.get('price')) else np.nan for doc in products],
+                              dtype=np.float64)
+        # BSON sort order of the price field: missing/null < numbers < anything else
+        self.price_rank = np.array([1 if is_number(doc.get('price')) else 0 if doc.get('price') is None else 2
+                                    for doc in products], dtype=np.int8)
+        self.created_at = np.array([doc.get('created_at') if isinstance(doc.get('created_at'), datetime)
+                                    else None for doc in products], dtype='datetime64[ms]')
+        # Name and description, case-folded for the literal search
+        self._texts = [((doc.get('name') or '') + '\n' + (doc.get('description') or '')).casefold()
+                       for doc in products]
+        self._search_masks = OrderedDict()
+        self._search_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.docs)
+
+    # ---- filters ----
+    def search_mask(self, search_query):
+        with self._search_lock:
+            mask = self._search_masks.get(search_query)
+            if mask is not None:
+                self._search_masks.move_to_end(search_query)
+                return mask
+        needle = search_query.casefold()
+        mask = np.fromiter((needle in text for text in self._texts), dtype=bool, count=len(self.docs))
+        with self._search_lock:
+            self._search_masks[search_query] = mask
+            while len(self._search_masks) > SEARCH_CACHE_SIZE:
+                self._search_masks.popitem(last=False)
+        return mask
+
+    def select(self, category_id=None, search_query='', price_min=None, price_max=None):
+        """Row numbers matching the build_product_query() filters, in natural order"""
+        mask = np.ones(len(self.docs), dtype=bool)
+        if category_id:
+            mask &= self.category == self.code_of.get(str(category_id), -2)
+        if price_min is not None:
+            mask &= self.price >= price_min  # NaN compares False, as a missing price does in Mongo
+        if price_max is not None:
+            mask &= self.price <= price_max
+        if search_query and mask.any():
+            mask &= self.search_mask(search_query)
+        return np.flatnonzero(mask)
+
+    def order(self, rows, sort_by):
+        """rows in the listing order; ties keep natural order"""
+        if sort_by in ('low_to_high', 'high_to_low'):
+            prices = np.nan_to_num(self.price[rows], nan=0.0)
+            ranks = self.price_rank[rows]
+            if sort_by == 'high_to_low':
+                prices, ranks = -prices, -ranks
+            return rows[np.lexsort((prices, ranks))]
+        if sort_by == 'newest':
+            created_at = self.created_at[rows]
+            # Undated products last; +1 keeps the negation from overflowing
+            keys = np.where(np.isnat(created_at), np.iinfo(np.int64).min + 1, created_at.astype(np.int64))
+            return rows[np.argsort(-keys, kind='stable')]
+        return rows
+
+    # ---- aggregates ----
+    def category_counts(self):
+        """{category id as stored: product count}"""
+        coded = self.category[self.category >= 0]
+        counts = np.bincount(coded, minlength=len(self.category_keys))
+        return {key: int(count) for key, count in zip(self.category_keys, counts.tolist()) if count}
+
+    def price_range(self):
+        if not np.isfinite(self.price).any():
+            return 0, 10000
+        return int(np.nanmin(self.price)), int(np.nanmax(self.price))
+
+    # ---- hydration ----
+    def hydrate(self, rows):
+        return [models.Product.from_doc(self.docs[row]) for row in rows.tolist()]
+
+
+EMPTY = CatalogColumns([], [])
+
+
+class CatalogEngine:
+    """This worker's catalog: the current CatalogColumns, re-read when the catalog version moves"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.version = None
+        self.taken_at = None
+        self.columns = EMPTY
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def available(self):
+        return self.taken_at is not None
+
+    def _install(self, version, taken_at, categories, products):
+        self.columns = CatalogColumns(categories, products)
+        self.version = version
+        self.taken_at = taken_at
+
+    def refresh_if_stale(self, db):
+        """Re-read the catalog if its version moved on; one thread per worker does it"""
+        version = catalog_version.current()
+        if version == self.version:
+            return
+        # Other threads keep using the previous columns meanwhile, once there are any
+        if not self._refresh_lock.acquire(blocking=not self.available):
+            return
+        try:
+            if version == self.version:
+                return
+            with models.query_budget():
+                categories = list(db.categories.find())
+            with models.query_budget():
+                products = list(db.products.find())
+            self._install(version, datetime.utcnow(), categories, products)
+            self.save()
+        finally:
+            self._refresh_lock.release()
+
+    def save(self):
+        if not self.path:
+            return
+        columns = self.columns
+        data = zlib.compress(bson.encode({'version': self.version, 'taken_at': self.taken_at,
+                                          'categories': columns.category_docs, 'products': columns.docs}), 6)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.snapshot-', dir=os.path.dirname(self.path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        """Adopt the snapshot file written by any worker, if there is one"""
+        try:
+            with open(self.path, 'rb') as f:
+                doc = bson.decode(zlib.decompress(f.read()))
+        except (OSError, TypeError, zlib.error, bson.errors.BSONError):
+            return False
+        # version None: the first successful request re-reads the catalog
+        self._install(None, doc['taken_at'], doc['categories'], doc['products'])
+        return True
+
+    # ---- reads, as fresh records the views may decorate ----
+    def categories(self, limit=0):
+        docs = self.columns.category_docs
+        return [models.Category.from_doc(doc) for doc in (docs[:limit] if limit else docs)]
+
+    def category(self, category_id):
+        return next((cat for cat in self.categories() if cat.id == models.to_id(category_id)), None)
+
+    def product(self, product_id):
+        columns = self.columns
+        row = columns.row_of.get(str(product_id))
+        return models.Product.from_doc(columns.docs[row]) if row is not None else None
+
+    def products(self, limit=0):
+        columns = self.columns
+        return columns.hydrate(np.arange(min(limit, len(columns)) if limit else len(columns)))
+
+    def attach_categories(self, products):
+        category_map = {cat.id: cat for cat in self.categories()}
+        for prod in products:
+            prod['category'] = category_map.get(models.to_id(prod.get('category_id')), {})
+        return products
+
+    def category_counts(self):
+        return self.columns.category_counts()
+
+    def price_range(self):
+        return self.columns.price_range()
+
+    def listing(self, category_id=None, search_query='', price_min=None, price_max=None, sort_by='',
+                skip=0, limit=0):
+        """(page of products, total) with the filters and sorts of build_product_query(), plus sort=newest"""
+        columns = self.columns
+        rows = columns.select(category_id, search_query, price_min, price_max)
+        rows = columns.order(rows, sort_by)
+        page = rows[skip:skip + limit] if limit else rows[skip:]
+        return columns.hydrate(page), len(rows)
+
+    def related(self, product, limit=4):
+        columns = self.columns
+        code = columns.code_of.get(str(product.get('category_id')), -2)
+        rows = np.flatnonzero((columns.category == code) & (columns.ids != product.id))
+        return columns.hydrate(rows[:limit])
+
+
+catalog = CatalogEngine()
+
+
+def init_app(app, mongo):
+    """Point the catalog at its snapshot file and adopt it until the first refresh"""
+    catalog.path = app.config.get('CATALOG_SNAPSHOT_PATH')
+    if catalog.path:
+        catalog.load()
@@ -0,0 +1,194 @@
+import zlib
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+DEFAULT_MIMETYPES = ('text/html', 'application/json', 'text/plain', 'text/csv',
+                     'text/xml', 'application/xml')
+
+
+# ==================== ENCODERS ====================
+class GzipEncoder:
+    name = 'gzip'
+
+    def __init__(self, level):
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def chunk(self, data):
+        # Sync flush so every streamed chunk reaches the client right away
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._obj.flush()
+
+
+class BrotliEncoder:
+    name = 'br'
+
+    def __init__(self, quality):
+        self._obj = brotli.Compressor(quality=quality)
+
+    def chunk(self, data):
+        return self._obj.process(data) + self._obj.flush()
+
+    def finish(self):
+        return self._obj.finish()
+
+
+def parse_accept_encoding(header):
+    """Map of coding -> q value from an Accept-Encoding header"""
+    accepted = {}
+    for part in header.split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token] = q
+    return accepted
+
+
+# ==================== MIDDLEWARE ====================
+class CompressionMiddleware:
+    """Negotiate gzip/brotli for dynamic responses.
+
+    Responses with a known Content-Length are compressed in one shot when they
+    reach min_size. Streamed responses (no Content-Length) are compressed chunk
+    by chunk with a sync flush so they still stream. Anything else - static
+    files served through wsgi.file_wrapper, disallowed content types, already
+    encoded bodies - is passed through untouched. Every response of a
+    compressible type carries Vary: Accept-Encoding, compressed or not.
+    """
+
+    def __init__(self, wsgi_app, min_size=500, level=6, brotli_quality=4, mimetypes=DEFAULT_MIMETYPES):
+        self.wsgi_app = wsgi_app
+        self.min_size = min_size
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.mimetypes = frozenset(mimetypes)
+
+    def negotiate(self, header):
+        accepted = parse_accept_encoding(header or '')
+        wildcard = accepted.get('*', 0.0)
+        if brotli is not None and accepted.get('br', wildcard) > 0:
+            return 'br'
+        if accepted.get('gzip', wildcard) > 0:
+            return 'gzip'
+        return None
+
+    def encoder(self, coding):
+        if coding == 'br':
+            return BrotliEncoder(self.brotli_quality)
+        return GzipEncoder(self.level)
+
+    def negotiable(self, headers):
+        """Whether the body of this response depends on Accept-Encoding"""
+        lowered = {key.lower(): value for key, value in headers}
+        if 'content-encoding' in lowered:
+            return False
+        mimetype = lowered.get('content-type', '').split(';', 1)[0].strip().lower()
+        return mimetype in self.mimetypes
+
+    def compressible(self, status, headers):
+        code = int(status.split(' ', 1)[0])
+        if code < 200 or code in (204, 206, 304):
+            return False
+        if not self.negotiable(headers):
+            return False
+        lowered = {key.lower(): value for key, value in headers}
+        if 'content-range' in lowered:
+            return False
+        if 'no-transform' in lowered.get('cache-control', ''):
+            return False
+        length = lowered.get('content-length')
+        return length is None or int(length) >= self.min_size
+
+    @staticmethod
+    def vary_on_encoding(headers):
+        """headers with Accept-Encoding merged into Vary"""
+        vary = [value for key, value in headers if key.lower() == 'vary']
+        tokens = {token.strip().lower() for value in vary for token in value.split(',')}
+        if 'accept-encoding' in tokens or '*' in tokens:
+            return headers
+        vary.append('Accept-Encoding')
+        return [(key, value) for key, value in headers if key.lower() != 'vary'] + [('Vary', ', '.join(vary))]
+
+    def __call__(self, environ, start_response):
+        coding = self.negotiate(environ.get('HTTP_ACCEPT_ENCODING'))
+        if environ.get('REQUEST_METHOD') == 'HEAD':
+            coding = None
+
+        captured = []
+
+        def capture(status, headers, exc_info=None):
+            captured[:] = [status, headers, exc_info]
+            return lambda data: None  # legacy write() is not used by Flask
+
+        app_iter = self.wsgi_app(environ, capture)
+        if not captured:
+            # Defensive: Flask always starts the response before returning
+            app_iter = self._buffer(app_iter)
+        status, headers, exc_info = captured
+        # Every variant says it varies, or a shared cache hands one client's encoding to all
+        if self.negotiable(headers):
+            headers = self.vary_on_encoding(headers)
+        if coding is None or not self.compressible(status, headers):
+            start_response(status, headers, exc_info)
+            return app_iter
+        return self._compress(app_iter, coding, status, headers, exc_info, start_response)
+
+    @staticmethod
+    def _buffer(app_iter):
+        try:
+            return [b''.join(app_iter)]
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+    def _compress(self, app_iter, coding, status, headers, exc_info, start_response):
+        encoder = self.encoder(coding)
+        has_length = any(key.lower() == 'content-length' for key, _ in headers)
+        new_headers = []
+        for key, value in headers:
+            lower = key.lower()
+            if lower == 'content-length':
+                continue
+            if lower == 'etag' and not value.startswith('W/'):
+                value = 'W/' + value
+            new_headers.append((key, value))
+        new_headers.append(('Content-Encoding', coding))
+        try:
+            if has_length:
+                body = encoder.chunk(b''.join(app_iter)) + encoder.finish()
+                new_headers.append(('Content-Length', str(len(body))))
+                start_response(status, new_headers, exc_info)
+                yield body
+                return
+            start_response(status, new_headers, exc_info)
+            for data in app_iter:
+                if data:
+                    yield encoder.chunk(data)
+            yield encoder.finish()
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+
+def init_app(app):
+    """Wrap the WSGI app with response compression when COMPRESSION_ENABLED is set"""
+    if not app.config.get('COMPRESSION_ENABLED', True):
+        return
+    app.wsgi_app = CompressionMiddleware(
+        app.wsgi_app,
+        min_size=app.config.get('COMPRESSION_MIN_SIZE', 500),
+        level=app.config.get('COMPRESSION_LEVEL', 6),
+        brotli_quality=app.config.get('COMPRESSION_BROTLI_QUALITY', 4),
+        mimetypes=app.config.get('COMPRESSION_MIMETYPES', DEFAULT_MIMETYPES))
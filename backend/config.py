@@ -1,4 +1,6 @@
+import json
 import os
+import tempfile
 
 
 class Config:
@@ -8,3 +10,96 @@ class Config:
     PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
     UPLOAD_FOLDER = os.path.join(PROJECT_ROOT, 'frontend', 'static', 'images')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024
+    # Uploaded images are streamed to disk in chunks of this size (see backend/uploads.py)
+    UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 64 * 1024))
+
+    # Static files: 'flask' (send_from_directory), or served ahead of Flask with
+    # 'sendfile', 'x-accel-redirect' (nginx) or 'x-sendfile' (see backend/static_files.py)
+    STATIC_SERVE_MODE = os.environ.get('STATIC_SERVE_MODE', 'flask')
+    STATIC_ACCEL_PREFIX = os.environ.get('STATIC_ACCEL_PREFIX', '/_static/')
+    STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', 0))
+    STATIC_HOT_CACHE_BYTES = int(os.environ.get('STATIC_HOT_CACHE_BYTES', 32 * 1024 * 1024))
+    STATIC_HOT_FILE_MAX_BYTES = int(os.environ.get('STATIC_HOT_FILE_MAX_BYTES', 256 * 1024))
+
+    # Per-request database instrumentation
+    DB_SERVER_TIMING = os.environ.get('DB_SERVER_TIMING', 'true').lower() == 'true'
+    DB_SLOW_REQUEST_MS = float(os.environ.get('DB_SLOW_REQUEST_MS', 250))
+    DB_SLOW_QUERY_COUNT = int(os.environ.get('DB_SLOW_QUERY_COUNT', 10))
+
+    # Database timeouts and degraded mode (see backend/resilience.py): connect and
+    # server selection limits, per-request and per-query budgets, the circuit breaker
+    # and where the in-memory catalog (backend/catalog_engine.py) is snapshotted to disk
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 3000))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 2000))
+    DB_REQUEST_TIMEOUT_MS = int(os.environ.get('DB_REQUEST_TIMEOUT_MS', 5000))
+    DB_QUERY_TIMEOUT_MS = int(os.environ.get('DB_QUERY_TIMEOUT_MS', 1500))
+    BREAKER_FAILURE_THRESHOLD = int(os.environ.get('BREAKER_FAILURE_THRESHOLD', 5))
+    BREAKER_WINDOW_SECONDS = float(os.environ.get('BREAKER_WINDOW_SECONDS', 10))
+    BREAKER_OPEN_SECONDS = float(os.environ.get('BREAKER_OPEN_SECONDS', 15))
+    BREAKER_PROBE_TIMEOUT_MS = int(os.environ.get('BREAKER_PROBE_TIMEOUT_MS', 500))
+    CATALOG_SNAPSHOT_PATH = os.environ.get('CATALOG_SNAPSHOT_PATH') or os.path.join(tempfile.gettempdir(), 'organic-ecommerce-catalog.snapshot')
+
+    # Request profiling (see backend/profiling.py): admins profile a request with
+    # ?_profile=sample|cprofile; PROFILE_SAMPLE_RATE profiles that fraction of all requests
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    PROFILE_SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL', 0.005))
+    PROFILE_DEFAULT_MODE = os.environ.get('PROFILE_DEFAULT_MODE', 'sample')
+    PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 200))
+
+    # Templates: bytecode cache shared by workers, boot warm-up, optional render timing
+    JINJA_CACHE_DIR = os.environ.get('JINJA_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'organic-ecommerce-jinja')
+    TEMPLATE_WARMUP = os.environ.get('TEMPLATE_WARMUP', 'true').lower() == 'true'
+    TEMPLATE_RENDER_TIMING = os.environ.get('TEMPLATE_RENDER_TIMING', 'false').lower() == 'true'
+
+    # Dynamic response compression (gzip, or brotli when installed)
+    COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', 'true').lower() == 'true'
+    COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 500))
+    COMPRESSION_LEVEL = int(os.environ.get('COMPRESSION_LEVEL', 6))
+    COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 4))
+
+    # Memoized catalog reads: how often each worker re-checks the catalog version
+    CATALOG_VERSION_CHECK_SECONDS = float(os.environ.get('CATALOG_VERSION_CHECK_SECONDS', 2))
+
+    # Guest carts live in the signed session cookie; bound them to keep it small
+    GUEST_CART_MAX_LINES = int(os.environ.get('GUEST_CART_MAX_LINES', 25))
+    GUEST_CART_MAX_QUANTITY = int(os.environ.get('GUEST_CART_MAX_QUANTITY', 50))
+
+    # Concurrent reads within a request (see backend/fanout.py): pool size per worker
+    # and the time budget, from request start, that a view may wait on them
+    FANOUT_MAX_WORKERS = int(os.environ.get('FANOUT_MAX_WORKERS', 8))
+    FANOUT_REQUEST_DEADLINE = float(os.environ.get('FANOUT_REQUEST_DEADLINE', 10))
+
+    # Pre-rendered anonymous catalog pages (see backend/prerender.py)
+    PRERENDER_DIR = os.environ.get('PRERENDER_DIR') or os.path.join(PROJECT_ROOT, 'prerendered')
+    PRERENDER_SERVE = os.environ.get('PRERENDER_SERVE', 'false').lower() == 'true'
+    PRERENDER_LISTING_PAGES = int(os.environ.get('PRERENDER_LISTING_PAGES', 3))
+    PRERENDER_MAX_AGE = int(os.environ.get('PRERENDER_MAX_AGE', 300))
+    PRERENDER_BASE_URL = os.environ.get('PRERENDER_BASE_URL', 'http://localhost:5000')
+
+    # Live cart count / stock updates over SSE (see backend/live.py). Needs an async
+    # worker class (gevent/eventlet): each open stream holds its connection.
+    LIVE_UPDATES_ENABLED = os.environ.get('LIVE_UPDATES_ENABLED', 'false').lower() == 'true'
+    LIVE_STREAM_MAX_SECONDS = int(os.environ.get('LIVE_STREAM_MAX_SECONDS', 300))
+    LIVE_HEARTBEAT_SECONDS = int(os.environ.get('LIVE_HEARTBEAT_SECONDS', 20))
+    LIVE_EVENTS_CAPPED_BYTES = int(os.environ.get('LIVE_EVENTS_CAPPED_BYTES', 4 * 1024 * 1024))
+    LOW_STOCK_THRESHOLD = int(os.environ.get('LOW_STOCK_THRESHOLD', 10))
+
+    # Sales rollups: timezone whose local days the daily buckets follow
+    SALES_ROLLUP_TIMEZONE = os.environ.get('SALES_ROLLUP_TIMEZONE', 'UTC')
+
+    # Order archival (see backend/archive.py): settled orders older than this move to
+    # the compressed per-user/month archive, processed this many orders at a time
+    ORDER_ARCHIVE_AFTER_DAYS = int(os.environ.get('ORDER_ARCHIVE_AFTER_DAYS', 180))
+    ORDER_ARCHIVE_CHUNK_SIZE = int(os.environ.get('ORDER_ARCHIVE_CHUNK_SIZE', 500))
+
+    # Admission control: per-endpoint concurrency caps and per-client token buckets
+    # (see backend/admission.py). Override with a JSON object in ADMISSION_RULES.
+    ADMISSION_RULES = json.loads(os.environ.get('ADMISSION_RULES') or 'null') or {
+        # Search runs on the in-memory catalog: only a per-client rate against scraping
+        'categories?search': {'rate': 2, 'burst': 6},
+        'admin_dashboard': {'concurrency': 1},
+        'checkout': {'rate': 1, 'burst': 5},
+    }
+    ADMISSION_STATE_DIR = os.environ.get('ADMISSION_STATE_DIR') or os.path.join(tempfile.gettempdir(), 'organic-ecommerce-admission')
+    ADMISSION_TRUST_FORWARDED = os.environ.get('ADMISSION_TRUST_FORWARDED', 'false').lower() == 'true'
+    ADMISSION_BUSY_RETRY_AFTER = int(os.environ.get('ADMISSION_BUSY_RETRY_AFTER', 1))
@@ -0,0 +1,112 @@
+"""
+Concurrent fan-out of independent reads within one request.
+
+    counts, page, total = fanout.gather(
+        category_product_counts,
+        lambda: models.products.find(query, limit=12),
+        lambda: models.products.count(query))
+
+Each callable runs on a thread pool shared by the whole worker (at most
+FANOUT_MAX_WORKERS threads) inside a copy of the caller's context, so flask.g,
+the request, the session and the per-request DB stats are the very objects the
+view sees. What the calls share must be thread-safe: the DB stats and the
+models.BatchLoader caches take a lock, and the other per-request values on g are
+computed idempotently (the last writer wins). PyMongo is thread-safe and releases the GIL while it waits on the
+network, so the view waits about as long as the slowest read, not the sum.
+
+* Results come back in argument order.
+* The first exception raised by a call is re-raised in the caller as soon as it
+  happens; calls that have not started yet are cancelled.
+* The wait is bounded by the request deadline (FANOUT_REQUEST_DEADLINE seconds
+  after the request started): past it DeadlineExceeded, a 503, is raised.
+* Single calls, calls made from a pool thread (nested gathers cannot starve the
+  pool) and FANOUT_MAX_WORKERS=0 run inline, one after another.
+* In a profiled request (backend/profiling.py) the pool threads are profiled too.
+
+Resolve current_user before fanning out: flask-login loads it lazily into g.
+"""
+
+import contextvars
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+
+from flask import g, has_request_context
+from werkzeug.exceptions import ServiceUnavailable
+
+from backend import profiling
+
+
+class DeadlineExceeded(ServiceUnavailable):
+    description = 'This page took too long to load, please retry shortly.'
+
+    def __init__(self):
+        super().__init__(retry_after=1)
+
+
+class FanoutPool:
+    """Lazily started executor; created in each worker process on first use"""
+
+    def __init__(self, max_workers=8, deadline=None):
+        self.max_workers = max_workers
+        self.deadline = deadline
+        self._executor = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _mark_pool_thread(self):
+        self._local.in_pool = True
+
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix='fanout',
+                                                        initializer=self._mark_pool_thread)
+        return self._executor
+
+    def remaining(self):
+        """Seconds left before the request deadline, or None without one"""
+        if not has_request_context():
+            return None
+        deadline = g.get('fanout_deadline')
+        return None if deadline is None else deadline - time.monotonic()
+
+    def gather(self, *calls):
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded()
+        if len(calls) < 2 or self.max_workers <= 0 or getattr(self._local, 'in_pool', False):
+            return [call() for call in calls]
+        executor = self.executor()
+        # A context may only be entered by one thread at a time, so each call gets its own copy
+        futures = [executor.submit(contextvars.copy_context().run, profiling.run_call, call) for call in calls]
+        done, pending = wait(futures, timeout=remaining, return_when=FIRST_EXCEPTION)
+        for future in pending:
+            future.cancel()
+        for future in futures:
+            if future in done and future.exception() is not None:
+                raise future.exception()
+        if pending:
+            raise DeadlineExceeded()
+        return [future.result() for future in futures]
+
+
+pool = FanoutPool()
+
+
+def gather(*calls):
+    """Run independent zero-argument callables concurrently and return their results in order"""
+    return pool.gather(*calls)
+
+
+def init_app(app):
+    """Size the shared pool and start each request's fan-out deadline clock"""
+    pool.max_workers = app.config.get('FANOUT_MAX_WORKERS', 8)
+    pool.deadline = app.config.get('FANOUT_REQUEST_DEADLINE') or None
+
+    @app.before_request
+    def start_fanout_deadline():
+        if pool.deadline:
+            g.fanout_deadline = time.monotonic() + pool.deadline
@@ -25,11 +25,8 @@ class RegistrationForm(FlaskForm):
     
     def validate_email(self, email):
         """Check if email already exists (MongoDB)"""
-        try:
-            from backend.app import mongo
-        except ImportError:
-            mongo = None
-        user = mongo.db.users.find_one({'email': email.data}) if mongo else None
+        from backend import models
+        user = models.users.by_email(email.data) if models.users.mongo else None
         if user:
             raise ValidationError('Email already registered. Please use a different email or login.')
 
@@ -93,6 +90,9 @@ class ProductForm(FlaskForm):
         DataRequired(message='Stock quantity is required'),
         NumberRange(min=0, message='Stock cannot be negative')
     ])
+    unit = SelectField('Unit', choices=[('kg', 'kg'), ('g', 'g'), ('litre', 'litre'), ('ml', 'ml'),
+                                        ('piece', 'piece'), ('dozen', 'dozen'), ('pack', 'pack')],
+                       default='kg')
     category_id = SelectField('Category', coerce=str, validators=[
         DataRequired(message='Please select a category')
     ])
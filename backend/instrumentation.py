@@ -0,0 +1,126 @@
+import threading
+
+from flask import g, has_request_context, request
+from pymongo import monitoring
+
+
+# ==================== COMMAND SHAPE ====================
+def redact(value):
+    """Replace literal values in a command with '?' while keeping its shape"""
+    if isinstance(value, dict):
+        return {key: redact(val) for key, val in value.items()}
+    if isinstance(value, (list, tuple)):
+        # Keep pipeline stages and $or branches; collapse $in-style literal lists
+        if any(isinstance(val, dict) for val in value):
+            return [redact(val) for val in value]
+        return ['?']
+    return '?'
+
+
+def command_shape(event):
+    """Redacted, log-safe summary of a started command"""
+    command = event.command
+    name = event.command_name
+    collection = command.get(name) if isinstance(command.get(name), str) else None
+    shape = {'command': name, 'collection': collection}
+    for key in ('filter', 'query', 'pipeline', 'sort', 'q'):
+        if key in command:
+            shape[key] = redact(command[key])
+    if name in ('update', 'delete') and 'updates' in command:
+        shape['updates'] = redact(command['updates'])
+    return shape
+
+
+# ==================== PER-REQUEST STATS ====================
+class RequestDBStats:
+    """Mongo round trips attributed to a single Flask request"""
+
+    def __init__(self):
+        self.count = 0
+        self.failed = 0
+        self.total_ms = 0.0
+        self.slowest_ms = 0.0
+        self.slowest_shape = None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        with self._lock:
+            self._pending[event.request_id] = command_shape(event)
+
+    def finished(self, event, failed=False):
+        duration_ms = event.duration_micros / 1000.0
+        with self._lock:
+            shape = self._pending.pop(event.request_id, None)
+            self.count += 1
+            self.total_ms += duration_ms
+            if failed:
+                self.failed += 1
+            if duration_ms >= self.slowest_ms:
+                self.slowest_ms = duration_ms
+                self.slowest_shape = shape
+
+    def server_timing(self):
+        """Value for the Server-Timing response header"""
+        return 'db;dur={:.2f};desc="{} queries", db-slowest;dur={:.2f}'.format(
+            self.total_ms, self.count, self.slowest_ms)
+
+
+def current_stats():
+    """Stats object for the active request, or None outside a request"""
+    if not has_request_context():
+        return None
+    return g.get('db_stats')
+
+
+class RequestCommandListener(monitoring.CommandListener):
+    """PyMongo command listener that feeds the active request's stats.
+
+    PyMongo calls command listeners synchronously on the thread that issued
+    the command, so the Flask request context is available here.
+    """
+
+    def started(self, event):
+        stats = current_stats()
+        if stats is not None:
+            stats.started(event)
+
+    def succeeded(self, event):
+        stats = current_stats()
+        if stats is not None:
+            stats.finished(event)
+
+    def failed(self, event):
+        stats = current_stats()
+        if stats is not None:
+            stats.finished(event, failed=True)
+
+
+command_listener = RequestCommandListener()
+
+
+# ==================== FLASK HOOKS ====================
+def init_app(app):
+    """Attach per-request DB stats, Server-Timing headers and the slow-request log"""
+
+    @app.before_request
+    def start_db_stats():
+        g.db_stats = RequestDBStats()
+
+    @app.after_request
+    def emit_db_stats(response):
+        stats = g.get('db_stats')
+        if stats is None:
+            return response
+        if app.config.get('DB_SERVER_TIMING', True):
+            response.headers.add('Server-Timing', stats.server_timing())
+        slow_ms = app.config.get('DB_SLOW_REQUEST_MS')
+        max_queries = app.config.get('DB_SLOW_QUERY_COUNT')
+        too_slow = slow_ms is not None and stats.total_ms >= slow_ms
+        too_many = max_queries is not None and stats.count >= max_queries
+        if too_slow or too_many:
+            app.logger.warning(
+                'slow db request %s %s endpoint=%s queries=%d failed=%d db_ms=%.2f slowest_ms=%.2f slowest=%r',
+                request.method, request.path, request.endpoint, stats.count, stats.failed,
+                stats.total_ms, stats.slowest_ms, stats.slowest_shape)
+        return response
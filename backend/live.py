@@ -0,0 +1,243 @@
+"""
+Live cart and stock updates over Server-Sent Events.
+
+GET /events?products=<id>,<id> holds a text/event-stream open and pushes
+
+    event: cart   data: {"count": 3}                                    every tab of the logged-in user
+    event: stock  data: {"product_id": "...", "stock": 2, "level": "low"}  the listed products
+
+Routes publish after their writes (publish_cart / publish_stock). An event is
+delivered straight to the streams open in the publishing worker and written to
+the capped `live_events` collection. Every worker tails that collection with a
+single background thread (a tailable, awaiting cursor) and hands other
+workers' events to its own streams, so no extra broker is needed.
+
+An open stream is a bounded queue plus one blocked generator, which is cheap
+under an async worker class:
+
+    gunicorn -k gevent --worker-connections 2000 backend.app:app
+
+With sync workers each stream would pin a whole worker, so the feature is off
+unless LIVE_UPDATES_ENABLED is set. Streams close after LIVE_STREAM_MAX_SECONDS
+and the browser's EventSource reconnects, which spreads them across workers.
+Guest carts live in the session cookie and have no server-side identity, so
+guests only get stock events.
+"""
+
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from datetime import datetime
+
+from flask import Response, current_app, request
+from flask_login import current_user
+
+EVENTS_COLLECTION = 'live_events'
+STREAM_QUEUE_SIZE = 64
+MAX_PRODUCTS = 100
+
+
+def stock_level(stock, low_threshold):
+    if not stock or stock <= 0:
+        return 'out'
+    return 'low' if stock <= low_threshold else 'in'
+
+
+class Subscription:
+    __slots__ = ('keys', 'queue')
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.queue = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+
+
+class EventBus:
+    """Fans published events out to the streams open in this worker"""
+
+    def __init__(self):
+        self.mongo = None
+        self.enabled = False
+        self.capped_bytes = 4 * 1024 * 1024
+        self.low_threshold = 10
+        self._collection_ready = False
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._tail_thread = None
+        self._tail_pid = None
+
+    @staticmethod
+    def origin():
+        # Per process, so a forked worker does not skip its parent's events
+        return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+    # ---- publishing ----
+    def publish(self, kind, key, data):
+        if not self.enabled:
+            return
+        self.dispatch(key, kind, data)
+        from pymongo.errors import PyMongoError
+        try:
+            self.ensure_collection()
+            self.mongo.db[EVENTS_COLLECTION].insert_one({
+                'key': key, 'kind': kind, 'data': data, 'origin': self.origin(), 'at': datetime.utcnow()})
+        except PyMongoError:
+            # Best effort: the cart or product write already succeeded
+            current_app.logger.warning('live event %s for %s not published', kind, key, exc_info=True)
+
+    def dispatch(self, key, kind, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(key, ()))
+        for sub in subscribers:
+            try:
+                sub.queue.put_nowait((kind, data))
+            except queue.Full:
+                # A stalled client only misses updates; later ones carry the latest value
+                pass
+
+    # ---- subscribing ----
+    def subscribe(self, keys):
+        self._ensure_tail()
+        sub = Subscription(keys)
+        with self._lock:
+            for key in keys:
+                self._subscribers.setdefault(key, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            for key in sub.keys:
+                subscribers = self._subscribers.get(key)
+                if subscribers:
+                    subscribers.discard(sub)
+                    if not subscribers:
+                        del self._subscribers[key]
+
+    def stream_count(self):
+        with self._lock:
+            return len({sub for subs in self._subscribers.values() for sub in subs})
+
+    # ---- cross-worker delivery ----
+    def ensure_collection(self):
+        """Create the capped collection before the first insert would create a plain one"""
+        if self._collection_ready:
+            return
+        db = self.mongo.db
+        if EVENTS_COLLECTION not in db.list_collection_names():
+            from pymongo.errors import CollectionInvalid
+            try:
+                db.create_collection(EVENTS_COLLECTION, capped=True, size=self.capped_bytes)
+            except CollectionInvalid:
+                pass  # another worker created it first
+        self._collection_ready = True
+
+    def _ensure_tail(self):
+        if self._tail_pid == os.getpid() and self._tail_thread.is_alive():
+            return
+        with self._lock:
+            if self._tail_pid == os.getpid() and self._tail_thread.is_alive():
+                return
+            self._tail_thread = threading.Thread(target=self._tail, name='live-events-tail', daemon=True)
+            self._tail_pid = os.getpid()
+            self._tail_thread.start()
+
+    def _tail(self):
+        from pymongo import CursorType
+        collection = self.mongo.db[EVENTS_COLLECTION]
+        origin = self.origin()
+        last_id = None
+        while True:
+            try:
+                self.ensure_collection()
+                if last_id is None:
+                    newest = list(collection.find({}, {'_id': 1}).sort('$natural', -1).limit(1))
+                    last_id = newest[0]['_id'] if newest else None
+                query = {'_id': {'$gt': last_id}} if last_id is not None else {}
+                cursor = collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT, max_await_time_ms=1000)
+                while cursor.alive:
+                    for doc in cursor:
+                        last_id = doc['_id']
+                        if doc.get('origin') != origin:
+                            self.dispatch(doc['key'], doc['kind'], doc['data'])
+            except Exception:
+                # Collection missing, dropped or the cursor invalidated: start over shortly
+                last_id = None
+            time.sleep(1)
+
+
+bus = EventBus()
+
+
+def publish_cart(user_id, count):
+    """Push a user's new cart count to all their tabs"""
+    bus.publish('cart', 'user:' + user_id, {'count': count})
+
+
+def publish_stock(product_id, old_stock, new_stock):
+    """Push a product's stock when it becomes or stays low, runs out or is restocked"""
+    old_level = stock_level(old_stock, bus.low_threshold)
+    new_level = stock_level(new_stock, bus.low_threshold)
+    if old_level == new_level and (new_level == 'in' or old_stock == new_stock):
+        return
+    bus.publish('stock', 'product:' + product_id,
+                {'product_id': product_id, 'stock': max(new_stock or 0, 0), 'level': new_level})
+
+
+def format_event(kind, data):
+    return 'event: {}\ndata: {}\n\n'.format(kind, json.dumps(data, separators=(',', ':')))
+
+
+def event_stream(sub, initial, heartbeat, max_seconds):
+    try:
+        yield 'retry: 5000\n\n'
+        for kind, data in initial:
+            yield format_event(kind, data)
+        deadline = time.monotonic() + max_seconds
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                kind, data = sub.queue.get(timeout=min(heartbeat, remaining))
+            except queue.Empty:
+                # Comment line: keeps proxies from timing out the idle connection
+                yield ': keepalive\n\n'
+                continue
+            yield format_event(kind, data)
+    finally:
+        bus.unsubscribe(sub)
+
+
+def events():
+    """The SSE endpoint"""
+    if not bus.enabled:
+        return Response('Live updates are disabled', status=404, mimetype='text/plain')
+    product_ids = [pid for pid in request.args.get('products', '').split(',') if pid][:MAX_PRODUCTS]
+    keys = ['product:' + pid for pid in product_ids]
+    initial = []
+    if current_user.is_authenticated:
+        from backend import models
+        user_id = str(current_user.id)
+        keys.append('user:' + user_id)
+        # Tabs that reconnect missed whatever happened meanwhile
+        initial.append(('cart', {'count': models.carts.total_quantity(user_id)}))
+    sub = bus.subscribe(keys)
+    config = current_app.config
+    # Plain generator: the request context (and its DB stats) is released once streaming starts
+    response = Response(event_stream(sub, initial, config.get('LIVE_HEARTBEAT_SECONDS', 20),
+                                     config.get('LIVE_STREAM_MAX_SECONDS', 300)),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def init_app(app, mongo):
+    """Register GET /events and configure the bus"""
+    bus.mongo = mongo
+    bus.enabled = app.config.get('LIVE_UPDATES_ENABLED', False)
+    bus.capped_bytes = app.config.get('LIVE_EVENTS_CAPPED_BYTES', bus.capped_bytes)
+    bus.low_threshold = app.config.get('LOW_STOCK_THRESHOLD', bus.low_threshold)
+    app.add_url_rule('/events', 'live_events', events)
@@ -0,0 +1,71 @@
+import os
+import time
+
+from flask import Response, g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter,
+                               Gauge, Histogram, generate_latest, multiprocess)
+
+# In multiprocess mode (PROMETHEUS_MULTIPROC_DIR set, see gunicorn.conf.py) every
+# worker writes its samples to mmap-backed files in that directory and /metrics
+# merges them, so any worker can answer the scrape for the whole server.
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by Flask endpoint',
+    ['endpoint', 'method'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+REQUEST_COUNT = Counter(
+    'http_requests_total', 'Requests by Flask endpoint and status code',
+    ['endpoint', 'method', 'status'])
+RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes', 'Response body size by Flask endpoint',
+    ['endpoint'],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304))
+IN_FLIGHT = Gauge(
+    'http_requests_in_flight', 'Requests currently being served by Flask endpoint',
+    ['endpoint'], multiprocess_mode='livesum')
+
+
+def endpoint_label():
+    """Bounded label for the current request (unmatched URLs share one series)"""
+    return request.endpoint or 'unmatched'
+
+
+def registry():
+    """Registry to expose: merged worker files in multiprocess mode, else the default"""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        merged = CollectorRegistry()
+        multiprocess.MultiProcessCollector(merged)
+        return merged
+    return REGISTRY
+
+
+def init_app(app):
+    """Record per-endpoint latency, status, size and in-flight metrics and serve /metrics"""
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_endpoint = endpoint_label()
+        g.metrics_started = time.perf_counter()
+        IN_FLIGHT.labels(g.metrics_endpoint).inc()
+
+    @app.after_request
+    def record_request_metrics(response):
+        endpoint = g.get('metrics_endpoint')
+        if endpoint is None:
+            return response
+        REQUEST_LATENCY.labels(endpoint, request.method).observe(time.perf_counter() - g.metrics_started)
+        REQUEST_COUNT.labels(endpoint, request.method, str(response.status_code)).inc()
+        if not response.is_streamed:
+            RESPONSE_SIZE.labels(endpoint).observe(response.calculate_content_length() or 0)
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exc):
+        # Runs even when the view raised, so the gauge never leaks
+        endpoint = g.pop('metrics_endpoint', None)
+        if endpoint is not None:
+            IN_FLIGHT.labels(endpoint).dec()
+
+    @app.route('/metrics')
+    def metrics():
+        """Prometheus text exposition for all workers"""
+        return Response(generate_latest(registry()), mimetype=CONTENT_TYPE_LATEST)
@@ -1,35 +1,620 @@
-from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
-
-# MongoDB models will be handled as dictionaries/objects in the app logic.
-# You can define helper functions for user, product, etc. document creation and validation here if needed.
-    
-    # Shipping information
-    shipping_name = db.Column(db.String(100))
-    shipping_email = db.Column(db.String(120))
-    shipping_address = db.Column(db.Text)
-    shipping_city = db.Column(db.String(100))
-    shipping_postal_code = db.Column(db.String(20))
-    shipping_country = db.Column(db.String(100))
-    
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    
-    # Relationships
-    order_items = db.relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
-    
-    def __repr__(self):
-        return f'<Order {self.id}>'
-
-
-class OrderItem(db.Model):
-    """Individual items in an order"""
-    __tablename__ = 'order_items'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
-    quantity = db.Column(db.Integer, nullable=False)
-    price = db.Column(db.Float, nullable=False)  # Price at time of purchase
-    
+"""
+Data access layer: repositories over the Mongo collections and slotted records.
+
+Ids are always exposed as strings (record.id); `record._id` gives the ObjectId
+back for templates and queries. Foreign keys stored as strings (cart, orders,
+wishlists reference users and products by string id) stay strings, and
+products keep their ObjectId category_id as stored.
+
+Records behave like the documents they replace: attribute and item access,
+.get() with a default for fields missing from the document, and assignment of
+the view fields that routes attach (category, in_wishlist, ...).
+
+Lookups by id go through request-scoped batch loaders: every id requested in a
+request is remembered, and ids primed together are fetched with one `$in`
+query, so a page that needs the products of a cart, a wishlist and a few
+orders reads each product once.
+
+Orders moved to the archive tier (backend/archive.py) are still found by the
+order reads: OrderRepository falls back to `orders_archive` for single orders
+and merges it into a user's history.
+
+Within a request every repository query and write runs under query_budget():
+PyMongo sends the time left as maxTimeMS and gives up client side once it is
+spent (see backend/resilience.py). CLI jobs, the migrations included, are not
+bounded.
+"""
+
+import threading
+import zlib
+from contextlib import nullcontext
+from datetime import datetime
+
+import bson
+import pymongo
+from bson import Binary, ObjectId
+from flask import g, has_app_context, has_request_context
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import OperationFailure
+
+# Seconds each query may take within a request (DB_QUERY_TIMEOUT_MS), set by init_app
+query_timeout = None
+
+
+def to_object_id(value):
+    """ObjectId for a string/ObjectId id, or None if it is not a valid id"""
+    if isinstance(value, ObjectId):
+        return value
+    if isinstance(value, str) and ObjectId.is_valid(value):
+        return ObjectId(value)
+    return None
+
+
+def to_id(value):
+    """String form of a document id"""
+    return str(value) if value is not None else None
+
+
+def query_budget():
+    """Time budget for one query, nested in the request's (the smaller remaining one wins)"""
+    if query_timeout and has_request_context():
+        return pymongo.timeout(query_timeout)
+    return nullcontext()
+
+
+# ==================== RECORDS ====================
+class Record:
+    """Slotted view of one document: STORED fields come from Mongo, VIEW fields are set by routes"""
+    __slots__ = ('id',)
+    STORED = ()
+    VIEW = ()
+
+    def __init__(self, **values):
+        for name, value in values.items():
+            setattr(self, name, value)
+
+    @classmethod
+    def from_doc(cls, doc):
+        if doc is None:
+            return None
+        record = cls(**{name: doc[name] for name in cls.STORED if name in doc})
+        record.id = to_id(doc['_id'])
+        return record
+
+    @property
+    def _id(self):
+        return to_object_id(self.id) or self.id
+
+    def to_doc(self):
+        return {name: getattr(self, name) for name in self.STORED if hasattr(self, name)}
+
+    def get(self, name, default=None):
+        return getattr(self, name, default)
+
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name) from None
+
+    def __setitem__(self, name, value):
+        setattr(self, name, value)
+
+    def __contains__(self, name):
+        return hasattr(self, name)
+
     def __repr__(self):
-        return f'<OrderItem Order:{self.order_id} Product:{self.product_id}>'
+        return '<{} {}>'.format(type(self).__name__, getattr(self, 'id', None))
+
+
+class Category(Record):
+    STORED = ('name', 'description', 'image')
+    VIEW = ('product_count',)
+    __slots__ = STORED + VIEW
+
+
+class Product(Record):
+    STORED = ('name', 'description', 'price', 'stock', 'unit', 'category_id',
+              'image', 'image_url', 'created_at')
+    VIEW = ('category', 'category_name', 'in_wishlist')
+    __slots__ = STORED + VIEW
+
+
+class User(Record):
+    STORED = ('name', 'email', 'password_hash', 'is_admin', 'created_at')
+    __slots__ = STORED
+
+
+class CartLine(Record):
+    STORED = ('user_id', 'product_id', 'quantity')
+    VIEW = ('product',)
+    __slots__ = STORED + VIEW
+
+
+class OrderItem(Record):
+    """Embedded order line; has no id of its own"""
+    STORED = ('product_id', 'quantity', 'price', 'unit')
+    VIEW = ('product',)
+    __slots__ = STORED + VIEW
+
+    @classmethod
+    def from_doc(cls, doc):
+        return cls(**{name: doc[name] for name in cls.STORED if name in doc})
+
+    @property
+    def name(self):
+        product = self.get('product')
+        return product.get('name', '') if product else ''
+
+
+class Order(Record):
+    STORED = ('user_id', 'status', 'total_amount', 'shipping_name', 'shipping_email',
+              'shipping_address', 'shipping_city', 'shipping_postal_code', 'shipping_country',
+              'created_at', 'status_updated_at', 'items')
+    __slots__ = STORED
+
+    @classmethod
+    def from_doc(cls, doc):
+        order = super().from_doc(doc)
+        if order is not None and 'items' in doc:
+            order.items = [OrderItem.from_doc(item) for item in doc['items']]
+        return order
+
+    @property
+    def order_items(self):
+        return self.get('items', [])
+
+
+class Recommendation(Record):
+    """Related products precomputed by backend/recommendations.py; the id is the product's"""
+    STORED = ('category', 'related', 'co_purchased', 'updated_at')
+    __slots__ = STORED
+
+
+# ==================== BATCH LOADING ====================
+class BatchLoader:
+    """Memoizes records by id for one request and fetches missing ids in one `$in`.
+
+    fanout.gather() threads share the request's loaders, hence the lock; it is
+    not held during the fetch, so concurrent loads may read an id twice.
+    """
+
+    def __init__(self, fetch_many):
+        self.fetch_many = fetch_many
+        self._cache = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def prime(self, ids):
+        """Queue ids so the next load fetches them together"""
+        ids = [to_id(i) for i in ids]
+        with self._lock:
+            self._pending.update(i for i in ids if i not in self._cache)
+
+    def load_many(self, ids):
+        ids = [to_id(i) for i in ids]
+        with self._lock:
+            self._pending.update(i for i in ids if i not in self._cache)
+            batch, self._pending = self._pending, set()
+        if batch:
+            found = self.fetch_many(batch)
+            with self._lock:
+                for record_id in batch:
+                    self._cache[record_id] = found.get(record_id)
+        with self._lock:
+            return {i: self._cache[i] for i in ids if self._cache.get(i) is not None}
+
+    def load(self, record_id):
+        return self.load_many([record_id]).get(to_id(record_id))
+
+    def forget(self, record_id):
+        with self._lock:
+            self._cache.pop(to_id(record_id), None)
+
+
+# ==================== REPOSITORIES ====================
+class Repository:
+    collection_name = None
+    record = Record
+
+    def __init__(self, mongo=None):
+        self.mongo = mongo
+
+    @property
+    def collection(self):
+        return self.mongo.db[self.collection_name]
+
+    def wrap(self, docs):
+        return [self.record.from_doc(doc) for doc in docs]
+
+    def find(self, query=None, projection=None, sort=None, skip=0, limit=0):
+        with query_budget():
+            return self.wrap(self.collection.find(query or {}, projection, sort=sort, skip=skip, limit=limit))
+
+    def find_one(self, query, projection=None):
+        with query_budget():
+            return self.record.from_doc(self.collection.find_one(query, projection))
+
+    def count(self, query=None):
+        with query_budget():
+            return self.collection.count_documents(query or {})
+
+    def get_many(self, ids):
+        """{id: record} for the given ids in a single `$in` query"""
+        oids = [oid for oid in (to_object_id(i) for i in ids) if oid is not None]
+        if not oids:
+            return {}
+        return {record.id: record for record in self.find({'_id': {'$in': oids}})}
+
+    def _loader(self):
+        loaders = g.setdefault('loaders', {})
+        loader = loaders.get(self.collection_name)
+        if loader is None:
+            # setdefault: fanned-out threads racing here must end up with the same loader
+            loader = loaders.setdefault(self.collection_name, BatchLoader(self.get_many))
+        return loader
+
+    def prime(self, ids):
+        if has_app_context():
+            self._loader().prime(ids)
+
+    def load_many(self, ids):
+        """Request-scoped batched lookup by id; outside a request it is a plain get_many"""
+        if not has_app_context():
+            return self.get_many(ids)
+        return self._loader().load_many(ids)
+
+    def load(self, record_id):
+        return self.load_many([record_id]).get(to_id(record_id))
+
+    def forget(self, record_id):
+        if has_app_context():
+            self._loader().forget(record_id)
+
+    def insert(self, values):
+        with query_budget():
+            return to_id(self.collection.insert_one(dict(values)).inserted_id)
+
+    def update(self, record_id, values):
+        self.forget(record_id)
+        with query_budget():
+            return self.collection.update_one({'_id': to_object_id(record_id)}, {'$set': values}).modified_count
+
+    def delete(self, record_id):
+        self.forget(record_id)
+        with query_budget():
+            return self.collection.delete_one({'_id': to_object_id(record_id)}).deleted_count
+
+
+class CategoryRepository(Repository):
+    collection_name = 'categories'
+    record = Category
+
+
+class ProductRepository(Repository):
+    collection_name = 'products'
+    record = Product
+
+    def exists(self, product_id):
+        return self.load(product_id) is not None
+
+
+class RecommendationRepository(Repository):
+    collection_name = 'recommendations'
+    record = Recommendation
+
+    def for_product(self, product_id):
+        return self.find_one({'_id': to_id(product_id)})
+
+
+class UserRepository(Repository):
+    collection_name = 'users'
+    record = User
+
+    def by_email(self, email):
+        return self.find_one({'email': email})
+
+    def create(self, name, email, password_hash, is_admin=False):
+        user_id = self.insert({'name': name, 'email': email, 'password_hash': password_hash,
+                               'is_admin': is_admin, 'created_at': datetime.utcnow()})
+        return self.load(user_id)
+
+
+class CartRepository(Repository):
+    """Cart lines keyed by (user_id, product_id); one user's lines are read once per request"""
+    collection_name = 'cart'
+    record = CartLine
+
+    def for_user(self, user_id):
+        cache = g.setdefault('cart_lines', {}) if has_app_context() else {}
+        if user_id not in cache:
+            cache[user_id] = self.find({'user_id': user_id})
+        return cache[user_id]
+
+    def _changed(self, user_id):
+        if has_app_context():
+            g.get('cart_lines', {}).pop(user_id, None)
+
+    def quantity(self, user_id, product_id):
+        line = next((line for line in self.for_user(user_id) if line.product_id == product_id), None)
+        return line.get('quantity', 1) if line else 0
+
+    def total_quantity(self, user_id):
+        return sum(line.get('quantity', 1) for line in self.for_user(user_id))
+
+    def line(self, user_id, line_id):
+        oid = to_object_id(line_id)
+        return oid and self.find_one({'_id': oid, 'user_id': user_id})
+
+    def add(self, user_id, product_id, quantity):
+        """Increase (or create) the line in one upsert; returns the new quantity"""
+        self._changed(user_id)
+        with query_budget():
+            doc = self.collection.find_one_and_update(
+                {'user_id': user_id, 'product_id': product_id}, {'$inc': {'quantity': quantity}},
+                projection={'quantity': 1}, upsert=True, return_document=ReturnDocument.AFTER)
+        return doc['quantity']
+
+    def set_quantity(self, user_id, product_id, quantity):
+        self._changed(user_id)
+        with query_budget():
+            if quantity <= 0:
+                self.collection.delete_many({'user_id': user_id, 'product_id': product_id})
+                return 0
+            self.collection.update_one({'user_id': user_id, 'product_id': product_id},
+                                       {'$set': {'quantity': quantity}}, upsert=True)
+        return quantity
+
+    def update_line(self, user_id, line_id, quantity):
+        self._changed(user_id)
+        with query_budget():
+            if quantity <= 0:
+                return self.collection.delete_one({'_id': to_object_id(line_id), 'user_id': user_id}).deleted_count
+            return self.collection.update_one({'_id': to_object_id(line_id), 'user_id': user_id},
+                                              {'$set': {'quantity': quantity}}).matched_count
+
+    def remove_line(self, user_id, line_id):
+        self._changed(user_id)
+        with query_budget():
+            return self.collection.delete_one({'_id': to_object_id(line_id), 'user_id': user_id}).deleted_count
+
+    def clear(self, user_id):
+        self._changed(user_id)
+        with query_budget():
+            self.collection.delete_many({'user_id': user_id})
+
+    def merge(self, user_id, quantities):
+        """Add {product_id: quantity} to the user's cart with one bulk write"""
+        if not quantities:
+            return
+        self._changed(user_id)
+        with query_budget():
+            self.collection.bulk_write([
+                UpdateOne({'user_id': user_id, 'product_id': pid}, {'$inc': {'quantity': qty}}, upsert=True)
+                for pid, qty in quantities.items()
+            ], ordered=False)
+
+
+class WishlistRepository(Repository):
+    """One document per user: {'_id': user_id, 'product_ids': [...]}"""
+    collection_name = 'wishlists'
+
+    def product_ids(self, user_id):
+        """Ordered wishlisted product ids, read once per request"""
+        cache = g.setdefault('wishlist_ids', {}) if has_app_context() else {}
+        if user_id not in cache:
+            with query_budget():
+                doc = self.collection.find_one({'_id': user_id}, {'product_ids': 1})
+            cache[user_id] = list(doc.get('product_ids', [])) if doc else []
+        return cache[user_id]
+
+    def _store(self, user_id, product_ids):
+        if has_app_context():
+            g.setdefault('wishlist_ids', {})[user_id] = list(product_ids)
+
+    def toggle(self, user_id, product_id):
+        """Atomically add or remove product_id; returns (added, new_count)"""
+        current = {'$ifNull': ['$product_ids', []]}
+        with query_budget():
+            doc = self.collection.find_one_and_update(
+                {'_id': user_id},
+                [{'$set': {'product_ids': {'$cond': [
+                    {'$in': [product_id, current]},
+                    {'$filter': {'input': current, 'cond': {'$ne': ['$$this', product_id]}}},
+                    {'$concatArrays': [current, [product_id]]}
+                ]}}}],
+                projection={'product_ids': 1},
+                upsert=True,
+                return_document=ReturnDocument.AFTER)
+        product_ids = doc.get('product_ids', [])
+        self._store(user_id, product_ids)
+        return product_id in product_ids, len(product_ids)
+
+    def remove(self, user_id, product_id):
+        """Remove product_id; returns True if it was there"""
+        with query_budget():
+            result = self.collection.update_one({'_id': user_id, 'product_ids': product_id},
+                                                {'$pull': {'product_ids': product_id}})
+        if has_app_context():
+            g.get('wishlist_ids', {}).pop(user_id, None)
+        return result.modified_count > 0
+
+    def migrate_legacy(self):
+        """Fold per-item documents from the old `wishlist` collection into `wishlists`.
+
+        Idempotent ($addToSet), so a run racing another one or repeated after
+        an interruption is harmless. Returns the number of users migrated.
+        """
+        db = self.mongo.db
+        if 'wishlist' not in db.list_collection_names():
+            return 0
+        migrated = 0
+        for row in db.wishlist.aggregate([
+            {'$group': {'_id': '$user_id', 'product_ids': {'$addToSet': '$product_id'}}}
+        ]):
+            self.collection.update_one({'_id': row['_id']},
+                                       {'$addToSet': {'product_ids': {'$each': row['product_ids']}}},
+                                       upsert=True)
+            migrated += 1
+        try:
+            db.wishlist.rename('wishlist_migrated', dropTarget=True)
+        except OperationFailure:
+            # A concurrent run renamed it first
+            if 'wishlist' in db.list_collection_names():
+                raise
+        return migrated
+
+
+class OrderRepository(Repository):
+    collection_name = 'orders'
+    record = Order
+
+    def for_user(self, user_id, limit=0):
+        """Newest first, archived orders included"""
+        hot = self.find({'user_id': user_id}, sort=[('created_at', -1), ('_id', -1)], limit=limit)
+        if limit and len(hot) >= limit:
+            return hot
+        hot_ids = {order.id for order in hot}
+        # An interrupted archive run can leave an order in both tiers; the hot copy wins
+        merged = hot + [order for order in order_archive.for_user(user_id) if order.id not in hot_ids]
+        merged.sort(key=lambda order: (order.get('created_at') or datetime.min, order.id), reverse=True)
+        return merged[:limit] if limit else merged
+
+    def get_for_user(self, order_id, user_id):
+        oid = to_object_id(order_id)
+        if not oid:
+            return None
+        return self.find_one({'_id': oid, 'user_id': user_id}) or order_archive.get_for_user(oid, user_id)
+
+    def count_all(self):
+        """Hot plus archived orders"""
+        return self.count() + order_archive.order_count()
+
+    def counts_by_user(self):
+        """{user_id: number of orders}, hot plus archived"""
+        with query_budget():
+            counts = {row['_id']: row['count'] for row in self.collection.aggregate([
+                {'$group': {'_id': '$user_id', 'count': {'$sum': 1}}}
+            ])}
+        for user_id, count in order_archive.counts_by_user().items():
+            counts[user_id] = counts.get(user_id, 0) + count
+        return counts
+
+    def create(self, values):
+        return self.insert(values)
+
+    def set_status(self, order_id, status):
+        return self.update(order_id, {'status': status, 'status_updated_at': datetime.utcnow()})
+
+    def set_status_many(self, order_ids, status):
+        """Set status on several orders with one unordered bulk write; returns the number changed"""
+        now = datetime.utcnow()
+        for order_id in order_ids:
+            self.forget(order_id)
+        with query_budget():
+            result = self.collection.bulk_write([
+                UpdateOne({'_id': to_object_id(order_id), 'status': {'$ne': status}},
+                          {'$set': {'status': status, 'status_updated_at': now}})
+                for order_id in dict.fromkeys(order_ids)
+            ], ordered=False)
+        return result.modified_count
+
+    def normalize_user_ids(self):
+        """Convert orders stored with an ObjectId user_id to the string form used everywhere"""
+        return self.collection.update_many({'user_id': {'$type': 'objectId'}},
+                                           [{'$set': {'user_id': {'$toString': '$user_id'}}}]).modified_count
+
+
+def pack_orders(order_docs):
+    """zlib-compressed BSON of a list of order documents"""
+    return Binary(zlib.compress(bson.encode({'orders': order_docs}), 6))
+
+
+def unpack_orders(data):
+    return bson.decode(zlib.decompress(data))['orders']
+
+
+class OrderArchiveRepository(Repository):
+    """Archived orders: one document per user and month,
+    {user_id, month, order_ids, count, data}, data being pack_orders() of the month's orders"""
+    collection_name = 'orders_archive'
+    record = Order
+
+    def for_user(self, user_id):
+        orders = []
+        with query_budget():
+            batches = list(self.collection.find({'user_id': user_id}, {'data': 1}, sort=[('month', -1)]))
+        for batch in batches:
+            orders.extend(unpack_orders(batch['data']))
+        return self.wrap(orders)
+
+    def get_for_user(self, order_id, user_id):
+        oid = to_object_id(order_id)
+        with query_budget():
+            batch = oid and self.collection.find_one({'order_ids': oid, 'user_id': user_id}, {'data': 1})
+        if not batch:
+            return None
+        return next((self.record.from_doc(doc) for doc in unpack_orders(batch['data']) if doc['_id'] == oid), None)
+
+    def order_count(self):
+        with query_budget():
+            rows = list(self.collection.aggregate([{'$group': {'_id': None, 'count': {'$sum': '$count'}}}]))
+        return rows[0]['count'] if rows else 0
+
+    def counts_by_user(self):
+        with query_budget():
+            return {row['_id']: row['count'] for row in self.collection.aggregate([
+                {'$group': {'_id': '$user_id', 'count': {'$sum': '$count'}}}
+            ])}
+
+
+categories = CategoryRepository()
+products = ProductRepository()
+recommendations = RecommendationRepository()
+users = UserRepository()
+carts = CartRepository()
+wishlists = WishlistRepository()
+orders = OrderRepository()
+order_archive = OrderArchiveRepository()
+
+
+def attach_products(lines):
+    """Set line.product on cart lines / order items, loading all products in one query"""
+    found = products.load_many({line.product_id for line in lines if line.get('product_id')})
+    for line in lines:
+        line.product = found.get(line.get('product_id'))
+    return lines
+
+
+def attach_order_products(order_list):
+    return attach_products([item for order in order_list for item in order.order_items])
+
+
+REQUEST_CACHE_KEYS = ('loaders', 'cart_lines', 'wishlist_ids')
+
+
+def clear_request_caches():
+    for key in REQUEST_CACHE_KEYS:
+        g.pop(key, None)
+
+
+def init_app(app, mongo):
+    global query_timeout
+    query_timeout = app.config.get('DB_QUERY_TIMEOUT_MS', 0) / 1000.0 or None
+    for repository in (categories, products, recommendations, users, carts, wishlists, orders, order_archive):
+        repository.mongo = mongo
+
+    @app.teardown_request
+    def drop_request_caches(exc=None):
+        # The app context outlives the request under the CLI and test client
+        clear_request_caches()
+
+    import click
+
+    # One-off data migrations: run once per deploy (Procfile release phase), not
+    # at import, where every booting worker would race on them
+    @app.cli.command('migrate-data')
+    def migrate_data_command():
+        """Fold the legacy wishlist collection and normalize order user ids."""
+        click.echo('Migrated wishlists of {} users'.format(wishlists.migrate_legacy()))
+        click.echo('Normalized user_id on {} orders'.format(orders.normalize_user_ids()))
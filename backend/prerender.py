@@ -0,0 +1,284 @@
+"""
+Pre-rendered anonymous catalog pages.
+
+`flask prerender-catalog` renders what crawlers and link previews fetch (the home
+page, the first PRERENDER_LISTING_PAGES pages of /categories, of every category,
+and every /product/<id> page) through the normal views into PRERENDER_DIR, and
+writes sitemap.xml plus manifest.json (URL -> file, fingerprint, lastmod).
+
+Each page has a fingerprint of the documents it is built from: the category nav
+(base.html lists every category), the products on that page, the recommendation
+doc, the price slider range. A run re-renders only pages whose fingerprint
+changed, so editing one product touches its page, its listing pages, the home
+page if it is featured and products whose recommendations mention it. Template
+changes re-render everything, as does --full.
+
+With PRERENDER_SERVE on, a before_request hook answers GETs for exported URLs
+from disk when the visitor has no session (no login, guest cart or flashes) and
+the catalog version still matches the export; after an admin edit the dynamic
+views take over again until the next run. While the database is unavailable
+(backend/resilience.py) exported pages are served whatever their version. A CDN can also pick up the directory
+directly (manifest.json gives the URL of each file).
+
+Run from cron and after deploys:
+
+    flask --app backend.app prerender-catalog
+"""
+
+import hashlib
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from urllib.parse import urlencode
+from xml.sax.saxutils import escape
+
+from flask import request, send_file, session
+
+from backend import resilience
+from backend.cache import catalog_version
+
+MANIFEST = 'manifest.json'
+RENDER_ENVIRON_KEY = 'prerender.rendering'
+SITEMAP = 'sitemap.xml'
+HOME_PRODUCTS = 8  # featured_catalog() limit
+RELATED_PRODUCTS = 4
+
+
+def canonical_key(path, params):
+    """Manifest key for a URL and its (name, value) query pairs: empty values and page=1 dropped, the rest sorted"""
+    pairs = sorted((key, value) for key, value in params
+                   if value and not (key == 'page' and value == '1'))
+    return path + ('?' + urlencode(pairs) if pairs else '')
+
+
+def page_file(key):
+    """Relative file for a manifest key, e.g. '/categories?category=x&page=2' -> 'categories/category-x-page-2.html'"""
+    path, _, query = key.partition('?')
+    name = path.strip('/') or 'index'
+    if query:
+        name += '/' + query.replace('=', '-').replace('&', '-')
+    return name + '.html'
+
+
+def digest(*parts):
+    sha = hashlib.sha1()
+    for part in parts:
+        sha.update(json.dumps(part, sort_keys=True, default=str).encode())
+        sha.update(b'\0')
+    return sha.hexdigest()
+
+
+def templates_digest(template_folder):
+    sha = hashlib.sha1()
+    for root, _, files in sorted(os.walk(template_folder)):
+        for name in sorted(files):
+            with open(os.path.join(root, name), 'rb') as f:
+                sha.update(name.encode() + b'\0' + f.read())
+    return sha.hexdigest()
+
+
+def write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+
+
+# ==================== PAGE PLAN ====================
+def plan_pages(db, page_size, listing_pages):
+    """{manifest key: fingerprint} for every page of the anonymous catalog"""
+    categories = list(db.categories.find())
+    products = list(db.products.find())
+    recommendations = {doc['_id']: doc for doc in db.recommendations.find()}
+
+    product_digests = {str(prod['_id']): digest(prod) for prod in products}
+    by_category = defaultdict(list)
+    for prod in products:
+        by_category[str(prod.get('category_id'))].append(str(prod['_id']))
+    prices = [prod['price'] for prod in products if isinstance(prod.get('price'), (int, float))]
+    price_range = (min(prices), max(prices)) if prices else None
+    nav = digest(categories)
+    # The listing sidebar shows product counts per category
+    counts = {key: len(ids) for key, ids in by_category.items()}
+    ordered_ids = [str(prod['_id']) for prod in products]
+
+    pages = {'/': digest(nav, [product_digests[pid] for pid in ordered_ids[:HOME_PRODUCTS]])}
+
+    def add_listing(args, ids):
+        total_pages = max(1, math.ceil(len(ids) / page_size))
+        for page in range(1, min(listing_pages, total_pages) + 1):
+            key = canonical_key('/categories', dict(args, page=str(page)).items())
+            window = ids[(page - 1) * page_size:page * page_size]
+            pages[key] = digest(nav, counts, price_range, len(ids), [product_digests[pid] for pid in window])
+
+    add_listing({}, ordered_ids)
+    category_docs = {}
+    for cat in categories:
+        category_docs[str(cat['_id'])] = cat
+        add_listing({'category': str(cat['_id'])}, by_category.get(str(cat['_id']), []))
+
+    for prod in products:
+        pid = str(prod['_id'])
+        category_key = str(prod.get('category_id'))
+        recommendation = recommendations.get(pid)
+        if recommendation is not None:
+            inputs = recommendation
+        else:
+            # product_detail falls back to the first other products of the category
+            related = [other for other in by_category.get(category_key, []) if other != pid][:RELATED_PRODUCTS]
+            inputs = [category_docs.get(category_key), [product_digests[other] for other in related]]
+        pages['/product/' + pid] = digest(nav, product_digests[pid], inputs)
+    return pages
+
+
+# ==================== EXPORT ====================
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def sitemap_xml(base_url, pages):
+    """Listing first pages, category pages and product pages with their lastmod"""
+    urls = []
+    for key in sorted(pages):
+        if 'page=' in key:
+            continue
+        urls.append('  <url><loc>{}</loc><lastmod>{}</lastmod></url>'.format(
+            escape(base_url.rstrip('/') + key), pages[key]['lastmod'][:10]))
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+            + '\n'.join(urls) + '\n</urlset>\n').encode()
+
+
+def export_catalog(app, db, out_dir, base_url, listing_pages=3, page_size=12, full=False):
+    """Render changed pages into out_dir; returns (rendered, kept, removed) counts"""
+    # Read the version first: an edit during the export leaves the manifest behind it
+    version_doc = db.meta.find_one({'_id': 'catalog'}, {'version': 1})
+    version = version_doc.get('version', 0) if version_doc else 0
+    previous = load_manifest(out_dir)
+    templates = templates_digest(app.template_folder)
+    full = full or previous.get('templates') != templates
+    old_pages = previous.get('pages', {})
+
+    client = app.test_client(use_cookies=False)
+    now = datetime.utcnow().isoformat(timespec='seconds')
+    pages, rendered, kept = {}, 0, 0
+    for key, fingerprint in plan_pages(db, page_size, listing_pages).items():
+        entry = old_pages.get(key)
+        if (not full and entry and entry['fingerprint'] == fingerprint
+                and os.path.exists(os.path.join(out_dir, entry['file']))):
+            pages[key] = entry
+            kept += 1
+            continue
+        response = client.get(key, base_url=base_url, environ_overrides={RENDER_ENVIRON_KEY: True})
+        if response.status_code != 200:
+            app.logger.warning('prerender skipped %s: status %s', key, response.status_code)
+            continue
+        write_atomic(os.path.join(out_dir, page_file(key)), response.get_data())
+        pages[key] = {'file': page_file(key), 'fingerprint': fingerprint, 'lastmod': now}
+        rendered += 1
+
+    removed = 0
+    for key, entry in old_pages.items():
+        if key not in pages and entry['file'] != SITEMAP:
+            try:
+                os.unlink(os.path.join(out_dir, entry['file']))
+            except OSError:
+                pass
+            removed += 1
+
+    write_atomic(os.path.join(out_dir, SITEMAP), sitemap_xml(base_url, pages))
+    manifest = {'catalog_version': version, 'templates': templates, 'base_url': base_url,
+                'generated_at': now, 'pages': pages}
+    write_atomic(os.path.join(out_dir, MANIFEST), json.dumps(manifest, indent=1, sort_keys=True).encode())
+    return rendered, kept, removed
+
+
+# ==================== SERVING ====================
+class PrerenderedPages:
+    """The export manifest, re-read when the file changes (checked every check_interval seconds)"""
+
+    def __init__(self, directory, check_interval=5.0):
+        self.directory = directory
+        self.check_interval = check_interval
+        self._manifest = {}
+        self._mtime = None
+        self._checked_at = float('-inf')
+        self._lock = threading.Lock()
+
+    def manifest(self):
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            with self._lock:
+                if now - self._checked_at >= self.check_interval:
+                    try:
+                        mtime = os.stat(os.path.join(self.directory, MANIFEST)).st_mtime_ns
+                    except OSError:
+                        mtime = None
+                    if mtime != self._mtime:
+                        self._manifest = load_manifest(self.directory) if mtime else {}
+                        self._mtime = mtime
+                    self._checked_at = now
+        return self._manifest
+
+    def lookup(self, key):
+        """Absolute path of the exported page for key, or None if absent or out of date"""
+        manifest = self.manifest()
+        entry = manifest.get('pages', {}).get(key)
+        if entry is None:
+            return None
+        # An out-of-date page still beats the snapshot while the database is unavailable
+        if not resilience.degraded() and manifest.get('catalog_version') != catalog_version.current():
+            return None
+        return os.path.join(self.directory, entry['file'])
+
+
+def init_app(app, mongo):
+    """Register `flask prerender-catalog` and, with PRERENDER_SERVE, serve exported pages"""
+    import click
+
+    out_dir = app.config['PRERENDER_DIR']
+
+    @app.cli.command('prerender-catalog')
+    @click.option('--full', is_flag=True, help='Re-render every page, not only changed ones')
+    @click.option('--base-url', default=None, help='Site URL for the sitemap (default PRERENDER_BASE_URL)')
+    def prerender_catalog_command(full, base_url):
+        """Pre-render anonymous catalog pages and the sitemap."""
+        from backend.app import CATALOG_PAGE_SIZE
+        base_url = base_url or app.config.get('PRERENDER_BASE_URL', 'http://localhost:5000')
+        rendered, kept, removed = export_catalog(
+            app, mongo.db, out_dir, base_url, full=full, page_size=CATALOG_PAGE_SIZE,
+            listing_pages=app.config.get('PRERENDER_LISTING_PAGES', 3))
+        click.echo('Rendered {} pages, kept {}, removed {} -> {}'.format(rendered, kept, removed, out_dir))
+
+    if not app.config.get('PRERENDER_SERVE', False):
+        return
+    pages = PrerenderedPages(out_dir)
+    max_age = app.config.get('PRERENDER_MAX_AGE', 300)
+
+    @app.route('/sitemap.xml')
+    def sitemap():
+        path = os.path.join(out_dir, SITEMAP)
+        if not os.path.exists(path):
+            return 'Sitemap not generated yet', 404
+        return send_file(path, mimetype='application/xml', conditional=True, max_age=max_age)
+
+    @app.before_request
+    def serve_prerendered():
+        # Anything in the session (login, guest cart, flashes) changes the page
+        if request.method not in ('GET', 'HEAD') or session or request.environ.get(RENDER_ENVIRON_KEY):
+            return None
+        path = pages.lookup(canonical_key(request.path, request.args.items(multi=True)))
+        if path is None or not os.path.exists(path):
+            return None
+        return send_file(path, mimetype='text/html', conditional=True, max_age=max_age)
@@ -0,0 +1,330 @@
+"""
+On-demand and sampled request profiling.
+
+An admin adds `?_profile=sample` (or `?_profile=cprofile`) to any URL, or sends
+the same value in an `X-Profile` header, and the request runs under a profiler:
+
+* sample   - a background thread records the stacks of the request thread every
+             PROFILE_SAMPLE_INTERVAL seconds. Wall-clock, so time spent waiting
+             on Mongo or rendering Jinja templates shows up where it happens.
+* cprofile - cProfile (deterministic, wall-clock timer), slower but exact call counts.
+
+Other users' flags are ignored. Independently, PROFILE_SAMPLE_RATE (0..1) runs
+that fraction of all requests under the sampling profiler.
+
+Reads that fanout.gather() hands to its pool are profiled too: their stacks are
+recorded under a `fanout` frame (cProfile: merged into the request's stats).
+
+Each profile is stored in the `profiles` collection (the newest PROFILE_KEEP)
+with its route, status, wall time, Mongo time and query count from the
+per-request DB stats and the Jinja render time. /admin/profiles lists them and
+downloads them as pstats (`python -m pstats`, snakeviz) or, for sampled
+profiles, as collapsed stacks (flamegraph.pl, speedscope). Admin-triggered
+responses carry the profile id in `X-Profile-Id`.
+
+The sampler reads sys._current_frames(), so under gevent workers only cProfile
+profiles are meaningful.
+"""
+
+import cProfile
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import zlib
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from bson import Binary
+from flask import before_render_template, g, has_request_context, request, template_rendered
+from flask_login import current_user
+
+from backend import resilience
+
+PROFILES_COLLECTION = 'profiles'
+MODES = ('sample', 'cprofile')
+SKIP_ENDPOINTS = ('static', 'live_events', 'admin_profiles', 'admin_download_profile')
+MAX_DEPTH = 128
+
+
+# ==================== SAMPLING ====================
+def frame_key(frame):
+    code = frame.f_code
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+def frame_stack(frame, stop_code=None):
+    """(filename, line, function) tuples from the outermost frame to frame"""
+    stack = []
+    while frame is not None and len(stack) < MAX_DEPTH:
+        if frame.f_code is stop_code:
+            break
+        stack.append(frame_key(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+class Sampler:
+    """Records the stacks of registered threads every interval seconds"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._threads = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def add_thread(self, thread_id, prefix=(), stop_code=None):
+        self._threads[thread_id] = (prefix, stop_code)
+
+    def remove_thread(self, thread_id):
+        self._threads.pop(thread_id, None)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if self._stop.is_set():
+                break  # the request thread is already in stop()
+            for thread_id, (prefix, stop_code) in list(self._threads.items()):
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.stacks[prefix + frame_stack(frame, stop_code)] += 1
+            self.samples += 1
+
+
+def label(key):
+    filename, line, name = key
+    return '{} ({}:{})'.format(name, os.path.basename(filename), line)
+
+
+def collapsed_stacks(stacks):
+    """Brendan Gregg's folded format: `root;child;leaf count` per line"""
+    return ''.join('{} {}\n'.format(';'.join(label(key) for key in stack), count)
+                   for stack, count in sorted(stacks.items()))
+
+
+def sampled_pstats(stacks, interval):
+    """pstats data ({func: (cc, nc, tt, ct, callers)}) estimated from stack samples"""
+    totals = defaultdict(lambda: [0, 0.0, 0.0])  # samples, self seconds, cumulative seconds
+    edges = defaultdict(lambda: [0, 0.0, 0.0])
+    for stack, count in stacks.items():
+        seconds = count * interval
+        for func in set(stack):
+            totals[func][0] += count
+            totals[func][2] += seconds
+        if stack:
+            totals[stack[-1]][1] += seconds
+        for depth in range(1, len(stack)):
+            edge = edges[(stack[depth - 1], stack[depth])]
+            edge[0] += count
+            edge[2] += seconds
+            if depth == len(stack) - 1:
+                edge[1] += seconds
+    stats = {}
+    for func, (count, self_time, cumulative) in totals.items():
+        stats[func] = (count, count, self_time, cumulative, {})
+    for (caller, callee), (count, self_time, cumulative) in edges.items():
+        stats[callee][4][caller] = (count, count, self_time, cumulative)
+    return stats
+
+
+# ==================== PROFILE SESSIONS ====================
+class ProfileSession:
+    """One profiled request"""
+
+    def __init__(self, mode, trigger, interval):
+        self.mode = mode
+        self.trigger = trigger
+        self.interval = interval
+        self.started = time.perf_counter()
+        self.wall_ms = None
+        self.template_ms = 0.0
+        self._render_started = {}
+        self._profiles = []
+        self._lock = threading.Lock()
+        if mode == 'cprofile':
+            self.sampler = None
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        else:
+            self.profile = None
+            self.sampler = Sampler(interval)
+            self.sampler.add_thread(threading.get_ident())
+            self.sampler.start()
+
+    def stop(self):
+        if self.wall_ms is not None:
+            return
+        self.wall_ms = (time.perf_counter() - self.started) * 1000.0
+        if self.profile is not None:
+            self.profile.disable()
+        else:
+            self.sampler.stop()
+
+    def run_in_thread(self, call, prefix):
+        """Run a pool call with the calling thread profiled as part of this request"""
+        if self.profile is not None:
+            profile = cProfile.Profile()
+            with self._lock:
+                self._profiles.append(profile)
+            return profile.runcall(call)
+        thread_id = threading.get_ident()
+        self.sampler.add_thread(thread_id, (prefix,), ProfileSession.run_in_thread.__code__)
+        try:
+            return call()
+        finally:
+            self.sampler.remove_thread(thread_id)
+
+    def render_started(self, name):
+        self._render_started[name] = time.perf_counter()
+
+    def render_finished(self, name):
+        started = self._render_started.pop(name, None)
+        if started is not None:
+            self.template_ms += (time.perf_counter() - started) * 1000.0
+
+    def pstats_data(self):
+        if self.profile is None:
+            return sampled_pstats(self.sampler.stacks, self.interval)
+        stats = pstats.Stats(self.profile)
+        for profile in self._profiles:
+            stats.add(profile)
+        return stats.stats
+
+    def collapsed(self):
+        return collapsed_stacks(self.sampler.stacks) if self.sampler else None
+
+
+def active_session():
+    return g.get('profile') if has_request_context() else None
+
+
+def run_call(call):
+    """fanout pool entry point: profile the call if the request it belongs to is profiled"""
+    session = active_session()
+    if session is None or session.wall_ms is not None:
+        return call()
+    return session.run_in_thread(call, ('fanout', 0, 'gather'))
+
+
+def requested_mode(default_mode):
+    """Profiler mode an admin asked for with ?_profile= / X-Profile, or None"""
+    value = request.args.get('_profile') or request.headers.get('X-Profile')
+    if not value or value.lower() in ('0', 'false', 'off'):
+        return None
+    if not (current_user.is_authenticated and current_user.is_admin):
+        return None
+    value = value.lower()
+    return value if value in MODES else default_mode
+
+
+# ==================== STORAGE ====================
+def pack(data):
+    return Binary(zlib.compress(data, 6))
+
+
+def store_profile(db, session, response, keep):
+    """Insert the profile document and trim the collection to the newest `keep`"""
+    stats = g.get('db_stats')
+    doc = {
+        'created_at': datetime.utcnow(),
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'mode': session.mode,
+        'trigger': session.trigger,
+        'user_id': str(current_user.id) if current_user.is_authenticated else None,
+        'wall_ms': round(session.wall_ms, 2),
+        'db_ms': round(stats.total_ms, 2) if stats else None,
+        'db_queries': stats.count if stats else None,
+        'template_ms': round(session.template_ms, 2),
+        'samples': session.sampler.samples if session.sampler else None,
+        'pstats': pack(marshal.dumps(session.pstats_data())),
+    }
+    collapsed = session.collapsed()
+    if collapsed is not None:
+        doc['collapsed'] = pack(collapsed.encode())
+    collection = db[PROFILES_COLLECTION]
+    profile_id = collection.insert_one(doc).inserted_id
+    oldest_kept = list(collection.find({}, {'_id': 1}, sort=[('_id', -1)], skip=keep - 1, limit=1))
+    if oldest_kept:
+        collection.delete_many({'_id': {'$lt': oldest_kept[0]['_id']}})
+    return profile_id
+
+
+def recent_profiles(db, limit=100):
+    return list(db[PROFILES_COLLECTION].find({}, {'pstats': 0, 'collapsed': 0}, sort=[('_id', -1)], limit=limit))
+
+
+def profile_file(db, profile_id, kind):
+    """(bytes, filename) of a stored profile as 'pstats' or 'collapsed', or None"""
+    doc = db[PROFILES_COLLECTION].find_one({'_id': profile_id}, {kind: 1, 'endpoint': 1})
+    if not doc or not doc.get(kind):
+        return None
+    extension = 'prof' if kind == 'pstats' else 'folded'
+    return zlib.decompress(doc[kind]), 'profile-{}-{}.{}'.format(doc.get('endpoint') or 'request', profile_id, extension)
+
+
+# ==================== FLASK HOOKS ====================
+def init_app(app, mongo):
+    """Start profilers for flagged or sampled requests and store their profiles"""
+    sample_rate = app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+    interval = app.config.get('PROFILE_SAMPLE_INTERVAL', 0.005)
+    default_mode = app.config.get('PROFILE_DEFAULT_MODE', 'sample')
+    keep = app.config.get('PROFILE_KEEP', 200)
+
+    @app.before_request
+    def start_profile():
+        if request.endpoint in SKIP_ENDPOINTS:
+            return
+        mode = requested_mode(default_mode)
+        if mode is not None:
+            g.profile = ProfileSession(mode, 'admin', interval)
+        elif sample_rate and random.random() < sample_rate:
+            g.profile = ProfileSession('sample', 'sampled', interval)
+
+    @app.after_request
+    def finish_profile(response):
+        session = g.pop('profile', None)
+        if session is None:
+            return response
+        session.stop()
+        if resilience.degraded():
+            return response  # nowhere to store it
+        profile_id = store_profile(mongo.db, session, response, keep)
+        if session.trigger == 'admin':
+            response.headers['X-Profile-Id'] = str(profile_id)
+        return response
+
+    @app.teardown_request
+    def stop_profile(exc=None):
+        # after_request does not run when the response could not be built
+        session = g.pop('profile', None)
+        if session is not None:
+            session.stop()
+
+    # Jinja render time of the request's render_template() calls
+    @before_render_template.connect_via(app)
+    def render_started(sender, template, context, **extra):
+        session = active_session()
+        if session is not None:
+            session.render_started(template.name)
+
+    @template_rendered.connect_via(app)
+    def render_finished(sender, template, context, **extra):
+        session = active_session()
+        if session is not None:
+            session.render_finished(template.name)
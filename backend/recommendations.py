@@ -0,0 +1,153 @@
+"""
+Offline co-purchase recommendations.
+
+Reads the embedded `items` of every order, builds an item-item co-occurrence
+matrix with NumPy and stores the top-k related products per product in the
+`recommendations` collection. Products with too few co-purchases are topped
+up with best sellers from the same category.
+
+Run after new orders accumulate, e.g. nightly:
+
+    flask --app backend.app build-recommendations --top-k 4
+"""
+
+from datetime import datetime
+
+import numpy as np
+from pymongo import ReplaceOne
+
+# Fields copied into each recommendation so product_detail can render the
+# related products from the single recommendation document.
+SNAPSHOT_FIELDS = ('name', 'price', 'image', 'image_url', 'category_id')
+
+
+def load_catalog(db):
+    """Product docs, id -> column index and per-product category codes"""
+    products = list(db.products.find({}, dict.fromkeys(SNAPSHOT_FIELDS, 1)))
+    index = {str(prod['_id']): i for i, prod in enumerate(products)}
+    category_keys = sorted({str(prod.get('category_id')) for prod in products})
+    category_code = {key: code for code, key in enumerate(category_keys)}
+    codes = np.array([category_code[str(prod.get('category_id'))] for prod in products], dtype=np.int32)
+    return products, index, codes
+
+
+def cooccurrence(db, index, batch_size=5000):
+    """Symmetric co-purchase counts (diagonal = number of orders containing the item)"""
+    n = len(index)
+    counts = np.zeros((n, n), dtype=np.float32)
+    baskets = np.zeros((batch_size, n), dtype=np.float32)
+    row = 0
+    for order in db.orders.find({'status': {'$ne': 'cancelled'}}, {'items.product_id': 1}):
+        columns = [index[item['product_id']] for item in order.get('items', [])
+                   if item.get('product_id') in index]
+        if not columns:
+            continue
+        baskets[row, columns] = 1.0
+        row += 1
+        if row == batch_size:
+            counts += baskets.T @ baskets
+            baskets[:] = 0.0
+            row = 0
+    if row:
+        counts += baskets[:row].T @ baskets[:row]
+    return counts
+
+
+def top_k_similar(counts, k):
+    """Cosine-normalised top-k neighbours per item; -1 marks an empty slot"""
+    n = counts.shape[0]
+    if n == 0:
+        return np.empty((0, k), dtype=np.int64)
+    popularity = np.diag(counts).copy()
+    norms = np.sqrt(np.maximum(popularity, 1.0))
+    similarity = counts / norms[:, None] / norms[None, :]
+    np.fill_diagonal(similarity, 0.0)
+    kk = min(k, n - 1) if n > 1 else 0
+    if kk == 0:
+        return np.full((n, k), -1, dtype=np.int64)
+    candidates = np.argpartition(-similarity, kk - 1, axis=1)[:, :kk]
+    scores = np.take_along_axis(similarity, candidates, axis=1)
+    order = np.argsort(-scores, axis=1, kind='stable')
+    neighbours = np.take_along_axis(candidates, order, axis=1)
+    neighbours[np.take_along_axis(scores, order, axis=1) <= 0] = -1
+    if kk < k:
+        neighbours = np.hstack([neighbours, np.full((n, k - kk), -1, dtype=neighbours.dtype)])
+    return neighbours
+
+
+def category_fallback(codes, popularity):
+    """Per category, item indexes ordered by purchase count (best sellers first)"""
+    by_category = {}
+    for code in np.unique(codes):
+        members = np.flatnonzero(codes == code)
+        by_category[int(code)] = members[np.argsort(-popularity[members], kind='stable')]
+    return by_category
+
+
+def snapshot(prod, category_names):
+    doc = {field: prod.get(field) for field in SNAPSHOT_FIELDS}
+    doc['_id'] = prod['_id']
+    doc['category_name'] = category_names.get(prod.get('category_id'), '')
+    return doc
+
+
+def build_recommendations(db, k=4):
+    """Recompute and store recommendations for every product; returns the count written"""
+    products, index, codes = load_catalog(db)
+    if not products:
+        return 0
+    counts = cooccurrence(db, index)
+    neighbours = top_k_similar(counts, k)
+    fallback = category_fallback(codes, np.diag(counts))
+    category_names = {cat['_id']: cat.get('name', '') for cat in db.categories.find({}, {'name': 1})}
+    now = datetime.utcnow()
+
+    requests = []
+    for i, prod in enumerate(products):
+        picks = [int(j) for j in neighbours[i] if j >= 0]
+        co_purchased = len(picks)
+        for j in fallback[int(codes[i])]:
+            if len(picks) >= k:
+                break
+            if j != i and j not in picks:
+                picks.append(int(j))
+        requests.append(ReplaceOne({'_id': str(prod['_id'])}, {
+            'category': {'_id': prod.get('category_id'),
+                         'name': category_names.get(prod.get('category_id'), '')},
+            'related': [snapshot(products[j], category_names) for j in picks],
+            'co_purchased': co_purchased,
+            'updated_at': now,
+        }, upsert=True))
+    db.recommendations.bulk_write(requests, ordered=False)
+    db.recommendations.delete_many({'_id': {'$nin': list(index)}})
+    return len(requests)
+
+
+def refresh_product(db, product_id):
+    """Keep stored snapshots in step after an admin edits or deletes product_id"""
+    prod = db.products.find_one({'_id': product_id}, dict.fromkeys(SNAPSHOT_FIELDS, 1))
+    if not prod:
+        db.recommendations.delete_one({'_id': str(product_id)})
+        db.recommendations.update_many({'related._id': product_id},
+                                       {'$pull': {'related': {'_id': product_id}}})
+        return
+    category = db.categories.find_one({'_id': prod.get('category_id')}, {'name': 1}) or {}
+    category_names = {prod.get('category_id'): category.get('name', '')}
+    db.recommendations.update_many({'related._id': product_id},
+                                   {'$set': {'related.$[r]': snapshot(prod, category_names)}},
+                                   array_filters=[{'r._id': product_id}])
+    db.recommendations.update_one({'_id': str(product_id)},
+                                  {'$set': {'category': {'_id': prod.get('category_id'),
+                                                         'name': category_names[prod.get('category_id')]}}})
+
+
+def init_app(app, mongo):
+    """Register the `flask build-recommendations` batch command"""
+    import click
+
+    @app.cli.command('build-recommendations')
+    @click.option('--top-k', default=4, show_default=True, help='Related products per product')
+    def build_recommendations_command(top_k):
+        """Rebuild co-purchase recommendations from order history."""
+        written = build_recommendations(mongo.db, k=top_k)
+        click.echo('Stored recommendations for {} products'.format(written))
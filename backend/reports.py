@@ -0,0 +1,139 @@
+"""
+Sales reports over the rollup buckets written by backend/rollups.py.
+
+A SalesReport loads one dimension at one granularity for a date range into
+dense (keys x buckets) NumPy arrays with prefix sums, so range totals are two
+lookups per key and moving averages / top-N are single vector operations. The
+work depends on the number of buckets in the range, never on order history.
+
+    report = SalesReport.load(db, dim='product', granularity='day',
+                              start=datetime(2026, 1, 1), end=datetime(2026, 2, 1))
+    report.top(5, 'revenue')
+    report.moving_average('all', 7)
+
+    flask --app backend.app sales-report --dim category --days 30
+"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from backend.rollups import ROLLUP_COLLECTION, bucket_floor
+
+METRICS = ('revenue', 'orders', 'units')
+STEP = {'hour': np.timedelta64(1, 'h'), 'day': np.timedelta64(1, 'D')}
+
+
+def bucket_range(start, end, granularity, tz_name):
+    """Every bucket start in [start, end) as datetime64[s], aligned to the rollup timezone"""
+    first = np.datetime64(bucket_floor(start, granularity, tz_name), 's')
+    return np.arange(first, np.datetime64(end, 's'), STEP[granularity]).astype('datetime64[s]')
+
+
+class SalesReport:
+    """Dense per-key time series for one rollup dimension"""
+
+    def __init__(self, keys, buckets, values):
+        self.keys = keys
+        self.buckets = buckets
+        self.values = values
+        self._row = {key: i for i, key in enumerate(keys)}
+        # prefix[m][:, j] is the sum of buckets [0, j) so any range sum is a subtraction
+        self._prefix = {metric: np.concatenate(
+            [np.zeros((len(keys), 1)), np.cumsum(matrix, axis=1)], axis=1)
+            for metric, matrix in values.items()}
+
+    @classmethod
+    def load(cls, db, dim='total', granularity='day', start=None, end=None):
+        end = end or datetime.utcnow()
+        start = start or end - timedelta(days=30)
+        state = db.meta.find_one({'_id': 'sales_rollup'}, {'timezone': 1}) or {}
+        buckets = bucket_range(start, end, granularity, state.get('timezone', 'UTC'))
+        docs = list(db[ROLLUP_COLLECTION].find(
+            {'granularity': granularity, 'dim': dim,
+             'bucket': {'$gte': buckets[0].item() if len(buckets) else start, '$lt': end}},
+            {'_id': 0, 'key': 1, 'bucket': 1, 'revenue': 1, 'orders': 1, 'units': 1}))
+        keys = sorted({doc['key'] for doc in docs}, key=str)
+        row = {key: i for i, key in enumerate(keys)}
+        values = {metric: np.zeros((len(keys), len(buckets))) for metric in METRICS}
+        if docs:
+            rows = np.fromiter((row[doc['key']] for doc in docs), dtype=np.intp, count=len(docs))
+            stamps = np.array([doc['bucket'] for doc in docs], dtype='datetime64[s]')
+            # Bucket holding each stamp (DST shifts move local day starts by an hour)
+            cols = np.searchsorted(buckets, stamps, side='right') - 1
+            for metric in METRICS:
+                np.add.at(values[metric], (rows, cols),
+                          np.fromiter((doc.get(metric) or 0 for doc in docs), dtype=float, count=len(docs)))
+        return cls(keys, buckets, values)
+
+    def _span(self, start=None, end=None):
+        lo = 0 if start is None else int(np.searchsorted(self.buckets, np.datetime64(start, 's')))
+        hi = len(self.buckets) if end is None else int(np.searchsorted(self.buckets, np.datetime64(end, 's')))
+        return lo, max(lo, hi)
+
+    def totals(self, metric='revenue', start=None, end=None):
+        """Per-key sums over [start, end) as an array aligned with self.keys"""
+        lo, hi = self._span(start, end)
+        prefix = self._prefix[metric]
+        return prefix[:, hi] - prefix[:, lo]
+
+    def range_sum(self, key, metric='revenue', start=None, end=None):
+        row = self._row.get(key)
+        if row is None:
+            return 0.0
+        lo, hi = self._span(start, end)
+        return float(self._prefix[metric][row, hi] - self._prefix[metric][row, lo])
+
+    def moving_average(self, key, window, metric='revenue'):
+        """Trailing mean over `window` buckets; the first window-1 buckets average what exists"""
+        row = self._row.get(key)
+        if row is None:
+            return np.zeros(len(self.buckets))
+        prefix = self._prefix[metric][row]
+        hi = np.arange(1, len(self.buckets) + 1)
+        lo = np.maximum(hi - window, 0)
+        return (prefix[hi] - prefix[lo]) / (hi - lo)
+
+    def top(self, n, metric='revenue', start=None, end=None):
+        """The n keys with the largest totals, as (key, value) pairs, largest first"""
+        totals = self.totals(metric, start, end)
+        n = min(n, len(totals))
+        if n == 0:
+            return []
+        picks = np.argpartition(-totals, n - 1)[:n]
+        picks = picks[np.argsort(-totals[picks], kind='stable')]
+        return [(self.keys[i], float(totals[i])) for i in picks if totals[i] > 0]
+
+
+def key_labels(db, dim):
+    """Human-readable names for product / category keys"""
+    from bson import ObjectId
+    collection = {'product': db.products, 'category': db.categories}.get(dim)
+    if collection is None:
+        return {}
+    return {str(doc['_id']): doc.get('name', '') for doc in collection.find({}, {'name': 1})
+            if isinstance(doc['_id'], ObjectId)}
+
+
+def init_app(app, mongo):
+    """Register the `flask sales-report` command"""
+    import click
+
+    @app.cli.command('sales-report')
+    @click.option('--dim', type=click.Choice(['total', 'product', 'category']), default='total', show_default=True)
+    @click.option('--granularity', type=click.Choice(['hour', 'day']), default='day', show_default=True)
+    @click.option('--days', default=30, show_default=True, help='Days back from now')
+    @click.option('--metric', type=click.Choice(METRICS), default='revenue', show_default=True)
+    @click.option('--top', 'top_n', default=10, show_default=True)
+    def sales_report_command(dim, granularity, days, metric, top_n):
+        """Print sales totals from the rollups (run rollup-sales first)."""
+        end = datetime.utcnow()
+        report = SalesReport.load(mongo.db, dim=dim, granularity=granularity,
+                                  start=end - timedelta(days=days), end=end)
+        labels = key_labels(mongo.db, dim)
+        click.echo('{} by {} over the last {} days'.format(metric, dim, days))
+        for key, value in report.top(top_n, metric):
+            click.echo('{:>14,.2f}  {}'.format(value, labels.get(key, key)))
+        if dim == 'total' and report.keys:
+            trend = report.moving_average('all', 7 if granularity == 'day' else 24, metric)
+            click.echo('Latest moving average: {:,.2f}'.format(trend[-1]))
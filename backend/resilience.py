@@ -0,0 +1,243 @@
+"""
+Degraded-mode serving when MongoDB is slow or unreachable.
+
+Budgets. The client gets short connect / server selection timeouts
+(MONGO_CONNECT_TIMEOUT_MS, MONGO_SERVER_SELECTION_TIMEOUT_MS). Every request
+runs inside pymongo.timeout(DB_REQUEST_TIMEOUT_MS), and each repository query
+inside models.query_budget() (DB_QUERY_TIMEOUT_MS). PyMongo sends the remaining budget
+as maxTimeMS and enforces it client side, so a stalled primary costs a request
+at most its budget instead of the driver defaults.
+
+Breaker. Each worker counts database unavailability (connection failures,
+timeouts). BREAKER_FAILURE_THRESHOLD of them within BREAKER_WINDOW_SECONDS
+open the breaker. While it is open no request waits on Mongo. After
+BREAKER_OPEN_SECONDS one request pings the server: success closes the breaker,
+failure keeps it open for another period.
+
+Degraded requests. While the breaker is open, or after a catalog view hit a
+failure:
+
+* index, categories, shop and product_detail render from the catalog
+  snapshot, with a banner, a `Warning: 110` header and Cache-Control: no-store;
+* signed-in users stay signed in from the last good user records;
+* /metrics and search suggestions keep working from in-process state;
+* every other endpoint (cart, checkout, account, admin, API) answers 503 with
+  Retry-After at once (JSON for AJAX requests).
+
+Snapshot. The in-memory catalog of backend/catalog_engine.py is the last good
+copy of all categories and products. Catalog page requests refresh it when the
+catalog version changes; it is also written to CATALOG_SNAPSHOT_PATH, so a
+worker started during an outage can still serve it.
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+import pymongo
+from flask import current_app, g, has_request_context, jsonify, render_template, request
+from pymongo.errors import ConnectionFailure, ExecutionTimeout, PyMongoError
+from werkzeug.exceptions import ServiceUnavailable
+
+from backend.catalog_engine import catalog
+
+UNAVAILABLE_ERRORS = (ConnectionFailure, ExecutionTimeout)
+CATALOG_ENDPOINTS = ('index', 'categories', 'shop', 'product_detail')
+# Endpoints that work without the database in degraded mode (metrics are in-process,
+# suggestions come from the in-memory index)
+DEGRADED_ENDPOINTS = CATALOG_ENDPOINTS + ('static', 'about', 'contact', 'sitemap', 'metrics', 'api.search_suggest')
+# Streaming responses read for as long as the client does: no request budget
+UNBUDGETED_ENDPOINTS = ('admin_export_orders', 'live_events')
+
+
+class DatabaseUnavailable(ServiceUnavailable):
+    description = 'We are having trouble reaching our database. Please try again in a moment.'
+
+    def __init__(self, retry_after=5):
+        super().__init__(retry_after=retry_after)
+
+
+# ==================== CIRCUIT BREAKER ====================
+class CircuitBreaker:
+    """Opens after `threshold` failures within `window` seconds; probed with a ping after `open_seconds`"""
+
+    def __init__(self, threshold=5, window=10.0, open_seconds=15.0, probe_timeout=0.5):
+        self.threshold = threshold
+        self.window = window
+        self.open_seconds = open_seconds
+        self.probe_timeout = probe_timeout
+        self.mongo = None
+        self._failures = deque()
+        self._opened_at = None
+        self._lock = threading.Lock()
+        self._probe_lock = threading.Lock()
+
+    def record_failure(self):
+        now = time.monotonic()
+        with self._lock:
+            self._failures.append(now)
+            while self._failures and self._failures[0] < now - self.window:
+                self._failures.popleft()
+            if self._opened_at is not None or len(self._failures) < self.threshold:
+                return
+            self._opened_at = now
+        current_app.logger.warning('database circuit breaker opened after %d failures in %.0fs',
+                                   self.threshold, self.window)
+
+    def is_open(self):
+        with self._lock:
+            opened_at = self._opened_at
+        if opened_at is None:
+            return False
+        if time.monotonic() - opened_at < self.open_seconds:
+            return True
+        # Cool-down over: one thread probes, the others keep failing fast meanwhile
+        if not self._probe_lock.acquire(blocking=False):
+            return True
+        try:
+            try:
+                with pymongo.timeout(self.probe_timeout):
+                    self.mongo.db.command('ping')
+            except PyMongoError:
+                with self._lock:
+                    self._opened_at = time.monotonic()
+                return True
+            with self._lock:
+                self._opened_at = None
+                self._failures.clear()
+            current_app.logger.warning('database circuit breaker closed')
+            return False
+        finally:
+            self._probe_lock.release()
+
+    def retry_after(self):
+        with self._lock:
+            opened_at = self._opened_at
+        if opened_at is None:
+            return 1
+        return max(1, int(self.open_seconds - (time.monotonic() - opened_at)) + 1)
+
+
+breaker = CircuitBreaker()
+
+
+def degraded():
+    """True when this request must not wait on the database (decided once per request)"""
+    if not has_request_context():
+        return False
+    if 'degraded' not in g:
+        g.degraded = breaker.is_open()
+    return g.degraded
+
+
+def record_unavailable():
+    """Count a database failure against the breaker and degrade the rest of the request"""
+    breaker.record_failure()
+    if has_request_context():
+        g.degraded = True
+
+
+# ==================== LAST GOOD DATA ====================
+class LastGood:
+    """Bounded LRU of the last good value per key"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            return self._entries.get(key)
+
+
+last_good_users = LastGood(maxsize=10000)
+
+
+# ==================== VIEWS ====================
+def serve_stale_on_failure(stale_view):
+    """Run the view, or stale_view (a render from the in-memory catalog) when the database is unavailable"""
+    from functools import wraps
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not degraded():
+                try:
+                    return view(*args, **kwargs)
+                except UNAVAILABLE_ERRORS:
+                    record_unavailable()
+            if not catalog.available:
+                raise DatabaseUnavailable(breaker.retry_after())
+            g.catalog_stale = catalog.taken_at
+            return stale_view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def wants_json():
+    return (request.is_json or request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+            or request.path.startswith('/api/'))
+
+
+def init_app(app, mongo):
+    """Request budgets, the breaker and the degraded-mode hooks"""
+    request_timeout = app.config.get('DB_REQUEST_TIMEOUT_MS', 0) / 1000.0 or None
+    breaker.mongo = mongo
+    breaker.threshold = app.config.get('BREAKER_FAILURE_THRESHOLD', 5)
+    breaker.window = app.config.get('BREAKER_WINDOW_SECONDS', 10)
+    breaker.open_seconds = app.config.get('BREAKER_OPEN_SECONDS', 15)
+    breaker.probe_timeout = app.config.get('BREAKER_PROBE_TIMEOUT_MS', 500) / 1000.0
+
+    @app.before_request
+    def start_db_budget():
+        if request_timeout and request.endpoint not in UNBUDGETED_ENDPOINTS:
+            g.db_budget = pymongo.timeout(request_timeout)
+            g.db_budget.__enter__()
+        if degraded():
+            if request.endpoint not in DEGRADED_ENDPOINTS:
+                raise DatabaseUnavailable(breaker.retry_after())
+        elif request.endpoint in CATALOG_ENDPOINTS:
+            try:
+                catalog.refresh_if_stale(mongo.db)
+            except UNAVAILABLE_ERRORS:
+                record_unavailable()
+
+    @app.teardown_request
+    def end_db_budget(exc=None):
+        budget = g.pop('db_budget', None)
+        if budget is not None:
+            budget.__exit__(None, None, None)
+
+    @app.after_request
+    def mark_stale(response):
+        if g.get('catalog_stale'):
+            response.headers['Warning'] = '110 - "Response is Stale"'
+            response.headers['Cache-Control'] = 'no-store'
+        return response
+
+    @app.errorhandler(DatabaseUnavailable)
+    def unavailable(error):
+        g.degraded = True
+        if wants_json():
+            response = jsonify({'success': False, 'message': error.description})
+        else:
+            response = app.make_response(render_template('503.html', message=error.description))
+        response.status_code = 503
+        response.headers['Retry-After'] = str(error.retry_after)
+        return response
+
+    def database_error(error):
+        # A query failed outside the catalog views' fallback
+        record_unavailable()
+        return unavailable(DatabaseUnavailable(breaker.retry_after()))
+
+    for error_class in UNAVAILABLE_ERRORS:
+        app.register_error_handler(error_class, database_error)
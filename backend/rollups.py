@@ -0,0 +1,173 @@
+"""
+Incremental sales rollups.
+
+Maintains hourly and daily buckets of revenue, order count and units in the
+`sales_rollups` collection, one document per (granularity, bucket, dimension,
+key):
+
+    {_id: {g: 'day', t: <bucket start>, dim: 'product', key: '<product id>'},
+     granularity: 'day', bucket: <bucket start>, dim: 'product', key: '...',
+     revenue: 123.0, orders: 4, units: 9}
+
+Dimensions are 'total' (key 'all'), 'product' and 'category'. Each run only
+aggregates orders from the start of the day holding the high-water mark
+(`meta._id='sales_rollup'`) up to a short settle delay before now, and $merge
+replaces the touched buckets (buckets left without orders are removed).
+Re-running is therefore idempotent, and orders placed or cancelled earlier
+the same day are picked up by the next run.
+Cancelled orders are excluded; a cancellation on an already settled day needs
+`--rebuild`. Orders moved to the archive tier (backend/archive.py) are no
+longer in `orders`, so a rebuild keeps the buckets before the archive horizon
+and recomputes from there.
+
+Run from cron, e.g. every few minutes:
+
+    flask --app backend.app rollup-sales
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from zoneinfo import ZoneInfo
+
+ROLLUP_COLLECTION = 'sales_rollups'
+GRANULARITIES = ('hour', 'day')
+SETTLE_SECONDS = 60
+
+
+def bucket_floor(moment, unit, tz_name):
+    """Start (naive UTC) of the hour or local day bucket holding moment"""
+    local = moment.replace(tzinfo=timezone.utc).astimezone(ZoneInfo(tz_name))
+    local = local.replace(minute=0, second=0, microsecond=0)
+    if unit == 'day':
+        local = local.replace(hour=0)
+    return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def order_match(start, cutoff):
+    created = {'$lt': cutoff}
+    if start is not None:
+        created['$gte'] = start
+    return {'$match': {'created_at': created, 'status': {'$ne': 'cancelled'}}}
+
+
+def bucket_expr(unit, tz_name):
+    return {'$dateTrunc': {'date': '$created_at', 'unit': unit, 'timezone': tz_name}}
+
+
+def merge_stage(unit, dim, now):
+    """Shape grouped rows ({_id: {t, key}, revenue, orders, units}) and $merge them"""
+    return [
+        {'$project': {
+            '_id': {'g': unit, 't': '$_id.t', 'dim': dim, 'key': '$_id.key'},
+            'granularity': unit,
+            'bucket': '$_id.t',
+            'dim': dim,
+            'key': '$_id.key',
+            'revenue': 1,
+            'orders': 1,
+            'units': 1,
+            'updated_at': {'$literal': now},
+        }},
+        {'$merge': {'into': ROLLUP_COLLECTION, 'on': '_id',
+                    'whenMatched': 'replace', 'whenNotMatched': 'insert'}},
+    ]
+
+
+def line_revenue():
+    return {'$multiply': [{'$ifNull': ['$items.price', 0]}, {'$ifNull': ['$items.quantity', 0]}]}
+
+
+def total_pipeline(start, cutoff, unit, tz_name, now):
+    return [
+        order_match(start, cutoff),
+        {'$group': {
+            '_id': {'t': bucket_expr(unit, tz_name), 'key': 'all'},
+            'revenue': {'$sum': {'$ifNull': ['$total_amount', 0]}},
+            'orders': {'$sum': 1},
+            'units': {'$sum': {'$sum': '$items.quantity'}},
+        }},
+    ] + merge_stage(unit, 'total', now)
+
+
+def product_pipeline(start, cutoff, unit, tz_name, now):
+    # Cart lines are unique per product, so each line is one order for that product
+    return [
+        order_match(start, cutoff),
+        {'$unwind': '$items'},
+        {'$group': {
+            '_id': {'t': bucket_expr(unit, tz_name), 'key': '$items.product_id'},
+            'revenue': {'$sum': line_revenue()},
+            'orders': {'$sum': 1},
+            'units': {'$sum': {'$ifNull': ['$items.quantity', 0]}},
+        }},
+    ] + merge_stage(unit, 'product', now)
+
+
+def category_pipeline(start, cutoff, unit, tz_name, now):
+    return [
+        order_match(start, cutoff),
+        {'$unwind': '$items'},
+        {'$addFields': {'product_oid': {'$convert': {'input': '$items.product_id', 'to': 'objectId',
+                                                     'onError': None, 'onNull': None}}}},
+        {'$lookup': {'from': 'products', 'localField': 'product_oid', 'foreignField': '_id',
+                     'as': 'product'}},
+        # One row per (bucket, category, order) so an order counts once per category
+        {'$group': {
+            '_id': {'t': bucket_expr(unit, tz_name),
+                    'key': {'$toString': {'$first': '$product.category_id'}},
+                    'order': '$_id'},
+            'revenue': {'$sum': line_revenue()},
+            'units': {'$sum': {'$ifNull': ['$items.quantity', 0]}},
+        }},
+        {'$group': {
+            '_id': {'t': '$_id.t', 'key': '$_id.key'},
+            'revenue': {'$sum': '$revenue'},
+            'orders': {'$sum': 1},
+            'units': {'$sum': '$units'},
+        }},
+    ] + merge_stage(unit, 'category', now)
+
+
+def ensure_rollup_indexes(db):
+    # Report reads are range scans of one dimension; orders.created_at is indexed by ensure_indexes
+    db[ROLLUP_COLLECTION].create_index([('granularity', 1), ('dim', 1), ('bucket', 1)])
+
+
+def rollup_sales(db, tz_name='UTC', rebuild=False, now=None):
+    """Bring the rollups up to date; returns the (start, cutoff) window processed"""
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(seconds=SETTLE_SECONDS)
+    state = db.meta.find_one({'_id': 'sales_rollup'}) or {}
+    if rebuild or not state.get('through'):
+        # The archive cutoff is a day boundary in the rollup timezone
+        archived = db.meta.find_one({'_id': 'order_archive'}, {'through': 1}) or {}
+        start = archived.get('through')
+        db[ROLLUP_COLLECTION].delete_many({'bucket': {'$gte': start}} if start else {})
+    else:
+        # Whole days are recomputed, so every touched bucket is replaced with a full count
+        start = bucket_floor(state['through'], 'day', tz_name)
+    ensure_rollup_indexes(db)
+    for unit in GRANULARITIES:
+        for pipeline in (total_pipeline, product_pipeline, category_pipeline):
+            db.orders.aggregate(pipeline(start, cutoff, unit, tz_name, now))
+    if start is not None:
+        # Buckets in the window that this run did not rewrite no longer have orders
+        db[ROLLUP_COLLECTION].delete_many({'bucket': {'$gte': start}, 'updated_at': {'$ne': now}})
+    db.meta.update_one({'_id': 'sales_rollup'},
+                       {'$set': {'through': cutoff, 'timezone': tz_name, 'updated_at': now}},
+                       upsert=True)
+    return start, cutoff
+
+
+def init_app(app, mongo):
+    """Register the `flask rollup-sales` command"""
+    import click
+
+    @app.cli.command('rollup-sales')
+    @click.option('--rebuild', is_flag=True, help='Drop all buckets and recompute from every order')
+    def rollup_sales_command(rebuild):
+        """Update hourly and daily sales rollups since the last run."""
+        tz_name = app.config.get('SALES_ROLLUP_TIMEZONE', 'UTC')
+        start, cutoff = rollup_sales(mongo.db, tz_name=tz_name, rebuild=rebuild)
+        click.echo('Rolled up orders from {} to {} ({})'.format(
+            start.isoformat() if start else 'the beginning', cutoff.isoformat(), tz_name))
@@ -0,0 +1,165 @@
+import logging
+import math
+import re
+import threading
+from bisect import bisect_left, insort
+
+from backend import resilience
+from backend.cache import catalog_version
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+MAX_SCAN = 500
+
+
+def index_terms(label):
+    """Lower-cased full label plus each word, so "app" finds "Organic Apples" """
+    lowered = label.lower().strip()
+    terms = {lowered}
+    terms.update(WORD_RE.findall(lowered))
+    return terms
+
+
+class SuggestIndex:
+    """In-memory prefix index over product and category names.
+
+    Entries are kept in one sorted list of (term, -weight, kind, id) tuples and
+    prefix queries are a bisect plus a short forward scan. The index is
+    rebuilt from Mongo in a background thread whenever the catalog version
+    moves, the previous index answering meanwhile; admin writes in this
+    worker patch it in place instead.
+    """
+
+    def __init__(self, mongo=None):
+        self.mongo = mongo
+        self.version = None
+        self._entries = []
+        self._labels = {}
+        self._weights = {}
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+
+    # ---- building ----
+    def popularity(self):
+        """Units ordered per product id"""
+        return {row['_id']: row['units'] for row in self.mongo.db.orders.aggregate([
+            {'$unwind': '$items'},
+            {'$group': {'_id': '$items.product_id', 'units': {'$sum': '$items.quantity'}}}
+        ]) if row['_id']}
+
+    def rebuild(self, version):
+        units = self.popularity()
+        labels, weights, entries = {}, {}, []
+        category_units = {}
+        for prod in self.mongo.db.products.find({}, {'name': 1, 'category_id': 1}):
+            key = ('product', str(prod['_id']))
+            sold = units.get(key[1], 0)
+            category_units[prod.get('category_id')] = category_units.get(prod.get('category_id'), 0) + sold
+            labels[key] = prod.get('name') or ''
+            weights[key] = math.log1p(sold)
+        for cat in self.mongo.db.categories.find({}, {'name': 1}):
+            key = ('category', str(cat['_id']))
+            labels[key] = cat.get('name') or ''
+            # Categories outrank single products with the same prefix
+            weights[key] = math.log1p(category_units.get(cat['_id'], 0)) + 1.0
+        for key, label in labels.items():
+            entries.extend((term, -weights[key], key[0], key[1]) for term in index_terms(label))
+        entries.sort()
+        with self._lock:
+            self._entries, self._labels, self._weights = entries, labels, weights
+            self.version = version
+
+    def ensure_fresh(self):
+        version = catalog_version.current()
+        if self.version == version:
+            return
+        if self.version is None:
+            # Nothing to serve yet: the first build is waited for
+            with self._rebuild_lock:
+                if self.version is None:
+                    self.rebuild(version)
+            return
+        # The popularity aggregation scans every order, so later rebuilds run in
+        # the background and typeahead keeps using the previous index meanwhile
+        if self._rebuild_lock.acquire(blocking=False):
+            threading.Thread(target=self._rebuild_in_background, args=(version,),
+                             name='suggest-rebuild', daemon=True).start()
+
+    def _rebuild_in_background(self, version):
+        try:
+            self.rebuild(version)
+        except Exception:
+            # Left on the old version: a later suggest request tries again
+            logger.warning('suggest index rebuild failed', exc_info=True)
+        finally:
+            self._rebuild_lock.release()
+
+    def _adopt(self, version):
+        # Our own write bumped the version: skip the rebuild only if no other
+        # worker's write happened in between
+        if version is not None and self.version == version - 1:
+            self.version = version
+
+    # ---- incremental updates ----
+    def _remove(self, entries, key):
+        label = self._labels.pop(key, None)
+        weight = self._weights.pop(key, 0.0)
+        if label is None:
+            return
+        for term in index_terms(label):
+            entry = (term, -weight, key[0], key[1])
+            i = bisect_left(entries, entry)
+            if i < len(entries) and entries[i] == entry:
+                del entries[i]
+
+    def upsert_product(self, product_id, name, version=None):
+        """Reflect an added or renamed product without a rebuild"""
+        key = ('product', str(product_id))
+        with self._lock:
+            entries = list(self._entries)
+            weight = self._weights.get(key, 0.0)
+            self._remove(entries, key)
+            self._labels[key], self._weights[key] = name or '', weight
+            for term in index_terms(name or ''):
+                insort(entries, (term, -weight, key[0], key[1]))
+            self._entries = entries
+            self._adopt(version)
+
+    def remove_product(self, product_id, version=None):
+        with self._lock:
+            entries = list(self._entries)
+            self._remove(entries, ('product', str(product_id)))
+            self._entries = entries
+            self._adopt(version)
+
+    # ---- querying ----
+    def suggest(self, prefix, limit=8):
+        """Best (kind, id, label) matches for a typed prefix, most popular first"""
+        prefix = prefix.lower().strip()
+        if not prefix:
+            return []
+        # While the database is unavailable the index stays as it is
+        if not resilience.degraded():
+            try:
+                self.ensure_fresh()
+            except resilience.UNAVAILABLE_ERRORS:
+                resilience.record_unavailable()
+        entries, labels = self._entries, self._labels
+        start = bisect_left(entries, (prefix,))
+        best = {}
+        for term, neg_weight, kind, item_id in entries[start:start + MAX_SCAN]:
+            if not term.startswith(prefix):
+                break
+            key = (kind, item_id)
+            if key not in best or neg_weight < best[key]:
+                best[key] = neg_weight
+        ranked = sorted(best.items(), key=lambda item: (item[1], labels.get(item[0], '')))
+        return [(kind, item_id, labels.get((kind, item_id), '')) for (kind, item_id), _ in ranked[:limit]]
+
+
+suggest_index = SuggestIndex()
+
+
+def init_app(app, mongo):
+    suggest_index.mongo = mongo
@@ -0,0 +1,236 @@
+"""
+Static file serving outside Flask.
+
+With STATIC_SERVE_MODE set to anything but 'flask', StaticFilesMiddleware answers
+GET/HEAD requests under the static URL prefix before Flask sees them: no request
+context, session, admission or per-request hooks. Modes:
+
+* sendfile         - the file object is handed to the server's wsgi.file_wrapper;
+                     gunicorn turns that into os.sendfile(), so bytes go from the
+                     page cache to the socket without passing through Python
+* x-accel-redirect - reply with headers only and let nginx serve the file from an
+                     internal location (STATIC_ACCEL_PREFIX), freeing the worker at once:
+                         location /_static/ { internal; alias /srv/app/frontend/static/; }
+* x-sendfile       - the same for Apache mod_xsendfile / lighttpd (X-Sendfile: <path>)
+
+Responses the file_wrapper cannot send - no wsgi.file_wrapper from the server,
+or a range that stops short of the end of the file - are served, for small files
+(<= STATIC_HOT_FILE_MAX_BYTES), from an LRU hot set of mmaps bounded by
+STATIC_HOT_CACHE_BYTES. The mapping shares the OS page cache, so no worker
+read()s them per request; WSGI servers only accept bytes, so the requested
+range is still copied out of it once. Entries are revalidated against the
+file's size and mtime on each request.
+
+Responses carry ETag / Last-Modified and honour If-None-Match, If-Modified-Since,
+Range (one byte range; a multi-range request gets the full file) and If-Range.
+Uploaded images keep their immutable Cache-Control.
+
+To take static traffic off the app workers entirely, run a separate pool:
+
+    gunicorn -w 2 -b :8001 'backend.static_files:create_static_app()'
+
+and route /static to it from the front proxy.
+"""
+
+import mimetypes
+import mmap
+import os
+import stat
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from werkzeug.http import http_date, is_resource_modified, parse_date, parse_range_header, quote_etag
+from werkzeug.security import safe_join
+
+from backend.uploads import IMMUTABLE_CACHE_CONTROL, UPLOAD_SUBDIR
+
+MODES = ('flask', 'sendfile', 'x-accel-redirect', 'x-sendfile')
+BLOCK_SIZE = 64 * 1024
+
+
+# ==================== HOT SET ====================
+class HotCache:
+    """LRU of read-only mmaps keyed by path, bounded by total mapped bytes"""
+
+    def __init__(self, max_bytes, max_file_bytes):
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path, st):
+        """The mapping for path if cacheable, mapping it on first use; else None"""
+        if not 0 < st.st_size <= min(self.max_file_bytes, self.max_bytes):
+            return None
+        signature = (st.st_size, st.st_mtime_ns)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry[0] == signature:
+                self._entries.move_to_end(path)
+                return entry[1]
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mapped) != st.st_size:
+            # Changed between stat() and open(); serve it from disk this time
+            return None
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old:
+                self.size -= old[0][0]
+            self._entries[path] = (signature, mapped)
+            self.size += st.st_size
+            while self.size > self.max_bytes:
+                # Evicted maps are closed by GC once in-flight responses drop them
+                _, (evicted_signature, _) = self._entries.popitem(last=False)
+                self.size -= evicted_signature[0]
+        return mapped
+
+
+def iter_file(f, start, length, block_size=BLOCK_SIZE):
+    try:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(block_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+# ==================== MIDDLEWARE ====================
+class StaticFilesMiddleware:
+    def __init__(self, app, directory, url_prefix='/static', mode='sendfile', accel_prefix='/_static/',
+                 max_age=0, hot_cache_bytes=0, hot_file_max_bytes=128 * 1024):
+        if mode not in MODES or mode == 'flask':
+            raise ValueError('Unsupported static serving mode: {!r}'.format(mode))
+        self.app = app
+        self.directory = os.path.abspath(directory)
+        self.url_prefix = url_prefix.rstrip('/') + '/'
+        self.mode = mode
+        self.accel_prefix = accel_prefix.rstrip('/') + '/'
+        self.cache_control = 'public, max-age={}'.format(max_age) if max_age else 'no-cache'
+        self.hot = HotCache(hot_cache_bytes, hot_file_max_bytes) if mode == 'sendfile' and hot_cache_bytes else None
+        self.immutable_prefix = 'images/{}/'.format(UPLOAD_SUBDIR)
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if environ.get('REQUEST_METHOD') not in ('GET', 'HEAD') or not path.startswith(self.url_prefix):
+            return self.app(environ, start_response)
+        filename = path[len(self.url_prefix):]
+        full_path = safe_join(self.directory, filename) if filename else None
+        try:
+            st = os.stat(full_path) if full_path else None
+        except OSError:
+            st = None
+        if st is None or not stat.S_ISREG(st.st_mode):
+            # Not ours to answer: Flask gives the usual 404
+            return self.app(environ, start_response)
+        return self.serve(environ, start_response, filename, full_path, st)
+
+    def serve(self, environ, start_response, filename, full_path, st):
+        etag = quote_etag('{:x}-{:x}'.format(st.st_size, st.st_mtime_ns))
+        last_modified = datetime.fromtimestamp(int(st.st_mtime), timezone.utc)
+        headers = [
+            ('ETag', etag),
+            ('Last-Modified', http_date(last_modified)),
+            ('Cache-Control', IMMUTABLE_CACHE_CONTROL if filename.startswith(self.immutable_prefix)
+             else self.cache_control),
+        ]
+        if not is_resource_modified(environ, etag=etag, last_modified=last_modified):
+            start_response('304 Not Modified', headers)
+            return []
+
+        headers.append(('Content-Type', mimetypes.guess_type(filename)[0] or 'application/octet-stream'))
+        if self.mode == 'x-accel-redirect':
+            # nginx does Range and the transfer itself
+            start_response('200 OK', headers + [
+                ('X-Accel-Redirect', self.accel_prefix + quote(filename)), ('Content-Length', '0')])
+            return []
+        if self.mode == 'x-sendfile':
+            start_response('200 OK', headers + [('X-Sendfile', full_path), ('Content-Length', '0')])
+            return []
+
+        size = st.st_size
+        start, stop, status = 0, size, '200 OK'
+        headers.append(('Accept-Ranges', 'bytes'))
+        byte_range = self.requested_range(environ, etag, last_modified)
+        if byte_range is not None and len(byte_range.ranges) == 1:
+            # werkzeug gives [first, last) with last None for "first-", or (-n, None) for a suffix
+            first, last = byte_range.ranges[0]
+            if first < 0:
+                start = max(size + first, 0)
+            else:
+                start, stop = first, size if last is None else min(last, size)
+            if start >= stop:
+                start_response('416 Range Not Satisfiable', headers + [
+                    ('Content-Range', 'bytes */{}'.format(size)), ('Content-Length', '0')])
+                return []
+            status = '206 Partial Content'
+            headers.append(('Content-Range', 'bytes {}-{}/{}'.format(start, stop - 1, size)))
+        headers.append(('Content-Length', str(stop - start)))
+        start_response(status, headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper and stop == size:
+            # gunicorn sends Content-Length bytes from the current offset with os.sendfile
+            f = open(full_path, 'rb')
+            f.seek(start)
+            return file_wrapper(f, BLOCK_SIZE)
+        mapped = self.hot.get(full_path, st) if self.hot else None
+        if mapped is not None:
+            return [mapped[start:stop]]
+        return iter_file(open(full_path, 'rb'), start, stop - start)
+
+    @staticmethod
+    def requested_range(environ, etag, last_modified):
+        """The parsed Range header, unless If-Range says the client's copy is stale"""
+        byte_range = parse_range_header(environ.get('HTTP_RANGE'))
+        if byte_range is not None and byte_range.units != 'bytes':
+            return None  # Unknown range units are ignored (RFC 9110 14.2)
+        if_range = environ.get('HTTP_IF_RANGE')
+        if byte_range is None or not if_range:
+            return byte_range
+        if if_range.startswith(('"', 'W/')):
+            # If-Range needs a strong match
+            return byte_range if if_range == etag else None
+        since = parse_date(if_range)
+        return byte_range if since and since == last_modified else None
+
+
+def middleware_from_config(app, config, directory, url_prefix):
+    return StaticFilesMiddleware(
+        app, directory, url_prefix=url_prefix,
+        mode=config.get('STATIC_SERVE_MODE', 'sendfile'),
+        accel_prefix=config.get('STATIC_ACCEL_PREFIX', '/_static/'),
+        max_age=config.get('STATIC_MAX_AGE', 0),
+        hot_cache_bytes=config.get('STATIC_HOT_CACHE_BYTES', 0),
+        hot_file_max_bytes=config.get('STATIC_HOT_FILE_MAX_BYTES', 128 * 1024))
+
+
+def not_found(environ, start_response):
+    start_response('404 Not Found', [('Content-Type', 'text/plain'), ('Content-Length', '9')])
+    return [b'Not Found']
+
+
+def create_static_app():
+    """Standalone WSGI app serving only the static folder, for a dedicated gunicorn pool"""
+    from backend.config import Config
+    config = {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+    if config.get('STATIC_SERVE_MODE', 'flask') == 'flask':
+        config['STATIC_SERVE_MODE'] = 'sendfile'
+    directory = os.path.join(Config.PROJECT_ROOT, 'frontend', 'static')
+    return middleware_from_config(not_found, config, directory, '/static')
+
+
+def init_app(app):
+    """Serve app.static_folder outside Flask unless STATIC_SERVE_MODE is 'flask'"""
+    if app.config.get('STATIC_SERVE_MODE', 'flask') == 'flask':
+        return
+    app.wsgi_app = middleware_from_config(app.wsgi_app, app.config, app.static_folder, app.static_url_path)
@@ -0,0 +1,99 @@
+import os
+import re
+import time
+
+from flask import g, has_request_context
+from jinja2 import FileSystemBytecodeCache, Template
+
+
+# ==================== BYTECODE CACHE ====================
+def configure_bytecode_cache(app):
+    """Share compiled templates between gunicorn workers and across restarts.
+
+    Jinja keys each cache file by template name and checks the source checksum,
+    so edited templates are recompiled automatically after a deploy.
+    """
+    cache_dir = app.config.get('JINJA_CACHE_DIR')
+    if not cache_dir:
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+
+def warm_templates(app):
+    """Compile (or load from the bytecode cache) every template at boot"""
+    compiled = 0
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(name)
+        compiled += 1
+    return compiled
+
+
+# ==================== RENDER TIMING ====================
+def current_timings():
+    if not has_request_context():
+        return None
+    if 'template_timings' not in g:
+        g.template_timings = {}
+    return g.template_timings
+
+
+def timed_render_func(name, render_func):
+    """Wrap a template's root render function to accumulate its active time.
+
+    Times are inclusive: a parent such as base.html also counts the child
+    blocks it pulls in, and a child template counts its parent layout.
+    """
+    def root_render_func(context):
+        timings = current_timings()
+        if timings is None:
+            yield from render_func(context)
+            return
+        chunks = render_func(context)
+        elapsed = 0.0
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - started
+                yield chunk
+        finally:
+            timings[name] = timings.get(name, 0.0) + elapsed * 1000.0
+    return root_render_func
+
+
+class TimedTemplate(Template):
+    """Template whose renders (including use as a parent layout) are timed per request"""
+
+    @classmethod
+    def _from_namespace(cls, environment, namespace, globals):
+        template = super()._from_namespace(environment, namespace, globals)
+        template.root_render_func = timed_render_func(template.name, template.root_render_func)
+        return template
+
+
+def server_timing_name(template_name):
+    return 'tpl-' + re.sub(r'[^A-Za-z0-9]+', '-', template_name).strip('-')
+
+
+def init_app(app):
+    """Set up the bytecode cache, optional per-template render timing and warm-up"""
+    configure_bytecode_cache(app)
+    if app.config.get('TEMPLATE_RENDER_TIMING'):
+        app.jinja_env.template_class = TimedTemplate
+
+        @app.after_request
+        def emit_template_timings(response):
+            timings = g.get('template_timings')
+            if timings:
+                response.headers.add('Server-Timing', ', '.join(
+                    '{};dur={:.2f};desc="{}"'.format(server_timing_name(name), ms, name)
+                    for name, ms in timings.items()))
+            return response
+
+    if app.config.get('TEMPLATE_WARMUP', True):
+        warm_templates(app)
@@ -0,0 +1,132 @@
+"""
+Content-addressed image uploads.
+
+The request body is streamed to a temporary file in fixed-size chunks while it
+is hashed, so memory stays flat whatever the upload size. The file is then
+renamed to `<UPLOAD_FOLDER>/uploads/<aa>/<sha256>.<ext>`: uploading the same
+image twice keeps one copy and returns the existing name. Because a name can
+only ever hold one content, the files are served with a one-year immutable
+Cache-Control.
+
+Only JPEG, PNG, GIF and WebP are accepted, recognised from their first bytes
+before anything is written to disk (SVG is refused: it can carry script).
+"""
+
+import hashlib
+import os
+import tempfile
+
+from flask import request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+UPLOAD_SUBDIR = 'uploads'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+HEADER_BYTES = 12
+
+
+class UploadError(ValueError):
+    """Upload rejected; status is the HTTP status to answer with"""
+    status = 400
+
+
+class UnsupportedImage(UploadError):
+    status = 415
+
+
+class StoredUpload:
+    __slots__ = ('filename', 'digest', 'size', 'deduplicated')
+
+    def __init__(self, filename, digest, size, deduplicated):
+        self.filename = filename
+        self.digest = digest
+        self.size = size
+        self.deduplicated = deduplicated
+
+
+def sniff_image_type(header):
+    """File extension for a JPEG/PNG/GIF/WebP header, or None"""
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def read_header(stream, size=HEADER_BYTES):
+    """Read until `size` bytes or EOF (a stream may return short reads)"""
+    header = b''
+    while len(header) < size:
+        chunk = stream.read(size - len(header))
+        if not chunk:
+            break
+        header += chunk
+    return header
+
+
+def store_image(stream, folder, chunk_size=64 * 1024, max_bytes=None):
+    """Stream an image into content-addressed storage under folder; returns a StoredUpload"""
+    header = read_header(stream)
+    if not header:
+        raise UploadError('Empty upload')
+    ext = sniff_image_type(header)
+    if ext is None:
+        raise UnsupportedImage('Only JPEG, PNG, GIF and WebP images are accepted')
+
+    upload_dir = os.path.join(folder, UPLOAD_SUBDIR)
+    os.makedirs(upload_dir, exist_ok=True)
+    digest = hashlib.sha256(header)
+    size = len(header)
+    # Same filesystem as the destination so the final rename is atomic
+    fd, tmp_path = tempfile.mkstemp(prefix='.upload-', dir=upload_dir)
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(header)
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise RequestEntityTooLarge()
+                digest.update(chunk)
+                tmp.write(chunk)
+
+        name = digest.hexdigest()
+        filename = '{}/{}/{}.{}'.format(UPLOAD_SUBDIR, name[:2], name, ext)
+        final_path = os.path.join(folder, *filename.split('/'))
+        if os.path.exists(final_path):
+            os.unlink(tmp_path)
+            return StoredUpload(filename, name, size, True)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.chmod(tmp_path, 0o644)
+        # A concurrent upload of the same bytes may win the race; it wrote identical content
+        os.replace(tmp_path, final_path)
+        return StoredUpload(filename, name, size, False)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def upload_stream():
+    """The uploaded bytes: a raw request body, or the `image` part of a multipart form"""
+    if request.mimetype.startswith('multipart/'):
+        upload = request.files.get('image')
+        return upload.stream if upload else None
+    return request.stream
+
+
+def init_app(app):
+    """Serve uploaded images with immutable cache headers"""
+    prefix = 'images/{}/'.format(UPLOAD_SUBDIR)
+
+    @app.after_request
+    def immutable_uploads(response):
+        if (request.endpoint == 'static' and response.status_code in (200, 206, 304)
+                and (request.view_args or {}).get('filename', '').startswith(prefix)):
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
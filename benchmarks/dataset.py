@@ -0,0 +1,82 @@
+"""
+Deterministic catalog fixtures shared by the load tests and microbenchmarks
+"""
+
+import os
+import random
+from datetime import datetime, timedelta
+from unittest import mock
+
+CATEGORY_NAMES = ['Fresh Vegetables', 'Organic Fruits', 'Grains & Cereals',
+                  'Dairy Products', 'Herbs & Spices', 'Organic Honey']
+PRODUCT_WORDS = ['Organic', 'Fresh', 'Raw', 'Farm', 'Wild', 'Green', 'Golden', 'Natural']
+PRODUCT_NOUNS = ['Tomatoes', 'Spinach', 'Apples', 'Bananas', 'Quinoa', 'Oats', 'Milk',
+                 'Cheese', 'Basil', 'Turmeric', 'Honey', 'Rice', 'Carrots', 'Yogurt']
+IMAGES = ['tomatoes.jpg', 'spinach.png', 'red-apple.png', 'banana.png', 'quinoa.jpg',
+          'oats.png', 'milk.png', 'cheese.jpg', 'basil.jpg', 'turmeric.jpg', 'honey.png']
+USER_PASSWORD = 'loadtest123'
+
+
+def load_app_in_memory():
+    """Import backend.app against an in-memory mongomock client instead of Atlas"""
+    import mongomock
+    os.environ.setdefault('MONGODB_URI', 'mongodb://localhost:27017/organic_benchmark')
+    with mock.patch('flask_pymongo.MongoClient', mongomock.MongoClient):
+        from backend.app import app, mongo
+    app.config['WTF_CSRF_ENABLED'] = False
+    return app, mongo
+
+
+def user_email(index):
+    return 'loadtest{}@example.com'.format(index)
+
+
+def seed_catalog(db, products=200, categories=6, users=10, seed=1):
+    """Replace catalog, carts and loadtest users in db with a reproducible dataset.
+
+    Returns a dict with the seeded category ids, product ids and user emails.
+    """
+    from werkzeug.security import generate_password_hash
+    rng = random.Random(seed)
+    db.products.delete_many({})
+    db.categories.delete_many({})
+    db.cart.delete_many({})
+    db.wishlists.delete_many({})
+    db.users.delete_many({'email': {'$regex': '^loadtest'}})
+
+    category_docs = []
+    for i in range(categories):
+        name = CATEGORY_NAMES[i % len(CATEGORY_NAMES)]
+        if i >= len(CATEGORY_NAMES):
+            name = '{} {}'.format(name, i // len(CATEGORY_NAMES) + 1)
+        category_docs.append({'name': name, 'description': 'Benchmark category {}'.format(i)})
+    category_ids = db.categories.insert_many(category_docs).inserted_ids
+
+    epoch = datetime(2024, 1, 1)
+    product_docs = []
+    for i in range(products):
+        name = '{} {} {}'.format(rng.choice(PRODUCT_WORDS), rng.choice(PRODUCT_NOUNS), i)
+        product_docs.append({
+            'name': name,
+            'description': 'Benchmark product {} with a description long enough for search.'.format(name),
+            'price': rng.choice([49, 99, 150, 200, 300, 350, 500, 799, 1199]),
+            'stock': rng.randint(0, 120),
+            'category_id': category_ids[i % len(category_ids)],
+            'image': rng.choice(IMAGES),
+            'created_at': epoch + timedelta(minutes=i),
+        })
+    product_ids = db.products.insert_many(product_docs).inserted_ids if product_docs else []
+
+    password_hash = generate_password_hash(USER_PASSWORD)
+    emails = [user_email(i) for i in range(users)]
+    if emails:
+        db.users.insert_many([{'name': 'Load Test {}'.format(i), 'email': email,
+                               'password_hash': password_hash, 'is_admin': False}
+                              for i, email in enumerate(emails)])
+    # Invalidate memoized catalog reads in running workers
+    db.meta.update_one({'_id': 'catalog'}, {'$inc': {'version': 1}}, upsert=True)
+    return {
+        'category_ids': [str(cid) for cid in category_ids],
+        'product_ids': [str(pid) for pid in product_ids],
+        'emails': emails,
+    }
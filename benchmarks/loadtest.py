@@ -0,0 +1,264 @@
+"""
+Scripted load test for the browse, login, cart and checkout journeys.
+
+Two modes:
+
+* inprocess (default): imports the app against an in-memory mongomock
+  database, seeds it and drives it through Flask test clients.
+* http: drives a running server (e.g. gunicorn) over HTTP. The server must use
+  the database given by --mongo-uri, which is re-seeded before the run:
+
+      MONGODB_URI=mongodb://localhost:27017/organic_loadtest gunicorn backend.app:app
+      python -m benchmarks.loadtest --mode http --base-url http://127.0.0.1:8000 \\
+          --mongo-uri mongodb://localhost:27017/organic_loadtest
+
+Per-step throughput and p50/p95/p99 latency are written as JSON to --output.
+"""
+
+import argparse
+import http.cookiejar
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+
+from benchmarks.dataset import USER_PASSWORD, load_app_in_memory, seed_catalog
+
+CSRF_RE = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+SEARCH_TERMS = ['organic', 'fresh', 'honey', 'rice', 'milk', 'apple']
+SORTS = ['', 'low_to_high', 'high_to_low']
+
+
+# ==================== CLIENTS ====================
+class InProcessClient:
+    """Flask test client with its own cookie jar"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def get(self, path, params=None):
+        response = self.client.get(path, query_string=params)
+        return response.status_code, response.get_data(as_text=True)
+
+    def post_form(self, path, data):
+        response = self.client.post(path, data=data)
+        return response.status_code, response.get_data(as_text=True)
+
+    def post_json(self, path, payload):
+        response = self.client.post(path, json=payload,
+                                    headers={'X-Requested-With': 'XMLHttpRequest'})
+        return response.status_code, response.get_data(as_text=True)
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class HttpClient:
+    """urllib client with its own cookie jar that reports redirects instead of following them"""
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect())
+
+    def _send(self, request):
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                return response.status, response.read().decode('utf-8', 'replace')
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode('utf-8', 'replace')
+
+    def get(self, path, params=None):
+        query = '?' + urllib.parse.urlencode(params) if params else ''
+        return self._send(urllib.request.Request(self.base_url + path + query))
+
+    def post_form(self, path, data):
+        body = urllib.parse.urlencode(data).encode()
+        return self._send(urllib.request.Request(self.base_url + path, data=body, method='POST'))
+
+    def post_json(self, path, payload):
+        request = urllib.request.Request(self.base_url + path, data=json.dumps(payload).encode(),
+                                         method='POST',
+                                         headers={'Content-Type': 'application/json',
+                                                  'X-Requested-With': 'XMLHttpRequest'})
+        return self._send(request)
+
+
+# ==================== RECORDING ====================
+class Recorder:
+    """Thread-safe latency samples per journey step"""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.shed = {}
+        self._lock = threading.Lock()
+
+    def timed(self, step, call, expect=(200,)):
+        started = time.perf_counter()
+        try:
+            status, body = call()
+        except Exception:
+            status, body = None, ''
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        with self._lock:
+            self.samples.setdefault(step, []).append(elapsed_ms)
+            if status in (429, 503):
+                # Rejected by admission control rather than failed
+                self.shed[step] = self.shed.get(step, 0) + 1
+            elif status not in expect:
+                self.errors[step] = self.errors.get(step, 0) + 1
+        return status, body
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100.0 * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+def summarize(values, errors, shed, duration_s):
+    values = sorted(values)
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'shed': shed,
+        'throughput_rps': round(len(values) / duration_s, 2) if duration_s else 0.0,
+        'mean_ms': round(sum(values) / len(values), 3) if values else 0.0,
+        'p50_ms': round(percentile(values, 50), 3),
+        'p95_ms': round(percentile(values, 95), 3),
+        'p99_ms': round(percentile(values, 99), 3),
+        'max_ms': round(values[-1], 3) if values else 0.0,
+    }
+
+
+# ==================== JOURNEYS ====================
+def csrf_fields(body):
+    match = CSRF_RE.search(body)
+    return {'csrf_token': match.group(1)} if match else {}
+
+
+def browse_params(rng, dataset):
+    params = {}
+    if rng.random() < 0.6:
+        params['category'] = rng.choice(dataset['category_ids'])
+    if rng.random() < 0.3:
+        params['search'] = rng.choice(SEARCH_TERMS)
+    if rng.random() < 0.3:
+        params['price_min'] = rng.choice([0, 50, 100])
+        params['price_max'] = rng.choice([300, 500, 1000])
+    sort = rng.choice(SORTS)
+    if sort:
+        params['sort'] = sort
+    if rng.random() < 0.2:
+        params['page'] = rng.randint(1, 3)
+    return params
+
+
+def run_session(client, recorder, rng, dataset, email, browse_pages, cart_clicks):
+    """One shopper: anonymous browsing, login, cart clicks, checkout"""
+    for _ in range(browse_pages):
+        params = browse_params(rng, dataset)
+        recorder.timed('browse_categories', lambda: client.get('/categories', params))
+
+    _, body = recorder.timed('login_form', lambda: client.get('/login'))
+    form = dict(csrf_fields(body), email=email, password=USER_PASSWORD)
+    status, _ = recorder.timed('login', lambda: client.post_form('/login', form), expect=(302,))
+    if status != 302:
+        return
+
+    for _ in range(cart_clicks):
+        product_id = rng.choice(dataset['product_ids'])
+        payload = {'quantity': rng.randint(1, 3)}
+        recorder.timed('cart_set', lambda: client.post_json('/cart/set/{}'.format(product_id), payload))
+
+    _, body = recorder.timed('checkout_page', lambda: client.get('/checkout'))
+    form = dict(csrf_fields(body), name='Load Test', email=email,
+                address='42 Benchmark Lane, Test District', city='Pune',
+                postal_code='411001', country='India')
+    recorder.timed('checkout_submit', lambda: client.post_form('/checkout', form), expect=(302,))
+
+
+def run(args):
+    if args.mode == 'inprocess':
+        app, mongo = load_app_in_memory()
+        db = mongo.db
+        make_client = lambda: InProcessClient(app)
+    else:
+        import pymongo
+        db = pymongo.MongoClient(args.mongo_uri).get_default_database()
+        make_client = lambda: HttpClient(args.base_url)
+
+    dataset = seed_catalog(db, products=args.products, categories=args.categories,
+                           users=args.users, seed=args.seed)
+    recorder = Recorder()
+
+    def virtual_user(index):
+        rng = random.Random(args.seed * 1000 + index)
+        for _ in range(args.iterations):
+            run_session(make_client(), recorder, rng, dataset, dataset['emails'][index],
+                        args.browse_pages, args.cart_clicks)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=virtual_user, args=(i,)) for i in range(args.users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration_s = time.perf_counter() - started
+
+    all_samples = [value for values in recorder.samples.values() for value in values]
+    return {
+        'started_at': datetime.utcnow().isoformat() + 'Z',
+        'config': {key: value for key, value in vars(args).items() if key != 'output'},
+        'duration_s': round(duration_s, 3),
+        'steps': {step: summarize(values, recorder.errors.get(step, 0), recorder.shed.get(step, 0), duration_s)
+                  for step, values in sorted(recorder.samples.items())},
+        'total': summarize(all_samples, sum(recorder.errors.values()), sum(recorder.shed.values()),
+                           duration_s),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mode', choices=['inprocess', 'http'], default='inprocess')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--mongo-uri', default='mongodb://localhost:27017/organic_loadtest')
+    parser.add_argument('--products', type=int, default=500, help='catalog size to seed')
+    parser.add_argument('--categories', type=int, default=6)
+    parser.add_argument('--users', type=int, default=10, help='concurrent virtual users')
+    parser.add_argument('--iterations', type=int, default=5, help='sessions per virtual user')
+    parser.add_argument('--browse-pages', type=int, default=4)
+    parser.add_argument('--cart-clicks', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='loadtest_results.json')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    for step, stats in report['steps'].items():
+        print('{:<18} {:>6} req {:>4} err {:>4} shed {:>9.1f} rps  p50 {:>8.2f}  p95 {:>8.2f}  p99 {:>8.2f} ms'.format(
+            step, stats['requests'], stats['errors'], stats['shed'], stats['throughput_rps'],
+            stats['p50_ms'], stats['p95_ms'], stats['p99_ms']))
+    print('Results written to {}'.format(args.output))
+    return 1 if report['total']['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
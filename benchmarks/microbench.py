@@ -0,0 +1,178 @@
+"""
+Microbenchmarks for the per-request hot paths.
+
+Runs against the deterministic in-memory dataset from benchmarks.dataset:
+
+    python -m benchmarks.microbench --products 500 --save .benchmarks/baseline.json
+    python -m benchmarks.microbench --compare .benchmarks/baseline.json --threshold 0.15
+
+With --compare the process exits non-zero when any benchmark's median is more
+than --threshold slower than the stored baseline.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+
+from benchmarks.dataset import load_app_in_memory, seed_catalog
+
+
+def measure(fn, number, repeat):
+    """Per-call timings in microseconds over `repeat` batches of `number` calls"""
+    per_call = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        per_call.append((time.perf_counter() - started) / number * 1e6)
+    return {
+        'number': number,
+        'repeat': repeat,
+        'min_us': round(min(per_call), 3),
+        'median_us': round(statistics.median(per_call), 3),
+        'mean_us': round(statistics.fmean(per_call), 3),
+    }
+
+
+def build_benchmarks(app, mongo, dataset, args):
+    """Map of benchmark name -> (setup-free callable, calls per batch)"""
+    from flask import render_template
+    from flask_login import login_user
+    import backend.app as shop
+    from backend import models
+
+    rng = random.Random(args.seed)
+    db = mongo.db
+    user_doc = db.users.find_one({'email': dataset['emails'][0]})
+    user_id = str(user_doc['_id'])
+    product_ids = dataset['product_ids']
+    cart_product_ids = rng.sample(product_ids, min(args.cart_items, len(product_ids)))
+    db.cart.insert_many([{'user_id': user_id, 'product_id': pid, 'quantity': rng.randint(1, 4)}
+                         for pid in cart_product_ids])
+    db.wishlists.insert_one({'_id': user_id,
+                             'product_ids': rng.sample(product_ids, min(args.wishlist_items, len(product_ids)))})
+
+    all_categories = list(db.categories.find())
+    for cat in all_categories:
+        cat['product_count'] = db.products.count_documents({'category_id': cat['_id']})
+    category_map = {str(cat['_id']): cat['name'] for cat in all_categories}
+    page_products = list(db.products.find().limit(12))
+    wishlist_ids = set(db.wishlists.find_one({'_id': user_id})['product_ids'])
+    cart_items = list(db.cart.find({'user_id': user_id}))
+    cart_products = {str(prod['_id']): prod for prod in db.products.find()}
+
+    ctx = app.test_request_context('/categories?category={}&sort=low_to_high'.format(dataset['category_ids'][0]))
+    ctx.push()
+    login_user(shop.MongoUser(user_doc))
+    shop.catalog.refresh_if_stale(db)
+
+    template = app.jinja_env.get_template('categories.html')
+    render_context = dict(categories=all_categories,
+                          products=shop.decorate_products(page_products, category_map, wishlist_ids),
+                          current_category=all_categories[0], search_query='',
+                          cart_quantities={item['product_id']: item['quantity'] for item in cart_items},
+                          min_price=49, max_price=1199, page=1, total_pages=3,
+                          total_products=len(product_ids))
+    app.update_template_context(render_context)
+
+    return ctx, {
+        # Drop the per-request caches so every call pays a real request's cost
+        'inject_cart_count': (lambda: (models.clear_request_caches(), shop.inject_cart_count()), 50),
+        'load_user': (lambda: (models.clear_request_caches(), shop.load_user(user_id)), 200),
+        'build_product_query': (lambda: shop.build_product_query(
+            dataset['category_ids'][0], 'organic', 50.0, 500.0, 'low_to_high'), 5000),
+        'catalog_listing_12': (lambda: shop.catalog.listing(
+            dataset['category_ids'][0], 'organic', 50.0, 500.0, 'low_to_high', skip=12, limit=12), 2000),
+        'decorate_products_12': (lambda: shop.decorate_products(page_products, category_map, wishlist_ids), 2000),
+        'render_categories_12': (lambda: template.render(render_context), 50),
+        'render_template_categories_12': (lambda: render_template('categories.html', **render_context), 20),
+        'cart_total': (lambda: shop.cart_total(cart_items, cart_products), 2000),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Benchmarks whose median regressed by more than threshold (a fraction)"""
+    regressions = []
+    for name, stats in results['benchmarks'].items():
+        before = baseline.get('benchmarks', {}).get(name)
+        if not before or not before['median_us']:
+            continue
+        change = stats['median_us'] / before['median_us'] - 1
+        stats['change_vs_baseline'] = round(change, 4)
+        if change > threshold:
+            regressions.append((name, before['median_us'], stats['median_us'], change))
+    return regressions
+
+
+def run(args):
+    app, mongo = load_app_in_memory()
+    dataset = seed_catalog(mongo.db, products=args.products, categories=args.categories,
+                           users=1, seed=args.seed)
+    ctx, benchmarks = build_benchmarks(app, mongo, dataset, args)
+    try:
+        selected = {name: bench for name, bench in benchmarks.items()
+                    if not args.only or name in args.only}
+        timings = {}
+        for name, (fn, number) in selected.items():
+            fn()  # warm caches (template compilation, first query)
+            timings[name] = measure(fn, max(1, int(number * args.scale)), args.repeat)
+    finally:
+        ctx.pop()
+    return {
+        'created_at': datetime.utcnow().isoformat() + 'Z',
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'dataset': {'products': args.products, 'categories': args.categories,
+                    'cart_items': args.cart_items, 'wishlist_items': args.wishlist_items,
+                    'seed': args.seed},
+        'benchmarks': timings,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Microbenchmarks for per-request hot paths')
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--categories', type=int, default=6)
+    parser.add_argument('--cart-items', type=int, default=8)
+    parser.add_argument('--wishlist-items', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply calls per batch')
+    parser.add_argument('--only', nargs='*', help='run only these benchmarks')
+    parser.add_argument('--save', help='write results JSON to this path')
+    parser.add_argument('--compare', help='baseline results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help='allowed median slowdown vs baseline (0.15 = 15%%)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+    for name, stats in results['benchmarks'].items():
+        change = stats.get('change_vs_baseline')
+        print('{:<32} median {:>11.2f} us  min {:>11.2f} us{}'.format(
+            name, stats['median_us'], stats['min_us'],
+            '  ({:+.1%})'.format(change) if change is not None else ''))
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print('Results written to {}'.format(args.save))
+    for name, before, after, change in regressions:
+        print('REGRESSION {}: {:.2f} us -> {:.2f} us ({:+.1%})'.format(name, before, after, change))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
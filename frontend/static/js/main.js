@@ -443,27 +443,94 @@ document.addEventListener('DOMContentLoaded', function() {
     document.querySelectorAll('.qty-control').forEach(control => attachQtyEvents(control));
 });
 
-// ==================== PRODUCT SEARCH (Future Enhancement) ====================
-// Add this when search functionality is implemented
-/*
+// ==================== SEARCH SUGGESTIONS ====================
 document.addEventListener('DOMContentLoaded', function() {
-    const searchInput = document.querySelector('#search-input');
-    
-    if (searchInput) {
-        let searchTimeout;
-        searchInput.addEventListener('input', function() {
-            clearTimeout(searchTimeout);
-            searchTimeout = setTimeout(() => {
-                const query = this.value.trim();
-                if (query.length > 2) {
-                    // Perform search
-                    console.log('Searching for:', query);
-                }
-            }, 500);
+    const searchInput = document.querySelector('.search-input');
+    const searchForm = searchInput ? searchInput.closest('.search-form') : null;
+    if (!searchInput || !searchForm) return;
+
+    const list = document.createElement('ul');
+    list.className = 'search-suggestions';
+    list.setAttribute('role', 'listbox');
+    searchForm.parentElement.appendChild(list);
+    searchInput.setAttribute('autocomplete', 'off');
+
+    let debounceTimer;
+    let controller = null;
+    let activeIndex = -1;
+    const cache = new Map();
+
+    function hideSuggestions() {
+        list.innerHTML = '';
+        list.classList.remove('open');
+        activeIndex = -1;
+    }
+
+    function renderSuggestions(suggestions) {
+        list.innerHTML = '';
+        activeIndex = -1;
+        suggestions.forEach(item => {
+            const li = document.createElement('li');
+            const link = document.createElement('a');
+            link.href = item.url;
+            link.textContent = item.label;
+            const icon = document.createElement('i');
+            icon.className = item.type === 'category' ? 'fas fa-th' : 'fas fa-leaf';
+            link.prepend(icon);
+            li.appendChild(link);
+            list.appendChild(li);
         });
+        list.classList.toggle('open', suggestions.length > 0);
     }
+
+    function fetchSuggestions(query) {
+        if (cache.has(query)) {
+            renderSuggestions(cache.get(query));
+            return;
+        }
+        // Drop the response of a query the user has already typed past
+        if (controller) controller.abort();
+        controller = new AbortController();
+        fetch(`/api/search/suggest?q=${encodeURIComponent(query)}`, { signal: controller.signal })
+            .then(response => response.json())
+            .then(data => {
+                cache.set(query, data.suggestions);
+                if (searchInput.value.trim() === query) renderSuggestions(data.suggestions);
+            })
+            .catch(error => {
+                if (error.name !== 'AbortError') hideSuggestions();
+            });
+    }
+
+    searchInput.addEventListener('input', function() {
+        clearTimeout(debounceTimer);
+        const query = this.value.trim();
+        if (query.length < 2) {
+            hideSuggestions();
+            return;
+        }
+        debounceTimer = setTimeout(() => fetchSuggestions(query), 150);
+    });
+
+    searchInput.addEventListener('keydown', function(e) {
+        const items = list.querySelectorAll('a');
+        if (!items.length) return;
+        if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+            e.preventDefault();
+            activeIndex = (activeIndex + (e.key === 'ArrowDown' ? 1 : -1) + items.length) % items.length;
+            items.forEach((item, i) => item.classList.toggle('active', i === activeIndex));
+        } else if (e.key === 'Enter' && activeIndex >= 0) {
+            e.preventDefault();
+            window.location.href = items[activeIndex].href;
+        } else if (e.key === 'Escape') {
+            hideSuggestions();
+        }
+    });
+
+    document.addEventListener('click', function(e) {
+        if (!e.target.closest('.search-container')) hideSuggestions();
+    });
 });
-*/
 
 // ==================== SCROLL TO TOP BUTTON ====================
 document.addEventListener('DOMContentLoaded', function() {
@@ -518,3 +585,44 @@ document.addEventListener('DOMContentLoaded', function() {
 });
 
 // (Removed duplicate mobile menu toggle block to prevent conflicting handlers)
+
+// ==================== LIVE UPDATES ====================
+// Server-Sent Events (backend/live.py): the cart count from the user's other tabs
+// and stock changes of the products on this page. The browser reconnects by itself.
+document.addEventListener('DOMContentLoaded', function() {
+    const liveUrl = document.body.dataset.liveUrl;
+    if (!liveUrl || !window.EventSource) return;
+    const productIds = new Set();
+    document.querySelectorAll('[data-product-id]').forEach(el => productIds.add(el.dataset.productId));
+    const ids = Array.from(productIds).slice(0, 100);
+    const source = new EventSource(ids.length ? `${liveUrl}?products=${ids.join(',')}` : liveUrl);
+    source.addEventListener('cart', e => updateCartBadge(JSON.parse(e.data).count));
+    source.addEventListener('stock', e => applyStockUpdate(JSON.parse(e.data)));
+});
+
+function applyStockUpdate(update) {
+    const selector = `[data-product-id="${update.product_id}"]`;
+    const soldOut = update.level === 'out';
+    document.querySelectorAll(`.stock-status${selector}`).forEach(status => {
+        status.classList.remove('in-stock', 'low-stock', 'out-of-stock');
+        if (soldOut) {
+            status.classList.add('out-of-stock');
+            status.innerHTML = '<i class="fas fa-times-circle"></i> Out of Stock';
+        } else if (update.level === 'low') {
+            status.classList.add('low-stock');
+            status.innerHTML = `<i class="fas fa-exclamation-circle"></i> Only ${update.stock} left`;
+        } else {
+            status.classList.add('in-stock');
+            status.innerHTML = '<i class="fas fa-check-circle"></i> In Stock';
+        }
+    });
+    document.querySelectorAll(`.add-to-cart-form${selector}`).forEach(form => {
+        const submit = form.querySelector('button[type="submit"]');
+        if (submit) submit.disabled = soldOut;
+        const quantity = form.querySelector('input[name="quantity"]');
+        if (quantity && !soldOut) quantity.max = update.stock;
+    });
+    document.querySelectorAll(`.quick-add${selector}`).forEach(button => {
+        button.disabled = soldOut;
+    });
+}
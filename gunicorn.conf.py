@@ -0,0 +1,20 @@
+import os
+import shutil
+import tempfile
+
+# Shared directory for prometheus_client multiprocess metrics. It must be set
+# before the app (and prometheus_client) is imported in the workers.
+PROMETHEUS_MULTIPROC_DIR = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'organic-ecommerce-metrics'))
+
+
+def on_starting(server):
+    """Start every deploy with an empty metrics directory"""
+    shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """Drop live gauge samples of workers that have exited"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,76 @@
+"""
+Fixtures for the in-memory test suite.
+
+The app is imported once per session against mongomock through
+benchmarks.dataset.load_app_in_memory(); every piece of on-disk state
+(admission slots, the catalog snapshot) goes to a throwaway directory.
+"""
+
+import os
+import tempfile
+
+import mongomock
+import pytest
+from pymongo import DeleteOne, InsertOne, ReplaceOne, UpdateOne
+
+from benchmarks.dataset import load_app_in_memory, seed_catalog
+
+STATE_DIR = tempfile.mkdtemp(prefix='organic-tests-')
+os.environ['ADMISSION_STATE_DIR'] = os.path.join(STATE_DIR, 'admission')
+os.environ['CATALOG_SNAPSHOT_PATH'] = os.path.join(STATE_DIR, 'catalog.snapshot')
+os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+
+
+class BulkWriteResult:
+    def __init__(self):
+        self.matched_count = self.modified_count = self.upserted_count = 0
+
+
+def bulk_write(self, requests, ordered=True, **kwargs):
+    """One write per operation: mongomock 4.3 cannot build PyMongo 4.x bulk operations"""
+    result = BulkWriteResult()
+    for op in requests:
+        if isinstance(op, InsertOne):
+            self.insert_one(op._doc)
+            continue
+        if isinstance(op, DeleteOne):
+            self.delete_one(op._filter)
+            continue
+        if isinstance(op, UpdateOne):
+            outcome = self.update_one(op._filter, op._doc, upsert=op._upsert, array_filters=op._array_filters)
+        elif isinstance(op, ReplaceOne):
+            outcome = self.replace_one(op._filter, op._doc, upsert=op._upsert)
+        else:
+            raise NotImplementedError(type(op).__name__)
+        result.matched_count += outcome.matched_count
+        result.modified_count += outcome.modified_count
+        result.upserted_count += outcome.upserted_id is not None
+    return result
+
+
+mongomock.Collection.bulk_write = bulk_write
+
+# Before collection: a test module importing backend.* would otherwise build the
+# real PyMongo client
+APP, MONGO = load_app_in_memory()
+APP.config['TESTING'] = True
+
+
+@pytest.fixture(scope='session')
+def app():
+    return APP
+
+
+@pytest.fixture(scope='session')
+def db():
+    return MONGO.db
+
+
+@pytest.fixture(scope='session')
+def dataset(db):
+    return seed_catalog(db, products=40, users=2)
+
+
+@pytest.fixture
+def client(app, dataset):
+    return app.test_client()
@@ -0,0 +1,72 @@
+import base64
+import json
+import re
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+
+@pytest.fixture
+def admin(client, db):
+    db.orders.delete_many({})
+    start = datetime(2024, 3, 1)
+    ids = [db.orders.insert_one({'user_id': 'u{}'.format(i % 2), 'status': 'pending', 'total_amount': i,
+                                 'created_at': start + timedelta(hours=i), 'items': []}).inserted_id
+           for i in range(5)]
+    client.post('/login', data={'email': 'admin@greenharvest.com', 'password': 'admin123'})
+    yield client, ids
+    db.orders.delete_many({})
+
+
+def order_ids(response):
+    """Ids of the listed orders, in page order"""
+    listed = re.findall(r'name="order_ids" value="([0-9a-f]{24})"', response.get_data(as_text=True))
+    return [ObjectId(oid) for oid in listed]
+
+
+def next_cursor(response):
+    match = re.search(r'cursor=([\w-]+)', response.get_data(as_text=True))
+    return match.group(1) if match else None
+
+
+def raw_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+
+def test_pages_follow_the_cursor(admin, monkeypatch):
+    client, ids = admin
+    monkeypatch.setattr('backend.app.ADMIN_ORDERS_PAGE_SIZE', 2)
+    pages, query = [], {}
+    while True:
+        response = client.get('/admin/orders', query_string=query)
+        assert response.status_code == 200
+        pages.append(order_ids(response))
+        query = {'cursor': next_cursor(response)}
+        if query['cursor'] is None:
+            break
+    assert pages == [ids[4:2:-1], ids[2:0:-1], ids[:1]]
+
+
+@pytest.mark.parametrize('cursor', [
+    raw_cursor([1]),
+    raw_cursor({'t': 'yesterday', 'id': str(ObjectId())}),
+    raw_cursor({'t': 5, 'id': str(ObjectId())}),
+    raw_cursor({'t': '2024-03-01T00:00:00', 'id': 'nope'}),
+    raw_cursor({'t': '2024-03-01T00:00:00'}),
+    '%%%',
+])
+def test_malformed_cursor_shows_the_first_page(admin, cursor):
+    client, ids = admin
+    response = client.get('/admin/orders', query_string={'cursor': cursor})
+    assert response.status_code == 200
+    assert 'no longer valid' in response.get_data(as_text=True)
+    assert order_ids(response) == ids[::-1]
+
+
+def test_unknown_customer_matches_no_orders(admin, db):
+    client, ids = admin
+    db.orders.insert_one({'status': 'pending', 'total_amount': 1, 'created_at': datetime(2024, 1, 1), 'items': []})
+    response = client.get('/admin/orders', query_string={'customer': 'nobody@example.com'})
+    assert response.status_code == 200
+    assert order_ids(response) == []
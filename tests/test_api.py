@@ -0,0 +1,108 @@
+import base64
+import binascii
+import json
+
+import pytest
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from backend import api
+
+
+def raw_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+
+def fetch_all(client, **params):
+    """Every item of a listing, following next_cursor"""
+    items, cursor = [], None
+    while True:
+        query = dict(params, limit=7, **({'cursor': cursor} if cursor else {}))
+        response = client.get('/api/products', query_string=query)
+        assert response.status_code == 200
+        body = response.get_json()
+        items.extend(body['items'])
+        cursor = body['next_cursor']
+        if cursor is None:
+            return items
+
+
+# ==================== CURSORS ====================
+@pytest.mark.parametrize('sort_by, price', [('', None), ('low_to_high', 99), ('high_to_low', 12.5)])
+def test_cursor_round_trip(sort_by, price):
+    oid = ObjectId()
+    cursor = api.encode_cursor({'_id': oid, 'price': price}, sort_by)
+    assert '=' not in cursor
+    assert api.decode_cursor(cursor) == (price, oid)
+
+
+@pytest.mark.parametrize('cursor', [
+    raw_cursor([1, 2]),
+    raw_cursor('id'),
+    raw_cursor(None),
+    raw_cursor({}),
+    raw_cursor({'id': 'not-an-object-id'}),
+    raw_cursor({'id': str(ObjectId()), 'p': 'cheap'}),
+    raw_cursor({'id': str(ObjectId()), 'p': True}),
+    'not base64!',
+    base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+])
+def test_decode_cursor_rejects_malformed(cursor):
+    with pytest.raises((ValueError, TypeError, KeyError, InvalidId, binascii.Error)):
+        api.decode_cursor(cursor)
+
+
+def test_keyset_filter_follows_sort():
+    oid = ObjectId()
+    assert api.keyset_filter(api.encode_cursor({'_id': oid}, ''), '') == {'_id': {'$gt': oid}}
+    assert api.keyset_filter(api.encode_cursor({'_id': oid, 'price': 5}, 'low_to_high'), 'low_to_high') == {
+        '$or': [{'price': {'$gt': 5}}, {'price': 5, '_id': {'$gt': oid}}]}
+    assert api.keyset_filter(api.encode_cursor({'_id': oid, 'price': 5}, 'high_to_low'), 'high_to_low') == {
+        '$or': [{'price': {'$lt': 5}}, {'price': 5, '_id': {'$lt': oid}}]}
+
+
+# ==================== /api/products ====================
+@pytest.mark.parametrize('sort_by', ['', 'low_to_high', 'high_to_low'])
+def test_pages_cover_the_listing_once(client, dataset, sort_by):
+    items = fetch_all(client, sort=sort_by, fields='id,price')
+    ids = [item['id'] for item in items]
+    assert len(ids) == len(set(ids)) == len(dataset['product_ids'])
+    prices = [item['price'] for item in items]
+    if sort_by:
+        assert prices == sorted(prices, reverse=sort_by == 'high_to_low')
+
+
+def test_malformed_cursor_is_a_400(client, dataset):
+    for cursor in (raw_cursor([1]), raw_cursor({'id': 'x'}), '%%%'):
+        response = client.get('/api/products', query_string={'cursor': cursor})
+        assert response.status_code == 400
+        assert response.get_json() == {'error': 'Invalid cursor'}
+
+
+def test_unknown_field_is_a_400(client, dataset):
+    assert client.get('/api/products?fields=id,secret').status_code == 400
+
+
+@pytest.mark.parametrize('search', ['organic', 'TOMATOES', 'product 1', '(', 'a+b', '.*', '(a+)+$'])
+def test_search_is_a_literal_case_insensitive_match(client, db, dataset, search):
+    needle = search.casefold()
+    expected = {str(doc['_id']) for doc in db.products.find()
+                if needle in doc['name'].casefold() or needle in doc['description'].casefold()}
+    found = {item['id'] for item in fetch_all(client, search=search, fields='id')}
+    assert found == expected
+
+
+def test_search_matches_regex_characters_literally(client, db, dataset):
+    product_id = db.products.insert_one({'name': 'Mixed Nuts (500g)', 'description': 'a+b', 'price': 5}).inserted_id
+    try:
+        found = [item['id'] for item in fetch_all(client, search='nuts (500', fields='id')]
+        assert found == [str(product_id)]
+    finally:
+        db.products.delete_one({'_id': product_id})
+
+
+@pytest.mark.parametrize('search', ['x' * (api.MAX_SEARCH_LENGTH + 1), 'nul\x00byte'])
+def test_malformed_search_is_a_400(client, dataset, search):
+    response = client.get('/api/products', query_string={'search': search})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid search'}
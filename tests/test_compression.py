@@ -0,0 +1,50 @@
+import gzip
+
+import pytest
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+
+from backend.compression import CompressionMiddleware
+
+HTML = '<p>' + 'organic ' * 200 + '</p>'
+
+
+def respond(body, mimetype='text/html', **headers):
+    def app(environ, start_response):
+        return Response(body, mimetype=mimetype, headers=headers)(environ, start_response)
+    return Client(CompressionMiddleware(app, min_size=500))
+
+
+@pytest.mark.parametrize('accept', ['gzip', 'identity', ''])
+@pytest.mark.parametrize('method', ['GET', 'HEAD'])
+def test_compressible_types_always_vary(accept, method):
+    response = respond(HTML).open('/', method=method, headers={'Accept-Encoding': accept})
+    assert response.headers.getlist('Vary') == ['Accept-Encoding']
+    compressed = accept == 'gzip' and method == 'GET'
+    assert response.headers.get('Content-Encoding') == ('gzip' if compressed else None)
+    if compressed:
+        assert gzip.decompress(response.get_data()).decode() == HTML
+
+
+def test_small_bodies_vary_too():
+    response = respond('<p>tiny</p>').get('/', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers.get('Content-Encoding') is None
+    assert response.headers['Vary'] == 'Accept-Encoding'
+
+
+def test_existing_vary_is_extended_once():
+    response = respond(HTML, Vary='Cookie').get('/', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers.getlist('Vary') == ['Cookie, Accept-Encoding']
+    response = respond(HTML, Vary='accept-encoding').get('/', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers.getlist('Vary') == ['accept-encoding']
+
+
+def test_other_types_are_left_alone():
+    response = respond(b'\x89PNG' * 500, mimetype='image/png').get('/', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers.get('Content-Encoding') is None
+    assert 'Vary' not in response.headers
+
+
+def test_strong_etag_is_weakened_when_compressed():
+    response = respond(HTML, ETag='"abc"').get('/', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['ETag'] == 'W/"abc"'
@@ -0,0 +1,78 @@
+import pytest
+
+from benchmarks.dataset import USER_PASSWORD
+
+
+@pytest.fixture
+def shopper(db, dataset):
+    """(user id, email) of a seeded user with an empty persistent cart"""
+    email = dataset['emails'][1]
+    user_id = str(db.users.find_one({'email': email})['_id'])
+    db.cart.delete_many({'user_id': user_id})
+    yield user_id, email
+    db.cart.delete_many({'user_id': user_id})
+
+
+def add(client, product_id, quantity=1):
+    return client.post('/cart/add/' + product_id, json={'quantity': quantity})
+
+
+def persistent_cart(db, user_id):
+    return {line['product_id']: line['quantity'] for line in db.cart.find({'user_id': user_id})}
+
+
+def test_guest_cart_lives_in_the_session(client, db, dataset):
+    first, second = dataset['product_ids'][:2]
+    lines_before = db.cart.count_documents({})
+    assert add(client, first, 2).get_json()['cart_count'] == 2
+    assert add(client, second).get_json()['cart_count'] == 3
+    assert client.post('/cart/set/' + first, json={'quantity': 5}).get_json()['quantity'] == 5
+    assert client.get('/api/cart/count').get_json() == {'count': 6}
+    assert client.post('/cart/set/' + second, json={'quantity': 0}).get_json()['message'] == 'Item removed'
+    assert client.get('/api/cart/count').get_json() == {'count': 5}
+    assert db.cart.count_documents({}) == lines_before
+
+
+def test_guest_cart_rejects_unknown_products(client, dataset):
+    for product_id in ('0' * 24, 'not-an-id'):
+        assert add(client, product_id).status_code == 404
+        assert client.post('/cart/set/' + product_id, json={'quantity': 1}).status_code == 404
+    assert client.get('/api/cart/count').get_json() == {'count': 0}
+
+
+def test_guest_cart_is_bounded(app, client, dataset, monkeypatch):
+    monkeypatch.setitem(app.config, 'GUEST_CART_MAX_LINES', 2)
+    monkeypatch.setitem(app.config, 'GUEST_CART_MAX_QUANTITY', 10)
+    first, second, third = dataset['product_ids'][:3]
+    add(client, first, 25)
+    add(client, second)
+    full = add(client, third)
+    assert full.status_code == 400
+    assert 'full' in full.get_json()['message']
+    # Existing lines can still change
+    assert add(client, second).status_code == 200
+    assert client.get('/api/cart/count').get_json() == {'count': 12}
+
+
+def test_login_merges_the_guest_cart(client, db, dataset, shopper):
+    user_id, email = shopper
+    first, second = dataset['product_ids'][:2]
+    db.cart.insert_one({'user_id': user_id, 'product_id': first, 'quantity': 3})
+    add(client, first, 2)
+    add(client, second)
+
+    client.post('/login', data={'email': email, 'password': USER_PASSWORD})
+    assert persistent_cart(db, user_id) == {first: 5, second: 1}
+    assert client.get('/api/cart/count').get_json() == {'count': 6}
+
+    # The guest cart left the session: logging out shows an empty cart, logging in again adds nothing
+    client.get('/logout')
+    assert client.get('/api/cart/count').get_json() == {'count': 0}
+    client.post('/login', data={'email': email, 'password': USER_PASSWORD})
+    assert persistent_cart(db, user_id) == {first: 5, second: 1}
+
+
+def test_login_without_a_guest_cart_writes_nothing(client, db, shopper):
+    user_id, email = shopper
+    client.post('/login', data={'email': email, 'password': USER_PASSWORD})
+    assert persistent_cart(db, user_id) == {}
@@ -0,0 +1,136 @@
+import pytest
+from pymongo.errors import ServerSelectionTimeoutError
+
+from backend import resilience
+from backend.resilience import CircuitBreaker
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeMongo:
+    """Stands in for flask_pymongo.PyMongo: answers ping, or times out while down"""
+
+    def __init__(self):
+        self.up = True
+        self.pings = 0
+
+    @property
+    def db(self):
+        return self
+
+    def command(self, name):
+        self.pings += 1
+        if not self.up:
+            raise ServerSelectionTimeoutError('no primary')
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience.time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def breaker(app, clock):
+    breaker = CircuitBreaker(threshold=3, window=10, open_seconds=15)
+    breaker.mongo = FakeMongo()
+    with app.app_context():
+        yield breaker
+
+
+def fail(breaker, times):
+    for _ in range(times):
+        breaker.record_failure()
+
+
+def test_opens_at_the_threshold(breaker):
+    fail(breaker, 2)
+    assert not breaker.is_open()
+    fail(breaker, 1)
+    assert breaker.is_open()
+    assert breaker.mongo.pings == 0
+
+
+def test_failures_outside_the_window_do_not_count(breaker, clock):
+    fail(breaker, 2)
+    clock.now += 11
+    fail(breaker, 2)
+    assert not breaker.is_open()
+    fail(breaker, 1)
+    assert breaker.is_open()
+
+
+def test_stays_open_without_probing_until_the_period_ends(breaker, clock):
+    fail(breaker, 3)
+    assert breaker.retry_after() == 16
+    clock.now += 14.5
+    assert breaker.is_open()
+    assert breaker.retry_after() == 1
+    assert breaker.mongo.pings == 0
+
+
+def test_failed_probe_keeps_it_open_for_another_period(breaker, clock):
+    fail(breaker, 3)
+    breaker.mongo.up = False
+    clock.now += 15
+    assert breaker.is_open()
+    assert breaker.mongo.pings == 1
+    clock.now += 14
+    assert breaker.is_open()
+    assert breaker.mongo.pings == 1
+
+
+def test_successful_probe_closes_it_and_forgets_the_failures(breaker, clock):
+    fail(breaker, 3)
+    clock.now += 15
+    assert not breaker.is_open()
+    assert breaker.mongo.pings == 1
+    assert breaker.retry_after() == 1
+    fail(breaker, 2)
+    assert not breaker.is_open()
+
+
+def test_only_one_thread_probes(breaker, clock):
+    fail(breaker, 3)
+    clock.now += 15
+    with breaker._probe_lock:
+        assert breaker.is_open()
+    assert breaker.mongo.pings == 0
+
+
+# ==================== DEGRADED MODE ====================
+@pytest.fixture
+def outage(client, monkeypatch):
+    """The app's breaker opened, after a healthy request loaded the catalog"""
+    assert client.get('/categories').status_code == 200
+    monkeypatch.setattr(resilience.breaker, '_opened_at', resilience.time.monotonic())
+    return client
+
+
+def test_catalog_pages_are_served_stale(outage, dataset):
+    for path in ('/', '/categories', '/categories?sort=low_to_high', '/product/' + dataset['product_ids'][0]):
+        response = outage.get(path)
+        assert response.status_code == 200, path
+        assert response.headers['Warning'] == '110 - "Response is Stale"'
+        assert response.headers['Cache-Control'] == 'no-store'
+
+
+def test_in_process_endpoints_stay_up(outage):
+    assert outage.get('/metrics').status_code == 200
+    assert outage.get('/api/search/suggest?q=org').status_code == 200
+
+
+def test_other_endpoints_fail_fast(outage):
+    page = outage.get('/cart')
+    assert page.status_code == 503
+    assert int(page.headers['Retry-After']) >= 1
+    api = outage.get('/api/cart/count')
+    assert api.status_code == 503
+    assert api.get_json()['success'] is False
@@ -0,0 +1,137 @@
+import os
+from wsgiref.util import FileWrapper
+
+import pytest
+from werkzeug.http import http_date
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+
+from backend.static_files import StaticFilesMiddleware
+from backend.uploads import IMMUTABLE_CACHE_CONTROL
+
+BODY = bytes(range(256)) * 40
+
+
+def fallback(environ, start_response):
+    return Response('from flask', status=404)(environ, start_response)
+
+
+@pytest.fixture
+def static_dir(tmp_path):
+    (tmp_path / 'css').mkdir()
+    (tmp_path / 'css' / 'site.css').write_bytes(BODY)
+    (tmp_path / 'images' / 'uploads' / 'ab').mkdir(parents=True)
+    (tmp_path / 'images' / 'uploads' / 'ab' / 'abc.png').write_bytes(b'\x89PNG')
+    return tmp_path
+
+
+@pytest.fixture(params=['stream', 'hot', 'file_wrapper'])
+def client(request, static_dir):
+    """The same middleware over its three ways of sending a body"""
+    middleware = StaticFilesMiddleware(fallback, str(static_dir),
+                                       hot_cache_bytes=1 << 20 if request.param == 'hot' else 0)
+    environ = {'wsgi.file_wrapper': FileWrapper} if request.param == 'file_wrapper' else {}
+    return Client(middleware), environ
+
+
+def get(client, path='/static/css/site.css', method='GET', **headers):
+    client, environ = client
+    return client.open(path, method=method, headers=headers, environ_overrides=environ)
+
+
+def validators(client):
+    response = get(client, method='HEAD')
+    return response.headers['ETag'], response.headers['Last-Modified']
+
+
+def test_full_file(client):
+    response = get(client)
+    assert response.status_code == 200
+    assert response.get_data() == BODY
+    assert response.headers['Content-Length'] == str(len(BODY))
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.mimetype == 'text/css'
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+
+def test_head_sends_headers_only(client):
+    response = get(client, method='HEAD')
+    assert response.status_code == 200
+    assert response.headers['Content-Length'] == str(len(BODY))
+    assert response.get_data() == b''
+
+
+@pytest.mark.parametrize('header, start, stop', [
+    ('bytes=0-99', 0, 100),
+    ('bytes=100-', 100, len(BODY)),
+    ('bytes=-10', len(BODY) - 10, len(BODY)),
+    ('bytes=10000-20000', 10000, len(BODY)),
+    ('bytes=-20000', 0, len(BODY)),
+])
+def test_single_range(client, header, start, stop):
+    response = get(client, Range=header)
+    assert response.status_code == 206
+    assert response.get_data() == BODY[start:stop]
+    assert response.headers['Content-Range'] == 'bytes {}-{}/{}'.format(start, stop - 1, len(BODY))
+    assert response.headers['Content-Length'] == str(stop - start)
+
+
+def test_unsatisfiable_range(client):
+    response = get(client, Range='bytes={}-'.format(len(BODY)))
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == 'bytes */{}'.format(len(BODY))
+    assert response.get_data() == b''
+
+
+@pytest.mark.parametrize('header', ['bytes=0-9,20-29', 'bytes=abc', 'items=0-9'])
+def test_multi_and_malformed_ranges_get_the_full_file(client, header):
+    response = get(client, Range=header)
+    assert response.status_code == 200
+    assert response.get_data() == BODY
+
+
+def test_if_none_match_and_if_modified_since(client):
+    etag, last_modified = validators(client)
+    assert get(client, **{'If-None-Match': etag}).status_code == 304
+    assert get(client, **{'If-Modified-Since': last_modified}).status_code == 304
+    assert get(client, **{'If-None-Match': '"other"'}).status_code == 200
+    assert get(client, **{'If-Modified-Since': http_date(0)}).status_code == 200
+
+
+def test_if_range(client, static_dir):
+    etag, last_modified = validators(client)
+    assert get(client, Range='bytes=0-9', **{'If-Range': etag}).status_code == 206
+    assert get(client, Range='bytes=0-9', **{'If-Range': last_modified}).status_code == 206
+    # A stale or weak validator gets the whole, current file
+    for stale in ('"stale"', 'W/' + etag, http_date(0)):
+        response = get(client, Range='bytes=0-9', **{'If-Range': stale})
+        assert response.status_code == 200
+        assert response.get_data() == BODY
+
+
+def test_changed_file_gets_new_validators(client, static_dir):
+    etag, _ = validators(client)
+    path = static_dir / 'css' / 'site.css'
+    path.write_bytes(BODY[::-1])
+    os.utime(path, ns=(0, 10 ** 18))
+    response = get(client, **{'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_data() == BODY[::-1]
+
+
+def test_uploads_are_immutable(client):
+    response = get(client, '/static/images/uploads/ab/abc.png')
+    assert response.headers['Cache-Control'] == IMMUTABLE_CACHE_CONTROL
+
+
+@pytest.mark.parametrize('path, method', [
+    ('/static/css/missing.css', 'GET'),
+    ('/static/css', 'GET'),
+    ('/static/../conftest.py', 'GET'),
+    ('/static/css/site.css', 'POST'),
+    ('/other/css/site.css', 'GET'),
+])
+def test_everything_else_falls_through(client, path, method):
+    response = get(client, path, method=method)
+    assert response.status_code == 404
+    assert response.get_data() == b'from flask'
@@ -0,0 +1,76 @@
+import hashlib
+import io
+import os
+
+import pytest
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from backend import uploads
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 200
+GIF = b'GIF89a' + bytes(range(256)) * 4
+WEBP = b'RIFF\x00\x00\x00\x00WEBPVP8 ' + b'\x01' * 64
+
+
+class TrickleStream(io.BytesIO):
+    """A stream that hands out one byte per read, like a slow client"""
+
+    def read(self, size=-1):
+        return super().read(1)
+
+
+def stored_files(folder):
+    return sorted(os.path.relpath(os.path.join(root, name), folder)
+                  for root, _, names in os.walk(folder) for name in names)
+
+
+@pytest.mark.parametrize('data, ext', [(PNG, 'png'), (GIF, 'gif'), (WEBP, 'webp'), (b'\xff\xd8\xff\xe0' + PNG, 'jpg')])
+def test_stores_under_the_content_hash(tmp_path, data, ext):
+    stored = uploads.store_image(io.BytesIO(data), str(tmp_path), chunk_size=7)
+    digest = hashlib.sha256(data).hexdigest()
+    assert stored.filename == 'uploads/{}/{}.{}'.format(digest[:2], digest, ext)
+    assert (stored.digest, stored.size, stored.deduplicated) == (digest, len(data), False)
+    assert (tmp_path / stored.filename).read_bytes() == data
+
+
+def test_same_bytes_are_stored_once(tmp_path):
+    first = uploads.store_image(io.BytesIO(GIF), str(tmp_path))
+    second = uploads.store_image(TrickleStream(GIF), str(tmp_path))
+    other = uploads.store_image(io.BytesIO(GIF + b'!'), str(tmp_path))
+    assert second.filename == first.filename and second.deduplicated
+    assert other.filename != first.filename
+    assert stored_files(str(tmp_path)) == sorted([first.filename, other.filename])
+
+
+@pytest.mark.parametrize('data', [b'<svg xmlns="http://www.w3.org/2000/svg"/>', b'%PDF-1.7', b'GIF8'])
+def test_rejects_other_types_before_writing(tmp_path, data):
+    with pytest.raises(uploads.UnsupportedImage) as excinfo:
+        uploads.store_image(io.BytesIO(data), str(tmp_path))
+    assert excinfo.value.status == 415
+    assert stored_files(str(tmp_path)) == []
+
+
+def test_rejects_an_empty_upload(tmp_path):
+    with pytest.raises(uploads.UploadError) as excinfo:
+        uploads.store_image(io.BytesIO(b''), str(tmp_path))
+    assert excinfo.value.status == 400
+
+
+def test_too_large_leaves_no_temporary_file(tmp_path):
+    with pytest.raises(RequestEntityTooLarge):
+        uploads.store_image(io.BytesIO(GIF), str(tmp_path), chunk_size=64, max_bytes=len(GIF) - 1)
+    assert stored_files(str(tmp_path)) == []
+    uploads.store_image(io.BytesIO(GIF), str(tmp_path), chunk_size=64, max_bytes=len(GIF))
+
+
+def test_admin_upload_endpoint(app, client, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    client.post('/login', data={'email': 'admin@greenharvest.com', 'password': 'admin123'})
+    created = client.post('/admin/uploads/image', data=PNG, content_type='image/png')
+    again = client.post('/admin/uploads/image', data={'image': (io.BytesIO(PNG), 'copy.png')},
+                        content_type='multipart/form-data')
+    refused = client.post('/admin/uploads/image', data=b'<svg/>', content_type='image/svg+xml')
+    assert created.status_code == 201 and again.status_code == 200
+    assert again.get_json()['filename'] == created.get_json()['filename']
+    assert again.get_json()['deduplicated'] is True
+    assert refused.status_code == 415